@@ -129,8 +129,29 @@ const Contrib: React.FC<ContribProps> = ({ token, currentProject }) => {
         },
       });
 
+      // Training runs as a background job on the client, poll it until it finishes
+      const jobId = response.data.job_id;
+      let job = response.data;
+      setStatusMessage('Training job queued...');
+      while (job.status !== 'succeeded' && job.status !== 'failed') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        job = (await axios.get(`http://localhost:4000/jobs/${jobId}`)).data;
+        const lastEpoch = job.epochs.length ? job.epochs[job.epochs.length - 1] : null;
+        if (job.stage === 'uploading' && job.upload) {
+          setStatusMessage(`Uploading... ${Math.round((100 * job.upload.bytes) / job.upload.total)}%`);
+        } else if (lastEpoch) {
+          setStatusMessage(`Training... epoch ${lastEpoch.epoch}/${epochs}, accuracy ${(lastEpoch.accuracy * 100).toFixed(2)}%`);
+        } else {
+          setStatusMessage(`Job ${job.status}: ${job.stage}`);
+        }
+      }
+
+      if (job.status === 'failed') {
+        throw new Error(job.error);
+      }
+
       setStatusMessage('Contribution successful!');
-      console.log('Response:', response.data);
+      console.log('Response:', job.result);
       setFile(null);
       setEpochs(1);
     } catch (error: any) {
@@ -4,15 +4,123 @@ const Contribution = require('../models/Contribution')
 const fs = require('fs');
 const path = require('path');
 const { exec } = require('child_process');
+const net = require('net');
+const crypto = require('crypto');
 const AdmZip = require('adm-zip');
 
 const mongoose = require('mongoose')
 const formidable = require('formidable');
 
+const AGGREGATOR_SOCKET = process.env.AGGREGATOR_SOCKET || path.join(__dirname, '..', 'py', 'aggregator.sock');
+
+// Timing spans of the Python scripts go to a log file instead of stderr, which is kept for real errors
+const PYTHON_ENV = {
+    ...process.env,
+    FEDLEARN_SPAN_LOG: process.env.FEDLEARN_SPAN_LOG || path.join(__dirname, '..', 'py', 'spans.log')
+};
+
+// Exit status of contribution.py when a compressed update's base version is no longer kept
+const EXIT_FULL_UPLOAD_REQUIRED = 3;
+
+// Exit status of contribution.py when the upload is corrupt, does not match its hash or does not fit the model
+const EXIT_CONTRIBUTION_REJECTED = 4;
+
+// Sends a job to the warm aggregation daemon (py/aggregator.py). Falls back to
+// spawning contribution.py when the daemon is not running.
+const runContribution = (username, projectName, sha1Hash, info, callback) => {
+    const fallback = () => {
+        const projectDir = path.join(__dirname, '..', 'py');
+        const venvActivate = path.join(projectDir, '.venv', 'bin', 'activate');
+        const scriptPath = path.join(projectDir, 'contribution.py');
+        let command = `cd ${projectDir} && source ${venvActivate} && python ${scriptPath} ${username} ${projectName} ${sha1Hash}`;
+        if (info.num_samples !== undefined) {
+            command += ` --num-samples ${info.num_samples}`;
+        }
+        if (info.base_version !== undefined) {
+            command += ` --base-version ${info.base_version}`;
+        }
+        if (info.contributor !== undefined) {
+            command += ` --contributor ${info.contributor}`;
+        }
+
+        exec(command, { env: PYTHON_ENV }, (error, stdout, stderr) => {
+            if (error && error.code === EXIT_FULL_UPLOAD_REQUIRED) {
+                error.fullUploadRequired = true;
+            }
+            if (error && error.code === EXIT_CONTRIBUTION_REJECTED) {
+                error.rejected = true;
+            }
+            callback(error, stdout, stderr);
+        });
+    };
+
+    if (!fs.existsSync(AGGREGATOR_SOCKET)) {
+        return fallback();
+    }
+
+    let connected = false;
+    let finished = false;
+    let buffer = '';
+    const finish = (...args) => {
+        if (!finished) {
+            finished = true;
+            callback(...args);
+        }
+    };
+    // A reply that cannot be read is handed to contribution.py, which skips an already registered contribution
+    const fallbackOnce = (reason) => {
+        if (!finished) {
+            finished = true;
+            console.error(`Aggregator ${reason}, running contribution.py`);
+            fallback();
+        }
+    };
+
+    const socket = net.createConnection(AGGREGATOR_SOCKET, () => {
+        connected = true;
+        socket.write(JSON.stringify({ username, projectname: projectName, hash: sha1Hash, ...info }) + '\n');
+    });
+
+    socket.on('data', (data) => {
+        buffer += data.toString();
+        const newline = buffer.indexOf('\n');
+        if (newline === -1) {
+            return;
+        }
+        socket.end();
+
+        let result;
+        try {
+            result = JSON.parse(buffer.slice(0, newline));
+        } catch (err) {
+            return fallbackOnce(`sent an unreadable reply (${err.message})`);
+        }
+        console.log(`Aggregator job finished in ${result.latency_ms} ms (queued ${result.queue_ms} ms)`);
+        if (result.status !== 'ok') {
+            const error = new Error(result.error);
+            error.fullUploadRequired = Boolean(result.full_upload_required);
+            error.rejected = Boolean(result.rejected);
+            return finish(error, buffer, '');
+        }
+        finish(null, buffer, '');
+    });
+
+    socket.on('close', () => {
+        fallbackOnce('closed the connection before replying');
+    });
+
+    socket.on('error', (err) => {
+        if (connected) {
+            return finish(err, buffer, '');
+        }
+        fallbackOnce(`unavailable (${err.message})`);
+    });
+};
+
 
 
 const createProject = async (req, res) => {
-    const { name, description, isPrivate, activation_function, dropout_rate, combining_method, input_shape, num_layers, units_per_layer, num_classes } = req.body;
+    const { name, description, isPrivate, activation_function, dropout_rate, combining_method, input_shape, num_layers, units_per_layer, num_classes, weights_precision } = req.body;
     const owner = req.email;
 
     try {
@@ -37,7 +145,8 @@ const createProject = async (req, res) => {
             input_shape,
             num_layers,
             units_per_layer,
-            num_classes
+            num_classes,
+            weights_precision
         });
 
         // Create project folder structure
@@ -66,6 +175,7 @@ input_shape=${input_shape}
 num_layers=${num_layers}
 units_per_layer=${units_per_layer}
 num_classes=${num_classes}
+weights_precision=${newProject.weights_precision}
         `;
         fs.writeFileSync(path.join(pyFolderPath, 'config.txt'), configContent.trim());
 
@@ -74,7 +184,7 @@ num_classes=${num_classes}
         const initScriptPath = path.join(__dirname, '..', 'py', 'init.py');
         const command = `cd ${path.join(__dirname, '..', 'py')} && source ${venvActivatePath} && python ${initScriptPath} ${user.username} ${name}`;
 
-        exec(command, async (error, stdout, stderr) => {
+        exec(command, { env: PYTHON_ENV }, async (error, stdout, stderr) => {
             if (error) {
                 console.error(`Error executing Python script: ${error.message}`);
                 return res.status(500).json({ message: 'Error executing Python script', error: error.message });
@@ -282,6 +392,97 @@ const uploadTestFile = async (req, res) => {
         res.status(400).json({ message: 'Error uploading test file', error });
     }
 };
+// Returns the manifest of a project's prebuilt model bundle with its absolute path, or null if there is none
+const readModelBundle = (projectFolderPath) => {
+    try {
+        const manifest = JSON.parse(fs.readFileSync(path.join(projectFolderPath, 'model_bundle.json'), 'utf8'));
+        const bundlePath = path.join(projectFolderPath, manifest.bundle);
+        if (!bundlePath.startsWith(projectFolderPath + path.sep) || !fs.existsSync(bundlePath)) {
+            return null;
+        }
+        return { ...manifest, path: bundlePath };
+    } catch (error) {
+        return null;
+    }
+};
+
+const matchesETag = (ifNoneMatch, etag) => {
+    if (!ifNoneMatch) {
+        return false;
+    }
+    return ifNoneMatch.split(',').some(tag => {
+        const value = tag.trim();
+        return value === '*' || value.replace(/^W\//, '') === etag;
+    });
+};
+
+// Responds with an error and returns null unless the user may read the project, returns its py folder otherwise
+const findReadableProjectFolder = async (req, res) => {
+    const { projectName } = req.params;
+    const project = await Project.findOne({ name: projectName }).populate('owner').populate('collaborators');
+    if (!project) {
+        res.status(404).json({ message: 'Project not found.' });
+        return null;
+    }
+
+    const user = await User.findOne({ email: req.email });
+    if (!user) {
+        res.status(404).json({ message: 'User not found.' });
+        return null;
+    }
+
+    const isOwner = project.owner.equals(user._id);
+    const isCollaborator = project.collaborators.some(collaborator => collaborator.equals(user._id));
+    if (!isOwner && !isCollaborator && project.isPrivate) {
+        res.status(403).json({ message: 'Access denied.' });
+        return null;
+    }
+    return path.join(__dirname, '..', 'py', 'users', project.owner.username, projectName);
+};
+
+// Per-tensor hashes of the global weights, clients fetch only the tensors that changed
+const getWeightsManifest = async (req, res) => {
+    try {
+        const projectFolderPath = await findReadableProjectFolder(req, res);
+        if (!projectFolderPath) {
+            return;
+        }
+        const manifestPath = path.join(projectFolderPath, 'weights_manifest.json');
+        if (!fs.existsSync(manifestPath)) {
+            return res.status(404).json({ message: 'Weights manifest not found.' });
+        }
+        res.set('Cache-Control', 'no-cache');
+        return res.sendFile(manifestPath);
+    } catch (error) {
+        res.status(400).json({ message: 'Error retrieving weights manifest', error });
+    }
+};
+
+// Compressed tensors and patches are named by their content hashes and never change
+const getWeightsBlob = async (req, res) => {
+    const { kind, blob } = req.params;
+    const validBlob = kind === 'tensors' ? /^[0-9a-f]{64}\.gz$/ : /^[0-9a-f]{64}-[0-9a-f]{64}\.gz$/;
+    if (!['tensors', 'patches'].includes(kind) || !validBlob.test(blob)) {
+        return res.status(400).json({ message: 'Invalid blob name.' });
+    }
+
+    try {
+        const projectFolderPath = await findReadableProjectFolder(req, res);
+        if (!projectFolderPath) {
+            return;
+        }
+        const blobPath = path.join(projectFolderPath, kind, blob);
+        if (!fs.existsSync(blobPath)) {
+            return res.status(404).json({ message: 'Blob not found.' });
+        }
+        return res.sendFile(blobPath, {
+            headers: { 'Content-Type': 'application/octet-stream', 'Cache-Control': 'private, max-age=31536000, immutable' }
+        });
+    } catch (error) {
+        res.status(400).json({ message: 'Error retrieving blob', error });
+    }
+};
+
 const getModel = async (req, res) => {
     const { projectName } = req.params;
     const userEmail = req.email;
@@ -314,6 +515,30 @@ const getModel = async (req, res) => {
             return res.status(404).json({ message: 'Model files not found.' });
         }
 
+        // Aggregation prebuilds the bundle of every version, unchanged models cost a 304
+        const bundle = readModelBundle(projectFolderPath);
+        if (bundle) {
+            const etag = `"${bundle.content_hash}"`;
+            res.set({ 'ETag': etag, 'Cache-Control': 'no-cache', 'X-Model-Version': String(bundle.version) });
+            if (matchesETag(req.get('If-None-Match'), etag)) {
+                return res.status(304).end();
+            }
+            return res.sendFile(bundle.path, {
+                etag: false,
+                lastModified: false,
+                headers: {
+                    'Content-Type': 'application/zip',
+                    'Content-Disposition': 'attachment; filename="model.zip"'
+                }
+            }, (err) => {
+                if (err && !res.headersSent) {
+                    console.error(`Error sending model bundle: ${err.message}`);
+                    res.status(500).json({ message: 'Error sending model bundle', error: err.message });
+                }
+            });
+        }
+
+        // Projects without a bundle yet get a zip built for this request
         const zip = new AdmZip();
         zip.addLocalFile(modelConfigPath);
         zip.addLocalFile(modelWeightsPath);
@@ -352,11 +577,23 @@ const testModel = async (req, res) => {
         }
         const username = user.username;
 
+        // ?fast=true estimates the accuracy from a sample, to within ci_width at the given confidence
+        const fast = req.query.fast === 'true' || req.query.fast === '1';
+        let fastArgs = '';
+        if (fast) {
+            const ciWidth = req.query.ci_width === undefined ? 0.02 : Number(req.query.ci_width);
+            const confidence = req.query.confidence === undefined ? 0.95 : Number(req.query.confidence);
+            if (!(ciWidth > 0 && ciWidth < 1) || !(confidence > 0 && confidence < 1)) {
+                return res.status(400).json({ message: 'ci_width and confidence must be numbers between 0 and 1.' });
+            }
+            fastArgs = ` --fast --ci-width ${ciWidth} --confidence ${confidence}`;
+        }
+
         const scriptPath = path.join(__dirname, '..', 'py', 'test.py');
         const venvActivatePath = path.join(__dirname, '..', 'py', '.venv', 'bin', 'activate');
-        const command = `cd ${path.join(__dirname, '..', 'py')} && source ${venvActivatePath} && python ${scriptPath} ${username} ${projectName}`;
+        const command = `cd ${path.join(__dirname, '..', 'py')} && source ${venvActivatePath} && python ${scriptPath} ${username} ${projectName}${fastArgs}`;
 
-        exec(command, async (error, stdout, stderr) => {
+        exec(command, { env: PYTHON_ENV }, async (error, stdout, stderr) => {
             if (error) {
                 console.error(`Error executing Python script: ${error.message}`);
                 return res.status(500).json({ message: 'Error executing Python script', error: error.message });
@@ -365,6 +602,16 @@ const testModel = async (req, res) => {
             console.log(`Python script output: ${stdout}`);
             console.error(`Python script error output: ${stderr}`);
 
+            // Estimates are only reported; the project's accuracy comes from full evaluations
+            if (fast) {
+                const estimatePath = path.join(__dirname, '..', 'py', 'users', username, projectName, 'accuracy_estimate.json');
+                if (!fs.existsSync(estimatePath)) {
+                    return res.status(404).json({ message: 'Accuracy estimate not found.' });
+                }
+                const estimate = JSON.parse(fs.readFileSync(estimatePath, 'utf8'));
+                return res.status(200).json({ message: 'Model accuracy estimated.', estimate });
+            }
+
             const accuracyFilePath = path.join(__dirname, '..', 'py', 'users', username, projectName, 'accuracy.txt');
             if (!fs.existsSync(accuracyFilePath)) {
                 return res.status(404).json({ message: 'Accuracy file not found.' });
@@ -386,30 +633,153 @@ const testModel = async (req, res) => {
 };
 
 
-const contribute = async (req, res) => {
-    const { projectName } = req.params;
-    const contributorEmail = req.email;
+// Finds the project and checks that the user may contribute to it.
+// Returns { project, contributor } or { status, message } on failure.
+const findContributionTarget = async (projectName, contributorEmail) => {
+    // Find project and populate owner details
+    const project = await Project.findOne({ name: projectName }).populate('owner');
+    if (!project) {
+        return { status: 404, message: 'Project not found.' };
+    }
 
-    try {
-        // Find project and populate owner details
-        const project = await Project.findOne({ name: projectName }).populate('owner');
-        if (!project) {
-            return res.status(404).json({ message: 'Project not found.' });
+    // Find contributor
+    const contributor = await User.findOne({ email: contributorEmail });
+    if (!contributor) {
+        return { status: 404, message: 'Contributor not found.' };
+    }
+
+    // Check if user is owner or collaborator
+    const isOwner = project.owner._id.equals(contributor._id);
+    const isCollaborator = project.collaborators.some(collab => collab.equals(contributor._id));
+
+    if (!isOwner && !isCollaborator) {
+        return { status: 403, message: 'Not authorized to contribute to this project.' };
+    }
+
+    return { project, contributor };
+};
+
+const getProjectPyPath = (project, ...parts) => path.join(
+    __dirname,
+    '..',
+    'py',
+    'users',
+    project.owner.username,
+    project.name,
+    ...parts
+);
+
+// Aggregates a contribution whose file is already in the contrib directory and records it.
+// onResult, if given, is called with the status and body of the response before it is sent.
+const processContribution = (res, project, contributor, sha1Hash, fields, onResult) => {
+    const respond = (status, body) => {
+        if (onResult) {
+            onResult(status, body);
         }
+        res.status(status).json(body);
+    };
+
+    if (fields.encoding === 'update') {
+        console.log(`Received compressed update ${sha1Hash}: ratio ${fields.compression_ratio}, relative error ${fields.reconstruction_error}`);
+    }
+
+    // Sample count and base version weight the contribution in buffered aggregation
+    const info = { contributor: contributor.username };
+    const numSamples = parseInt(fields.num_samples, 10);
+    const baseVersion = parseInt(fields.base_version, 10);
+    if (!isNaN(numSamples)) {
+        info.num_samples = numSamples;
+    }
+    if (!isNaN(baseVersion)) {
+        info.base_version = baseVersion;
+    }
 
-        // Find contributor
-        const contributor = await User.findOne({ email: contributorEmail });
-        if (!contributor) {
-            return res.status(404).json({ message: 'Contributor not found.' });
+    // Run contribution through the aggregator
+    const username = project.owner.username;
+
+    runContribution(username, project.name, sha1Hash, info, async (error, stdout, stderr) => {
+        if (error && error.fullUploadRequired) {
+            // The update was computed from a version that is no longer kept, the client resends its full weights
+            return respond(409, {
+                message: 'Compressed update rejected, upload the full weights.',
+                error: error.message,
+                full_upload_required: true
+            });
+        }
+        if (error && error.rejected) {
+            // Nothing was aggregated and the upload was deleted, so no contribution is recorded
+            return respond(422, {
+                message: 'Contribution rejected',
+                error: error.message,
+                stdout: stdout
+            });
+        }
+        if (error) {
+            console.error(`Error executing Python script: ${error.message}`);
+            return respond(500, { 
+                message: 'Error executing Python script', 
+                error: error.message,
+                stdout: stdout,
+                stderr: stderr
+            });
         }
 
-        // Check if user is owner or collaborator
-        const isOwner = project.owner._id.equals(contributor._id);
-        const isCollaborator = project.collaborators.some(collab => collab.equals(contributor._id));
-        
-        if (!isOwner && !isCollaborator) {
-            return res.status(403).json({ message: 'Not authorized to contribute to this project.' });
+        console.log(`Python script output: ${stdout}`);
+        console.error(`Python script error output: ${stderr}`);
+
+        try {
+            // Create new contribution record
+            const newContribution = new Contribution({
+                project: project._id,
+                user: contributor._id,
+                hash: sha1Hash
+            });
+
+            await newContribution.save();
+
+            // Update project's contributions array
+            await Project.findByIdAndUpdate(
+                project._id,
+                { $push: { contributions: newContribution._id } }
+            );
+
+            respond(200, { 
+                message: 'Contribution processed successfully',
+                contributionId: newContribution._id
+            });
+        } catch (dbError) {
+            console.error('Database error:', dbError);
+            respond(500, { 
+                message: 'Error saving contribution record', 
+                error: dbError.message 
+            });
         }
+    });
+};
+
+// Contributions are content-addressed, the same weights are only aggregated once
+const respondIfDuplicate = async (res, project, sha1Hash) => {
+    const existingContribution = await Contribution.findOne({ project: project._id, hash: sha1Hash });
+    if (!existingContribution) {
+        return false;
+    }
+    res.status(200).json({
+        message: 'Duplicate contribution ignored',
+        contributionId: existingContribution._id
+    });
+    return true;
+};
+
+const contribute = async (req, res) => {
+    const { projectName } = req.params;
+    const contributorEmail = req.email;
+
+    try {
+        const target = await findContributionTarget(projectName, contributorEmail);
+        if (target.status) {
+            return res.status(target.status).json({ message: target.message });
+        }
+        const { project, contributor } = target;
 
         // Verify file upload
         if (!req.files || !req.files.file) {
@@ -423,81 +793,226 @@ const contribute = async (req, res) => {
             return res.status(400).json({ message: 'SHA1 hash is required.' });
         }
 
+        if (await respondIfDuplicate(res, project, sha1Hash)) {
+            return;
+        }
+
         // Setup directories
-        const contribPath = path.join(
-            __dirname, 
-            '..', 
-            'py',
-            'users',
-            project.owner.username,
-            project.name,
-            'contrib'
-        );
+        const contribPath = getProjectPyPath(project, 'contrib');
 
         // Create directories if they don't exist
         fs.mkdirSync(contribPath, { recursive: true });
 
-        // Save the model file
-        const modelFilePath = path.join(contribPath, `${sha1Hash}.weights.h5`);
+        // Save the model file. Compressed updates are decoded by contribution.py
+        const isUpdate = req.body.encoding === 'update';
+        const modelFilePath = path.join(contribPath, isUpdate ? `${sha1Hash}.update.h5` : `${sha1Hash}.weights.h5`);
         await modelFile.mv(modelFilePath);
 
-        // Run contribution script
-        const projectDir = path.join(__dirname, '..', 'py');
-        const venvActivate = path.join(projectDir, '.venv', 'bin', 'activate');
-        const scriptPath = path.join(projectDir, 'contribution.py');
-        const username = project.owner.username;
+        processContribution(res, project, contributor, sha1Hash, req.body);
 
-        const command = `cd ${projectDir} && source ${venvActivate} && python ${scriptPath} ${username} ${projectName} ${sha1Hash}`;
+    } catch (error) {
+        console.error('Server error:', error);
+        res.status(500).json({ 
+            message: 'Server error', 
+            error: error.message 
+        });
+    }
+};
 
-        exec(command, async (error, stdout, stderr) => {
-            if (error) {
-                console.error(`Error executing Python script: ${error.message}`);
-                return res.status(500).json({ 
-                    message: 'Error executing Python script', 
-                    error: error.message,
-                    stdout: stdout,
-                    stderr: stderr
-                });
+// Resumable chunked uploads. A session is keyed by the contribution hash, so a
+// client that lost its connection resumes from the bytes already received.
+const UPLOAD_FIELDS = ['num_samples', 'base_version', 'encoding', 'compression_ratio', 'reconstruction_error'];
+
+const getUploadPaths = (project, uploadId) => {
+    const uploadsPath = getProjectPyPath(project, 'uploads');
+    return {
+        uploadsPath,
+        partPath: path.join(uploadsPath, `${uploadId}.part`),
+        metaPath: path.join(uploadsPath, `${uploadId}.json`),
+        resultPath: path.join(uploadsPath, `${uploadId}.result.json`)
+    };
+};
+
+// The response of a completed upload is kept, so a client whose complete
+// request timed out gets the same answer again instead of a 404.
+const readUploadResult = (project, uploadId) => {
+    if (!/^[0-9a-f]{40}(-update)?$/.test(uploadId)) {
+        return null;
+    }
+    const { resultPath } = getUploadPaths(project, uploadId);
+    if (!fs.existsSync(resultPath)) {
+        return null;
+    }
+    return JSON.parse(fs.readFileSync(resultPath, 'utf8'));
+};
+
+const writeUploadResult = (project, uploadId, result) => {
+    const { resultPath } = getUploadPaths(project, uploadId);
+    fs.writeFileSync(`${resultPath}.tmp`, JSON.stringify(result));
+    fs.renameSync(`${resultPath}.tmp`, resultPath);
+};
+
+const readUploadSession = (project, uploadId) => {
+    if (!/^[0-9a-f]{40}(-update)?$/.test(uploadId)) {
+        return null;
+    }
+    const { partPath, metaPath } = getUploadPaths(project, uploadId);
+    if (!fs.existsSync(metaPath) || !fs.existsSync(partPath)) {
+        return null;
+    }
+    const meta = JSON.parse(fs.readFileSync(metaPath, 'utf8'));
+    meta.received = fs.statSync(partPath).size;
+    return meta;
+};
+
+const startUpload = async (req, res) => {
+    const { projectName } = req.params;
+
+    try {
+        const target = await findContributionTarget(projectName, req.email);
+        if (target.status) {
+            return res.status(target.status).json({ message: target.message });
+        }
+        const { project } = target;
+
+        const { sha1, size, chunk_size } = req.body;
+        if (!/^[0-9a-f]{40}$/.test(sha1 || '') || !Number.isInteger(size) || size <= 0) {
+            return res.status(400).json({ message: 'A valid sha1 and size are required.' });
+        }
+
+        const uploadId = req.body.encoding === 'update' ? `${sha1}-update` : sha1;
+        const stored = readUploadResult(project, uploadId);
+        if (stored && stored.size === size) {
+            // Already completed, the client only has to ask for the result
+            return res.status(200).json({ upload_id: uploadId, received: size });
+        }
+        let meta = readUploadSession(project, uploadId);
+        if (!meta || meta.size !== size) {
+            const { uploadsPath, partPath, metaPath, resultPath } = getUploadPaths(project, uploadId);
+            if (fs.existsSync(resultPath)) {
+                fs.unlinkSync(resultPath);
             }
+            fs.mkdirSync(uploadsPath, { recursive: true });
+            const fields = {};
+            UPLOAD_FIELDS.filter((field) => req.body[field] !== undefined).forEach((field) => {
+                fields[field] = req.body[field];
+            });
+            fs.writeFileSync(partPath, '');
+            fs.writeFileSync(metaPath, JSON.stringify({ sha1, size, chunk_size, fields }));
+            meta = readUploadSession(project, uploadId);
+        }
 
-            console.log(`Python script output: ${stdout}`);
-            console.error(`Python script error output: ${stderr}`);
+        res.status(200).json({ upload_id: uploadId, received: meta.received });
+    } catch (error) {
+        console.error('Server error:', error);
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+};
 
-            try {
-                // Create new contribution record
-                const newContribution = new Contribution({
-                    project: project._id,
-                    user: contributor._id,
-                    hash: sha1Hash
-                });
-
-                await newContribution.save();
-
-                // Update project's contributions array
-                await Project.findByIdAndUpdate(
-                    project._id,
-                    { $push: { contributions: newContribution._id } }
-                );
-
-                res.status(200).json({ 
-                    message: 'Contribution processed successfully',
-                    contributionId: newContribution._id
-                });
-            } catch (dbError) {
-                console.error('Database error:', dbError);
-                res.status(500).json({ 
-                    message: 'Error saving contribution record', 
-                    error: dbError.message 
-                });
+const getUploadStatus = async (req, res) => {
+    const { projectName, uploadId } = req.params;
+
+    try {
+        const target = await findContributionTarget(projectName, req.email);
+        if (target.status) {
+            return res.status(target.status).json({ message: target.message });
+        }
+
+        const meta = readUploadSession(target.project, uploadId);
+        if (!meta) {
+            return res.status(404).json({ message: 'Upload not found.' });
+        }
+        res.status(200).json({ received: meta.received, size: meta.size });
+    } catch (error) {
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+};
+
+const putUploadChunk = async (req, res) => {
+    const { projectName, uploadId } = req.params;
+
+    try {
+        const target = await findContributionTarget(projectName, req.email);
+        if (target.status) {
+            return res.status(target.status).json({ message: target.message });
+        }
+
+        const meta = readUploadSession(target.project, uploadId);
+        if (!meta) {
+            return res.status(404).json({ message: 'Upload not found.' });
+        }
+
+        const chunk = Buffer.isBuffer(req.body) ? req.body : Buffer.alloc(0);
+        const offset = parseInt(req.headers['x-chunk-offset'], 10);
+        const checksum = crypto.createHash('sha1').update(chunk).digest('hex');
+        if (checksum !== req.headers['x-chunk-sha1']) {
+            return res.status(400).json({ message: 'Chunk checksum mismatch.', received: meta.received });
+        }
+        if (offset !== meta.received || offset + chunk.length > meta.size) {
+            return res.status(409).json({ received: meta.received });
+        }
+
+        fs.appendFileSync(getUploadPaths(target.project, uploadId).partPath, chunk);
+        res.status(200).json({ received: offset + chunk.length });
+    } catch (error) {
+        res.status(500).json({ message: 'Server error', error: error.message });
+    }
+};
+
+const completeUpload = async (req, res) => {
+    const { projectName, uploadId } = req.params;
+
+    try {
+        const target = await findContributionTarget(projectName, req.email);
+        if (target.status) {
+            return res.status(target.status).json({ message: target.message });
+        }
+        const { project, contributor } = target;
+
+        // Completing twice returns the stored result, or 202 while the first request is still aggregating
+        const stored = readUploadResult(project, uploadId);
+        if (stored) {
+            return res.status(stored.status).json(stored.body);
+        }
+
+        const meta = readUploadSession(project, uploadId);
+        if (!meta) {
+            if (/^[0-9a-f]{40}(-update)?$/.test(uploadId) && await respondIfDuplicate(res, project, uploadId.slice(0, 40))) {
+                return;
             }
-        });
+            return res.status(404).json({ message: 'Upload not found.' });
+        }
+        if (meta.received !== meta.size) {
+            return res.status(409).json({ message: 'Upload is incomplete.', received: meta.received });
+        }
 
+        const { partPath, metaPath } = getUploadPaths(project, uploadId);
+        const isUpdate = meta.fields.encoding === 'update';
+        if (!isUpdate) {
+            const sha1 = crypto.createHash('sha1').update(fs.readFileSync(partPath)).digest('hex');
+            if (sha1 !== meta.sha1) {
+                return res.status(400).json({ message: 'Uploaded file does not match its SHA1 hash.' });
+            }
+        }
+
+        if (await respondIfDuplicate(res, project, meta.sha1)) {
+            fs.unlinkSync(partPath);
+            fs.unlinkSync(metaPath);
+            return;
+        }
+
+        const storeResult = (status, body) => writeUploadResult(project, uploadId, { size: meta.size, status, body });
+        storeResult(202, { message: 'Upload is still being processed.' });
+
+        const contribPath = getProjectPyPath(project, 'contrib');
+        fs.mkdirSync(contribPath, { recursive: true });
+        fs.renameSync(partPath, path.join(contribPath, isUpdate ? `${meta.sha1}.update.h5` : `${meta.sha1}.weights.h5`));
+        fs.unlinkSync(metaPath);
+
+        processContribution(res, project, contributor, meta.sha1, meta.fields, storeResult);
     } catch (error) {
         console.error('Server error:', error);
-        res.status(500).json({ 
-            message: 'Server error', 
-            error: error.message 
-        });
+        res.status(500).json({ message: 'Server error', error: error.message });
     }
 };
 
@@ -563,7 +1078,13 @@ module.exports = {
     addCollaborator,
     uploadTestFile,
     getModel,
+    getWeightsManifest,
+    getWeightsBlob,
     testModel,
     contribute,
+    startUpload,
+    getUploadStatus,
+    putUploadChunk,
+    completeUpload,
     getJson
 };
\ No newline at end of file
@@ -18,7 +18,9 @@ const ProjectSchema = new mongoose.Schema({
   input_shape: { type: String, required: true },
   num_layers: { type: Number, required: true },
   units_per_layer: { type: Number, required: true },
-  num_classes: { type: Number, required: true }
+  num_classes: { type: Number, required: true },
+  // Storage and transfer precision of the global weights, aggregation always runs in float32
+  weights_precision: { type: String, enum: ['float32', 'float16', 'bfloat16'], default: 'float32' }
 });
 
 
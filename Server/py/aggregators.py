@@ -0,0 +1,190 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+
+from weights_h5 import check_compatible, is_aggregatable, list_weight_datasets
+
+# combining_method values of the project configuration and the aggregator they select
+METHOD_ALIASES = {
+    "average": "mean",
+    "avg": "mean",
+    "fedavg": "mean",
+    "mean": "mean",
+    "weighted_mean": "mean",
+    "median": "median",
+    "coordinate_median": "median",
+    "trimmed_mean": "trimmed_mean",
+    "trimmed": "trimmed_mean",
+    "krum": "krum",
+    "multi_krum": "multi_krum",
+    "multikrum": "multi_krum",
+}
+
+
+def resolve_method(combining_method):
+    """
+    Maps a project's combining_method to an aggregator name.
+
+    Unknown methods fall back to the weighted mean, since combining_method
+    used to be free text that was never read.
+
+    Returns:
+        str: One of 'mean', 'median', 'trimmed_mean', 'krum' or 'multi_krum'.
+    """
+    key = (combining_method or "average").strip().lower().replace("-", "_").replace(" ", "_")
+    if key not in METHOD_ALIASES:
+        print(f"Unknown combining method '{combining_method}'. Using the weighted mean.")
+        return "mean"
+    return METHOD_ALIASES[key]
+
+
+def weighted_mean(stacked, weights):
+    """
+    Averages the rows of a (contributions x parameters) array.
+
+    Args:
+        stacked (np.ndarray): One flattened tensor per contribution.
+        weights (np.ndarray): Weight of each contribution, summing to 1.
+    """
+    return weights.astype(np.float32) @ stacked
+
+
+def coordinate_median(stacked):
+    """Coordinate-wise median of the rows, selected with np.partition instead of a full sort."""
+    n = stacked.shape[0]
+    middle = n // 2
+    if n % 2:
+        return np.partition(stacked, middle, axis=0)[middle]
+    partitioned = np.partition(stacked, [middle - 1, middle], axis=0)
+    return (partitioned[middle - 1] + partitioned[middle]) / 2.0
+
+
+def trimmed_mean(stacked, trim_ratio):
+    """
+    Coordinate-wise mean after dropping the trim_ratio largest and smallest values.
+
+    After partitioning at the two cut points every row in between holds a kept
+    value, so the mean needs no sort.
+    """
+    n = stacked.shape[0]
+    trim = min(int(trim_ratio * n), (n - 1) // 2)
+    if trim == 0:
+        return stacked.mean(axis=0)
+    partitioned = np.partition(stacked, [trim, n - trim - 1], axis=0)
+    return partitioned[trim:n - trim].mean(axis=0)
+
+
+def krum_scores(squared_distances, num_byzantine):
+    """
+    Scores each contribution by the summed squared distance to its n - f - 2 nearest neighbours.
+
+    Args:
+        squared_distances (np.ndarray): (n x n) pairwise squared distances.
+        num_byzantine (int): Number of contributions assumed to be malicious (f).
+
+    Returns:
+        np.ndarray: Score per contribution, lower is more central.
+    """
+    n = squared_distances.shape[0]
+    if n < 2:
+        return np.zeros(n)
+    neighbours = min(max(n - num_byzantine - 2, 1), n - 1)
+    distances = squared_distances.copy()
+    np.fill_diagonal(distances, np.inf)
+    return np.partition(distances, neighbours - 1, axis=1)[:, :neighbours].sum(axis=1)
+
+
+def krum_select(squared_distances, num_byzantine, num_selected=1):
+    """Returns the indices of the num_selected contributions with the lowest Krum scores."""
+    scores = krum_scores(squared_distances, num_byzantine)
+    num_selected = min(max(num_selected, 1), len(scores))
+    return np.sort(np.argpartition(scores, num_selected - 1)[:num_selected])
+
+
+def pairwise_squared_distances(gram, squared_norms):
+    """Squared Euclidean distances from a Gram matrix, clipped at 0 against rounding."""
+    return np.maximum(squared_norms[:, None] + squared_norms[None, :] - 2.0 * gram, 0.0)
+
+
+def robust_combine_files(global_path, contribution_paths, global_coefficient, coefficients, method,
+                         output_path, trim_ratio=0.1, num_byzantine=1, num_selected=0):
+    """
+    Aggregates contributions with the selected aggregator and mixes the result into the global weights.
+
+    Each tensor is stacked into a (contributions x parameters) array and
+    reduced in one vectorized call. Krum needs distances over the whole model,
+    so it first accumulates the Gram matrix of the contributions tensor by
+    tensor, selects, and then averages the selected ones in a second pass.
+
+    The result is global_coefficient * global + (1 - global_coefficient) * robust,
+    so staleness and the server learning rate still scale how far the global
+    model moves, while the robust estimate replaces the weighted sum. The mean
+    uses the contribution coefficients as weights; the other aggregators ignore
+    them, since sample counts are reported by the clients they guard against.
+
+    Args:
+        global_path (str): Current global weights.
+        contribution_paths (list): Weights files of the contributions.
+        global_coefficient (float): Weight of the current global model.
+        coefficients (list): Coefficient of each contribution.
+        method (str): Output of resolve_method.
+        output_path (str): Path of the weights file to write. May be global_path.
+        trim_ratio (float): Fraction trimmed from each end by the trimmed mean.
+        num_byzantine (int): Number of malicious contributions Krum tolerates.
+        num_selected (int): Contributions averaged by multi-Krum. 0 selects n - f.
+
+    Returns:
+        list: Indices of the contributions that were used.
+    """
+    datasets = list_weight_datasets(global_path)
+    for path in contribution_paths:
+        check_compatible(datasets, path)
+
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    total = coefficients.sum()
+    weights = coefficients / total if total > 0 else np.full(len(coefficients), 1.0 / len(coefficients))
+
+    sources = [h5py.File(path, "r") for path in contribution_paths]
+    temp_path = f"{output_path}.tmp"
+    shutil.copyfile(global_path, temp_path)
+    try:
+        tensors = [(name, shape, dtype) for name, shape, dtype in datasets if is_aggregatable(dtype)]
+        selected = np.arange(len(sources))
+        if method in ("krum", "multi_krum"):
+            if method == "krum":
+                num_selected = 1
+            elif num_selected <= 0:
+                num_selected = len(sources) - num_byzantine
+            gram = np.zeros((len(sources), len(sources)), dtype=np.float64)
+            for name, shape, _ in tensors:
+                stacked = np.stack([source[name][()].reshape(-1) for source in sources]).astype(np.float64)
+                gram += stacked @ stacked.T
+            squared_distances = pairwise_squared_distances(gram, np.diag(gram).copy())
+            selected = krum_select(squared_distances, num_byzantine, num_selected)
+            print(f"Krum selected contributions {selected.tolist()} of {len(sources)}.")
+            weights = np.full(len(selected), 1.0 / len(selected))
+
+        with h5py.File(temp_path, "r+") as out:
+            for name, shape, dtype in tensors:
+                stacked = np.stack([sources[i][name][()].reshape(-1) for i in selected]).astype(np.float32)
+                if method == "median":
+                    robust = coordinate_median(stacked)
+                elif method == "trimmed_mean":
+                    robust = trimmed_mean(stacked, trim_ratio)
+                else:
+                    robust = weighted_mean(stacked, weights)
+                existing = out[name][()].astype(np.float32).reshape(-1)
+                combined = global_coefficient * existing + (1.0 - global_coefficient) * robust
+                out[name][...] = combined.reshape(shape).astype(dtype, copy=False)
+        for source in sources:
+            source.close()
+        sources = []
+        os.replace(temp_path, output_path)
+    finally:
+        for source in sources:
+            source.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return selected.tolist()
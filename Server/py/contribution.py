@@ -1,7 +1,270 @@
-import tensorflow as tf
 import argparse
-import os
+import contextlib
+import fcntl
 import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+import h5py
+import numpy as np
+
+from aggregators import resolve_method, robust_combine_files
+from contrib_store import ContributionStore
+from model_artifacts import dense_kernel_shapes, write_initial_weights
+from model_bundle import build_bundle
+from precision import check_precision, convert_weight_file
+from timing import span
+from weights_sync import build_weights_manifest
+from weights_h5 import check_compatible, list_weight_datasets, weighted_sum_files
+
+UPDATE_FORMAT = "fedlearn-update-v1"
+
+# Defaults for the project's config.txt. A buffer size of 1 and no window folds
+# every contribution in immediately, as (existing + new) / 2.
+AGGREGATION_DEFAULTS = {
+    "aggregation_buffer_size": "1",
+    "aggregation_window": "0",
+    "staleness_exponent": "0.5",
+    "server_learning_rate": "1.0",
+    "contrib_retention_count": "20",
+    "contrib_retention_days": "0",
+    "combining_method": "average",
+    "trim_ratio": "0.1",
+    "krum_byzantine": "1",
+    "krum_selected": "0",
+    "version_retention": "10",
+    "weights_precision": "float32",
+}
+
+# Exit status of contribution.py when the contribution could not be aggregated. The server
+# only records a contribution when the script exits with 0, like the daemon's "ok" status
+EXIT_FAILURE = 1
+
+# Exit status of contribution.py when a compressed update has to be uploaded again as full weights
+EXIT_FULL_UPLOAD_REQUIRED = 3
+
+# Exit status of contribution.py when the upload is corrupt, does not match its hash or does not fit the model
+EXIT_CONTRIBUTION_REJECTED = 4
+
+# Optimistic commits that lose the compare-and-swap this many times are redone under the lock
+MAX_COMMIT_ATTEMPTS = 5
+
+class FullUploadRequired(Exception):
+    """Raised when a compressed update cannot be decoded because its base version is no longer kept."""
+
+
+class ContributionRejected(Exception):
+    """Raised when an uploaded contribution cannot be aggregated because of its content."""
+
+
+def combine_weights(existing_weights, new_weights):
+    """
+    Averages two lists of weight arrays element-wise.
+
+    Args:
+        existing_weights (list): Weight arrays of the existing model.
+        new_weights (list): Weight arrays of the contributed model.
+
+    Returns:
+        list: The averaged weight arrays.
+    """
+    if len(existing_weights) != len(new_weights):
+        raise ValueError("The existing model and the new model have different number of layers/weights.")
+
+    return [(ew + nw) / 2.0 for ew, nw in zip(existing_weights, new_weights)]
+
+def get_project_paths(username, projectname):
+    """
+    Returns the paths used by a project on the server.
+
+    Args:
+        username (str): Owner of the project.
+        projectname (str): Name of the project.
+
+    Returns:
+        dict: Paths of the project, contrib directory, model config and global weights.
+    """
+    project_dir = os.path.join("users", username, projectname)
+    return {
+        "project_dir": project_dir,
+        "contrib_dir": os.path.join(project_dir, "contrib"),
+        "model_config_path": os.path.join(project_dir, "model_config.json"),
+        "model_weights_path": os.path.join(project_dir, "model.weights.h5"),
+        "config_path": os.path.join(project_dir, "config.txt"),
+        "version_path": os.path.join(project_dir, "version.txt"),
+        "versions_dir": os.path.join(project_dir, "versions"),
+        "buffer_path": os.path.join(project_dir, "buffer.json"),
+        "lock_path": os.path.join(project_dir, ".lock"),
+    }
+
+def read_project_config(config_path):
+    """
+    Reads a project's config.txt, falling back to the aggregation defaults.
+
+    Args:
+        config_path (str): Path to the config.txt copied into the project by init.py.
+
+    Returns:
+        dict: Configuration values as strings.
+    """
+    config_values = dict(AGGREGATION_DEFAULTS)
+    if os.path.exists(config_path):
+        with open(config_path, "r") as f:
+            config_values.update(line.strip().split("=", 1) for line in f if "=" in line)
+    warn_unbuffered_robust_method(config_values)
+    return config_values
+
+def warn_unbuffered_robust_method(config_values):
+    """
+    Warns when combining_method asks for a robust aggregator that immediate-mode aggregation cannot apply.
+
+    Robust aggregators need several contributions at once. Without a buffer
+    every contribution is folded in on its own as (existing + new) / 2, so the
+    method only takes effect in batch_aggregate.py.
+
+    Returns:
+        bool: True if the warning was printed.
+    """
+    method = resolve_method(config_values["combining_method"])
+    if method == "mean" or is_buffered(config_values):
+        return False
+    print(f"Warning: combining_method={config_values['combining_method']} is ignored for contributions aggregated "
+          f"one at a time, which are averaged with the global model. Set aggregation_buffer_size above 1 or an "
+          f"aggregation_window to apply {method} to each buffer.")
+    return True
+
+@contextlib.contextmanager
+def project_lock(paths):
+    """Holds an exclusive lock on the project while its buffer or global weights change."""
+    with open(paths["lock_path"], "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_model_version(paths):
+    """Returns the number of times the global weights have been updated."""
+    if not os.path.exists(paths["version_path"]):
+        return 0
+    with open(paths["version_path"], "r") as f:
+        return int(f.read().strip() or 0)
+
+def project_name(paths):
+    return os.path.basename(paths["project_dir"])
+
+def version_weights_path(paths, version):
+    return os.path.join(paths["versions_dir"], f"{version}.weights.h5")
+
+def latest_weights(paths):
+    """
+    Returns the latest global model version and an immutable weights file holding it.
+
+    Committed versions are never modified, so the file can be read without the
+    project lock. Before the first versioned commit this is model.weights.h5.
+
+    Returns:
+        tuple: (version, path to its weights)
+    """
+    version = get_model_version(paths)
+    path = version_weights_path(paths, version)
+    return version, path if os.path.exists(path) else paths["model_weights_path"]
+
+def staging_weights_path(paths):
+    """Returns a unique path to write candidate global weights to before they are committed."""
+    os.makedirs(paths["versions_dir"], exist_ok=True)
+    return os.path.join(paths["versions_dir"], f"staging-{os.getpid()}-{uuid.uuid4().hex}.weights.h5")
+
+def publish_weights(paths, config_values, version_path):
+    """
+    Atomically replaces model.weights.h5, the file clients download, with a committed version.
+
+    In float32 it is a hard link to the version. With a reduced weights_precision
+    it is a float16 or bfloat16 copy, while the versions stay float32 master
+    copies that aggregation accumulates into.
+    """
+    precision = check_precision(config_values["weights_precision"])
+    link_path = f"{paths['model_weights_path']}.tmp"
+    if os.path.exists(link_path):
+        os.remove(link_path)
+    if precision != "float32":
+        with span("convert", project=project_name(paths), precision=precision) as info:
+            info["bytes"] = convert_weight_file(version_path, link_path, precision)
+    else:
+        try:
+            os.link(version_path, link_path)
+        except OSError:
+            # File systems without hard links get a copy
+            shutil.copyfile(version_path, link_path)
+    os.replace(link_path, paths["model_weights_path"])
+
+def commit_weights(paths, config_values, staged_path, base_version):
+    """
+    Publishes staged weights as the next global model version, if the latest version is still base_version.
+
+    The staged file is renamed to versions/<version>.weights.h5, model.weights.h5
+    is atomically replaced by it (see publish_weights) and version.txt, the
+    latest pointer, is rewritten atomically. Readers therefore always see a complete
+    file. The download bundle and the per-tensor manifest clients sync from are
+    built, see model_bundle.py and weights_sync.py, and versions beyond
+    version_retention are deleted.
+
+    Must be called while holding the project lock.
+
+    Args:
+        paths (dict): Output of get_project_paths.
+        config_values (dict): Project configuration.
+        staged_path (str): Weights computed from version base_version.
+        base_version (int): Version the staged weights were computed from.
+
+    Returns:
+        int: The new version, or None if another aggregation committed first. The staged file is kept then.
+    """
+    if get_model_version(paths) != base_version:
+        return None
+
+    version = base_version + 1
+    version_path = version_weights_path(paths, version)
+    os.replace(staged_path, version_path)
+    publish_weights(paths, config_values, version_path)
+
+    temp_path = f"{paths['version_path']}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(f"{version}\n")
+    os.replace(temp_path, paths["version_path"])
+
+    # Downloads are served from a prebuilt bundle instead of zipping the model per request
+    with span("bundle", project=project_name(paths), version=version) as info:
+        info["bytes"] = build_bundle(paths["project_dir"], version)["bundle_bytes"]
+    with span("manifest", project=project_name(paths), version=version):
+        build_weights_manifest(paths["project_dir"], version)
+
+    keep = max(int(config_values["version_retention"]), 1)
+    for old_version in range(version - keep, -1, -1):
+        old_path = version_weights_path(paths, old_version)
+        if not os.path.exists(old_path):
+            break
+        os.remove(old_path)
+    return version
+
+def load_model_from_config(model_config_path):
+    """
+    Builds an uncompiled model from the project's JSON configuration.
+
+    Args:
+        model_config_path (str): Path to model_config.json.
+
+    Returns:
+        tf.keras.Model: The model with freshly initialized weights.
+    """
+    import tensorflow as tf
+
+    with open(model_config_path, 'r') as json_file:
+        model_json = json_file.read()
+    return tf.keras.models.model_from_json(model_json)
 
 def combine_model_with_existing(existing_model, new_model):
     """
@@ -14,27 +277,397 @@ def combine_model_with_existing(existing_model, new_model):
     Returns:
         tf.keras.Model: The combined model with averaged weights.
     """
-    combined_weights = []
-    existing_weights = existing_model.get_weights()
-    new_weights = new_model.get_weights()
-
-    if len(existing_weights) != len(new_weights):
-        raise ValueError("The existing model and the new model have different number of layers/weights.")
+    import tensorflow as tf
 
-    for ew, nw in zip(existing_weights, new_weights):
-        combined_weights.append((ew + nw) / 2.0)
+    combined_weights = combine_weights(existing_model.get_weights(), new_model.get_weights())
 
     combined_model = tf.keras.models.clone_model(existing_model)
     combined_model.set_weights(combined_weights)
     return combined_model
 
-def main(username, projectname, hash_value):
+def initialize_missing_weights(model_config_path, model_weights_path):
+    """
+    Saves randomly initialized weights for a project that has none yet.
+
+    Models made of the layers init.py creates are initialized with NumPy.
+    Anything else falls back to Keras, the only step of aggregation that
+    needs TensorFlow.
+
+    Args:
+        model_config_path (str): Path to model_config.json.
+        model_weights_path (str): Path to write the weights to.
+    """
+    with open(model_config_path, "r") as f:
+        model_config = json.load(f)
+    try:
+        dense_kernel_shapes(model_config)
+    except ValueError as e:
+        print(f"Initializing with Keras instead: {e}")
+    else:
+        with span("save_weights") as info:
+            write_initial_weights(model_config, model_weights_path)
+            info["bytes"] = os.path.getsize(model_weights_path)
+        return
+
+    with span("load_config", bytes=os.path.getsize(model_config_path)):
+        model = load_model_from_config(model_config_path)
+    # Keras needs the .weights.h5 suffix, the file is renamed into place so readers never see it half-written
+    temp_path = f"{model_weights_path[:-len('.weights.h5')]}.init-{os.getpid()}.weights.h5"
+    with span("save_weights") as info:
+        model.save_weights(temp_path)
+        os.replace(temp_path, model_weights_path)
+        info["bytes"] = os.path.getsize(model_weights_path)
+
+def decode_update(update_path, base_weights_path, output_path):
+    """
+    Reconstructs contributed weights from a compressed update uploaded by the client.
+
+    The update holds, per tensor, int8 values with one scale and optionally the
+    flat indices they belong to (top-k sparsification). Each tensor is decoded
+    and added to the base weights one at a time.
+
+    Args:
+        update_path (str): Path to the .update.h5 file.
+        base_weights_path (str): Global weights the update is applied to.
+        output_path (str): Path of the .weights.h5 file to write.
+    """
+    temp_path = f"{output_path}.tmp"
+    shutil.copyfile(base_weights_path, temp_path)
+    try:
+        with h5py.File(update_path, "r") as update, h5py.File(temp_path, "r+") as out:
+            if update.attrs.get("format") != UPDATE_FORMAT:
+                raise ValueError(f"{update_path} is not a compressed model update.")
+
+            names = []
+            update.visititems(lambda name, obj: names.append(name) if isinstance(obj, h5py.Group) and "values" in obj else None)
+            for name in names:
+                group = update[name]
+                dataset = out[name]
+                if tuple(group.attrs["shape"]) != dataset.shape:
+                    raise ValueError(f"Update for {name} has shape {tuple(group.attrs['shape'])}, expected {dataset.shape}.")
+
+                weights = dataset[()].astype(np.float32)
+                flat = weights.reshape(-1)
+                values = group["values"][()].astype(np.float32) * float(group.attrs["scale"])
+                if "indices" in group:
+                    flat[group["indices"][()]] += values
+                else:
+                    flat += values
+                dataset[...] = weights.astype(dataset.dtype)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def update_base_weights(paths, base_version):
+    """
+    Returns the weights file of the global model version a compressed update was computed from.
+
+    Older versions are read from versions/, which keeps the last
+    version_retention of them. Without a base version, the update is assumed
+    to be computed from the latest version.
+
+    Raises:
+        FullUploadRequired: If the base version is no longer kept, or was never committed.
+    """
+    version, weights_path = latest_weights(paths)
+    if base_version is None or int(base_version) == version:
+        return weights_path
+    weights_path = version_weights_path(paths, int(base_version))
+    if not os.path.exists(weights_path):
+        raise FullUploadRequired(
+            f"Version {base_version} of the global model the update was computed from is not available "
+            f"(latest is {version}). Upload the full weights instead."
+        )
+    return weights_path
+
+def resolve_contribution(paths, hash_value, base_version=None):
+    """
+    Returns the weights file of a contribution, decoding a compressed update first if needed.
+
+    Args:
+        paths (dict): Output of get_project_paths.
+        hash_value (str): SHA1 hash of the contribution.
+        base_version (int): Global model version the contribution was trained from.
+
+    Raises:
+        FullUploadRequired: If a compressed update's base version is no longer
+            kept. The update is deleted then.
+
+    Returns:
+        str: Path to the contribution's .weights.h5 file, or None if it was not uploaded.
+    """
+    weights_path = os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5")
+    update_path = os.path.join(paths["contrib_dir"], f"{hash_value}.update.h5")
+    if not os.path.exists(weights_path) and os.path.exists(update_path):
+        try:
+            base_weights_path = update_base_weights(paths, base_version)
+        except FullUploadRequired:
+            os.remove(update_path)
+            raise
+        decode_update(update_path, base_weights_path, weights_path)
+        print(f"Decoded compressed update {update_path} against {base_weights_path}.")
+    return weights_path if os.path.exists(weights_path) else None
+
+def register_contribution(paths, hash_value, contributor=None, num_samples=None, base_version=None):
+    """
+    Adds a new contribution to the project's contribution store.
+
+    Must be called while holding the project lock.
+
+    Raises:
+        ContributionRejected: If the upload is missing, corrupt, does not match
+            its hash or does not fit the model. Its blobs are deleted and it is
+            not added to the store, so the right content can still be uploaded.
+
+    Returns:
+        str: Path to the contribution's weights, or None if the hash was already contributed.
+    """
+    store = ContributionStore(paths["contrib_dir"])
+    entry = store.get(hash_value)
+    if entry is not None:
+        print(f"Duplicate contribution {hash_value}. Skipping aggregation.")
+        if entry["collected"]:
+            # The re-uploaded blob is not needed, its content was aggregated long ago
+            for path in store.blob_paths(hash_value):
+                if os.path.exists(path):
+                    os.remove(path)
+        return None
+
+    with span("register", project=project_name(paths), hash=hash_value) as info:
+        try:
+            weights_path = resolve_contribution(paths, hash_value, base_version)
+            if weights_path is None:
+                raise FileNotFoundError(f"Contribution weights file '{hash_value}.weights.h5' not found in contrib directory.")
+            check_compatible(list_weight_datasets(latest_weights(paths)[1]), weights_path)
+            entry = store.add(hash_value, contributor=contributor, base_version=base_version, num_samples=num_samples)
+        except (ValueError, KeyError, OSError) as e:
+            for path in store.blob_paths(hash_value):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise ContributionRejected(str(e)) from e
+        store.save()
+        info["bytes"] = entry["size"]
+        info["encoding"] = entry["encoding"]
+    return weights_path
+
+def aggregated_version(paths, hash_value):
+    """Returns the global model version a contribution was aggregated into, or None if it was not aggregated yet."""
+    entry = ContributionStore(paths["contrib_dir"]).get(hash_value)
+    if entry is None or not entry["aggregated"]:
+        return None
+    return entry["aggregated_version"]
+
+def record_aggregation(paths, config_values, hashes, version):
+    """
+    Marks contributions as aggregated and garbage-collects blobs outside the retention policy.
+
+    Must be called while holding the project lock.
+    """
+    store = ContributionStore(paths["contrib_dir"])
+    store.mark_aggregated(hashes, version)
+    freed = store.collect_garbage(
+        keep_count=int(config_values["contrib_retention_count"]),
+        keep_seconds=float(config_values["contrib_retention_days"]) * 86400,
+    )
+    store.save()
+    if freed:
+        print(f"Garbage-collected {freed} bytes of aggregated contributions.")
+
+def read_buffer(paths):
+    if not os.path.exists(paths["buffer_path"]):
+        return []
+    with open(paths["buffer_path"], "r") as f:
+        return json.load(f)
+
+def write_buffer(paths, buffer):
+    temp_path = f"{paths['buffer_path']}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(buffer, f)
+    os.replace(temp_path, paths["buffer_path"])
+
+def is_buffered(config_values):
+    return int(config_values["aggregation_buffer_size"]) > 1 or float(config_values["aggregation_window"]) > 0
+
+def buffer_is_due(buffer, config_values, now=None):
+    """
+    Returns True once the buffer holds K contributions or its oldest entry is older than the window.
+    """
+    if not buffer:
+        return False
+    now = time.time() if now is None else now
+    window = float(config_values["aggregation_window"])
+    if len(buffer) >= int(config_values["aggregation_buffer_size"]):
+        return True
+    return window > 0 and now - buffer[0]["received"] >= window
+
+def buffered_coefficients(buffer, current_version, config_values):
+    """
+    Computes the mixing coefficients for one FedBuff-style aggregation step.
+
+    Each contribution i gets p_i = n_i * (1 + staleness_i) ** -alpha / sum(n), where
+    n_i is its reported sample count and staleness_i is how many versions the
+    global model advanced since the contribution's base version. The new global
+    model is (1 - lr * sum(p)) * global + lr * sum(p_i * contribution_i), so fresh
+    contributions replace the global model with their sample-weighted mean and
+    stale ones pull it proportionally less.
+
+    Args:
+        buffer (list): Buffered contributions with num_samples and base_version.
+        current_version (int): Version of the current global model.
+        config_values (dict): Project configuration.
+
+    Returns:
+        tuple: (coefficient of the global model, list of contribution coefficients)
+    """
+    alpha = float(config_values["staleness_exponent"])
+    learning_rate = float(config_values["server_learning_rate"])
+
+    samples = [max(int(entry.get("num_samples") or 1), 1) for entry in buffer]
+    total_samples = float(sum(samples))
+    coefficients = []
+    for entry, num_samples in zip(buffer, samples):
+        base_version = entry.get("base_version")
+        staleness = 0 if base_version is None else max(current_version - int(base_version), 0)
+        discount = (1.0 + staleness) ** -alpha
+        coefficients.append(learning_rate * num_samples * discount / total_samples)
+    return 1.0 - sum(coefficients), coefficients
+
+def combine_contributions(paths, config_values, base_weights_path, contribution_paths, global_coefficient, coefficients,
+                          output_path):
+    """
+    Mixes contributions into global weights with the project's combining_method and writes the result to output_path.
+
+    The weighted mean streams one tensor at a time through weighted_sum_files.
+    Robust aggregators (median, trimmed_mean, krum, multi_krum) stack the
+    contributions per tensor, see aggregators.py.
+
+    """
+    method = resolve_method(config_values["combining_method"])
+    if method == "mean":
+        weighted_sum_files(
+            [base_weights_path] + contribution_paths,
+            [global_coefficient] + coefficients,
+            output_path,
+        )
+        return
+    robust_combine_files(
+        base_weights_path,
+        contribution_paths,
+        global_coefficient,
+        coefficients,
+        method,
+        output_path,
+        trim_ratio=float(config_values["trim_ratio"]),
+        num_byzantine=int(config_values["krum_byzantine"]),
+        num_selected=int(config_values["krum_selected"]),
+    )
+    print(f"Combined {len(contribution_paths)} contributions with {method}.")
+
+def flush_buffer(paths, config_values):
+    """
+    Aggregates every buffered contribution into the global weights in one pass.
+
+    Must be called while holding the project lock.
+
+    Returns:
+        int: Number of contributions aggregated.
+    """
+    buffer = read_buffer(paths)
+    if not buffer:
+        return 0
+
+    base_version, base_weights_path = latest_weights(paths)
+    global_coefficient, coefficients = buffered_coefficients(buffer, base_version, config_values)
+    contribution_paths = [
+        os.path.join(paths["contrib_dir"], f"{entry['hash']}.weights.h5") for entry in buffer
+    ]
+    staged_path = staging_weights_path(paths)
+    with span("aggregate", project=project_name(paths), contributions=len(buffer), base_version=base_version) as info:
+        combine_contributions(paths, config_values, base_weights_path, contribution_paths, global_coefficient,
+                              coefficients, staged_path)
+        info["bytes"] = sum(os.path.getsize(path) for path in contribution_paths)
+    with span("commit", project=project_name(paths), base_version=base_version) as info:
+        version = commit_weights(paths, config_values, staged_path, base_version)
+        info["version"] = version
+    write_buffer(paths, [])
+    record_aggregation(paths, config_values, [entry["hash"] for entry in buffer], version)
+    print(f"Aggregated {len(buffer)} buffered contributions into version {version} "
+          f"(global coefficient {global_coefficient:.4f}).")
+    return len(buffer)
+
+def buffer_contribution(paths, config_values, hash_value, num_samples=None, base_version=None):
+    """
+    Adds a contribution to the project's buffer and aggregates the buffer once it is due.
+
+    Must be called while holding the project lock.
+
+    Returns:
+        int: Number of contributions aggregated, 0 if the buffer is still filling.
+    """
+    buffer = read_buffer(paths)
+    buffer.append({
+        "hash": hash_value,
+        "num_samples": num_samples,
+        "base_version": base_version,
+        "received": time.time(),
+    })
+    write_buffer(paths, buffer)
+    print(f"Buffered contribution {hash_value} ({len(buffer)}/{config_values['aggregation_buffer_size']}).")
+
+    if buffer_is_due(buffer, config_values):
+        return flush_buffer(paths, config_values)
+    return 0
+
+def fold_and_commit(paths, config_values, hash_value, contribution_path, locked=False):
+    """
+    Computes (latest + contribution) / 2 and commits it with a compare-and-swap on the latest version.
+
+    The weights are computed from an immutable version without the project lock,
+    which is only taken for the commit itself, unless locked says the caller
+    holds it already. The contribution is registered before, so in that gap
+    batch_aggregate.py may aggregate it with the rest of the backlog. Every
+    attempt therefore checks the contribution index first, and again under the
+    lock before committing, instead of folding it in a second time.
+
+    Returns:
+        int: The committed version, or the version the contribution was already
+            aggregated into. None if another aggregation committed first.
+    """
+    version = aggregated_version(paths, hash_value)
+    if version is not None:
+        print(f"Contribution {hash_value} was aggregated into version {version} in the meantime.")
+        return version
+
+    base_version, base_weights_path = latest_weights(paths)
+    staged_path = staging_weights_path(paths)
+    try:
+        with span("aggregate", project=project_name(paths), hash=hash_value, base_version=base_version,
+                  bytes=os.path.getsize(contribution_path)):
+            weighted_sum_files([base_weights_path, contribution_path], [0.5, 0.5], staged_path)
+        with span("commit", project=project_name(paths), hash=hash_value, base_version=base_version) as info:
+            with contextlib.nullcontext() if locked else project_lock(paths):
+                version = aggregated_version(paths, hash_value)
+                if version is not None:
+                    print(f"Contribution {hash_value} was aggregated into version {version} in the meantime.")
+                else:
+                    version = commit_weights(paths, config_values, staged_path, base_version)
+                    if version is not None:
+                        record_aggregation(paths, config_values, [hash_value], version)
+            info["version"] = version
+        return version
+    finally:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+
+def main(username, projectname, hash_value, num_samples=None, base_version=None, contributor=None):
     try:
         # Define paths
-        project_dir = os.path.join("users", username, projectname)
-        contrib_dir = os.path.join(project_dir, "contrib")
-        model_weights_path = os.path.join(project_dir, "model.weights.h5")
-        model_config_path = os.path.join(project_dir, "model_config.json")
+        paths = get_project_paths(username, projectname)
+        project_dir = paths["project_dir"]
+        contrib_dir = paths["contrib_dir"]
+        model_weights_path = paths["model_weights_path"]
+        model_config_path = paths["model_config_path"]
         contribution_filename = f"{hash_value}.weights.h5"
         new_model_weights_path = os.path.join(contrib_dir, contribution_filename)
 
@@ -47,47 +680,79 @@ def main(username, projectname, hash_value):
         # Validate paths
         if not os.path.exists(model_config_path):
             print(f"Error: Model configuration file not found at {model_config_path}.")
-            return
-
-        if not os.path.exists(new_model_weights_path):
-            print(f"Error: Contribution weights file '{contribution_filename}' not found in contrib directory.")
-            return
-
-        # Load model configuration
-        with open(model_config_path, 'r') as json_file:
-            model_json = json_file.read()
-        existing_model = tf.keras.models.model_from_json(model_json)
-        print("Loaded existing model configuration from JSON.")
-
-        # Load existing model weights
-        if os.path.exists(model_weights_path):
-            existing_model.load_weights(model_weights_path)
-            print(f"Loaded existing model weights from {model_weights_path}.")
-        else:
+            return EXIT_FAILURE
+
+        # Initialize global weights if there are none yet
+        if not os.path.exists(model_weights_path):
             print(f"No existing weights found at {model_weights_path}. Initializing with random weights.")
-            existing_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+            initialize_missing_weights(model_config_path, model_weights_path)
 
-        # Load new contribution model weights
-        new_model = tf.keras.models.model_from_json(model_json)
-        new_model.load_weights(new_model_weights_path)
-        print(f"Loaded contribution weights from {new_model_weights_path}.")
+        config_values = read_project_config(paths["config_path"])
+        with project_lock(paths):
+            # Compressed uploads are decoded against the version the client trained from
+            if register_contribution(paths, hash_value, contributor, num_samples, base_version) is None:
+                return
 
-        # Combine models
-        combined_model = combine_model_with_existing(existing_model, new_model)
+            if is_buffered(config_values):
+                buffer_contribution(paths, config_values, hash_value, num_samples, base_version)
+                return
+
+        # Average the contribution into the global weights without holding the lock,
+        # and commit only if no other aggregation committed in the meantime. Each
+        # attempt, including the locked one, first checks that no other aggregation
+        # folded this contribution in already
+        version = None
+        for attempt in range(MAX_COMMIT_ATTEMPTS):
+            version = fold_and_commit(paths, config_values, hash_value, new_model_weights_path)
+            if version is not None:
+                break
+            print(f"Global model changed during aggregation (attempt {attempt + 1}). Retrying on the new version.")
+        if version is None:
+            with project_lock(paths):
+                version = fold_and_commit(paths, config_values, hash_value, new_model_weights_path, locked=True)
         print("Combined the existing model with the new contribution.")
+        print(f"Saved the combined model weights as version {version} to {model_weights_path}.")
 
-        # Save the combined weights
-        combined_model.save_weights(model_weights_path)
-        print(f"Saved the combined model weights to {model_weights_path}.")
+    except FullUploadRequired as e:
+        # The exit status tells the server to ask the client for its full weights
+        print(f"An error occurred: {e}")
+        return EXIT_FULL_UPLOAD_REQUIRED
+    except ContributionRejected as e:
+        # The server answers with a client error and does not record the contribution
+        print(f"Rejected contribution {hash_value}: {e}")
+        return EXIT_CONTRIBUTION_REJECTED
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return EXIT_FAILURE
 
+def flush_due(username, projectname):
+    """Aggregates a project's buffer if its time window has passed. Meant to be run periodically."""
+    try:
+        paths = get_project_paths(username, projectname)
+        config_values = read_project_config(paths["config_path"])
+        with project_lock(paths):
+            if buffer_is_due(read_buffer(paths), config_values):
+                flush_buffer(paths, config_values)
+            else:
+                print("Buffer is not due yet.")
     except Exception as e:
         print(f"An error occurred: {e}")
+        return EXIT_FAILURE
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Combine model contributions in federated learning.")
     parser.add_argument("username", type=str, help="Username directory")
     parser.add_argument("projectname", type=str, help="Project directory")
-    parser.add_argument("hash", type=str, help="SHA1 hash of the contribution weights (without .weights.h5)")
+    parser.add_argument("hash", type=str, nargs="?", help="SHA1 hash of the contribution weights (without .weights.h5)")
+    parser.add_argument("--num-samples", type=int, default=None, help="Number of samples the contributor trained on")
+    parser.add_argument("--base-version", type=int, default=None, help="Global model version the contribution was trained from")
+    parser.add_argument("--contributor", type=str, default=None, help="Username of the contributor")
+    parser.add_argument("--flush", action="store_true", help="Aggregate the buffered contributions if the buffer is due")
 
     args = parser.parse_args()
-    main(args.username, args.projectname, args.hash)
\ No newline at end of file
+    if args.flush:
+        sys.exit(flush_due(args.username, args.projectname))
+    elif args.hash:
+        sys.exit(main(args.username, args.projectname, args.hash, args.num_samples, args.base_version, args.contributor))
+    else:
+        parser.error("hash is required unless --flush is given")
\ No newline at end of file
@@ -0,0 +1,206 @@
+import json
+import os
+
+import h5py
+import numpy as np
+
+# Layer configs carry only keys every Keras 3 release accepts, the rest default
+DTYPE = "float32"
+
+
+def layer_entry(class_name, config, build_input_shape=None):
+    """Wraps a layer config the way Keras serializes it into a Sequential config."""
+    entry = {"module": "keras.layers", "class_name": class_name, "config": config, "registered_name": None}
+    if build_input_shape is not None:
+        entry["build_config"] = {"input_shape": list(build_input_shape)}
+    return entry
+
+
+class LayerNames:
+    """Hands out layer names like Keras does in a fresh process: dense, dense_1, dense_2, ..."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def next(self, prefix):
+        count = self.counts.get(prefix, 0)
+        self.counts[prefix] = count + 1
+        return prefix if count == 0 else f"{prefix}_{count}"
+
+
+def build_model_config(input_shape, activation_function, dropout_rate, num_layers, units_per_layer, num_classes):
+    """
+    Builds the Sequential configuration of a project's network without TensorFlow.
+
+    The network is Flatten, num_layers times Dense and Dropout, and a softmax
+    Dense output, the same as init.py used to build with Keras.
+
+    Args:
+        input_shape (tuple): Shape of one input, including the channels.
+        activation_function (str): Activation of the hidden Dense layers.
+        dropout_rate (float): Rate of the Dropout layers.
+        num_layers (int): Number of hidden Dense layers.
+        units_per_layer (int): Units of each hidden Dense layer.
+        num_classes (int): Units of the output layer.
+
+    Returns:
+        dict: The configuration, as model.to_json() would serialize it.
+    """
+    names = LayerNames()
+    batch_shape = [None] + list(input_shape)
+    layers = [layer_entry("InputLayer", {
+        "batch_shape": batch_shape,
+        "dtype": DTYPE,
+        "sparse": False,
+        "name": names.next("input_layer"),
+    })]
+    layers.append(layer_entry("Flatten", {
+        "name": names.next("flatten"),
+        "trainable": True,
+        "dtype": DTYPE,
+        "data_format": "channels_last",
+    }, batch_shape))
+
+    features = int(np.prod(input_shape))
+    dense_layers = [(units_per_layer, activation_function)] * num_layers + [(num_classes, "softmax")]
+    for i, (units, activation) in enumerate(dense_layers):
+        layers.append(layer_entry("Dense", {
+            "name": names.next("dense"),
+            "trainable": True,
+            "dtype": DTYPE,
+            "units": units,
+            "activation": activation,
+            "use_bias": True,
+            "kernel_initializer": {
+                "module": "keras.initializers", "class_name": "GlorotUniform",
+                "config": {"seed": None}, "registered_name": None,
+            },
+            "bias_initializer": {
+                "module": "keras.initializers", "class_name": "Zeros",
+                "config": {}, "registered_name": None,
+            },
+            "kernel_regularizer": None,
+            "bias_regularizer": None,
+            "kernel_constraint": None,
+            "bias_constraint": None,
+        }, [None, features]))
+        features = units
+        if i < num_layers:
+            layers.append(layer_entry("Dropout", {
+                "name": names.next("dropout"),
+                "trainable": True,
+                "dtype": DTYPE,
+                "rate": dropout_rate,
+                "seed": None,
+                "noise_shape": None,
+            }))
+
+    return {
+        "module": "keras",
+        "class_name": "Sequential",
+        "config": {
+            "name": "sequential",
+            "trainable": True,
+            "dtype": DTYPE,
+            "layers": layers,
+            "build_input_shape": batch_shape,
+        },
+        "registered_name": None,
+        "build_config": {"input_shape": batch_shape},
+        "compile_config": None,
+    }
+
+
+def dense_kernel_shapes(model_config):
+    """
+    Lists the weight tensors of a Sequential configuration built from supported layers.
+
+    Raises:
+        ValueError: If the model has a layer other than InputLayer, Flatten,
+            Dense or Dropout, or a Dense layer initialized by something other
+            than GlorotUniform and Zeros.
+
+    Returns:
+        tuple: (list of (layer name, fan_in, units, use_bias) tuples, list of all layer names)
+    """
+    if model_config.get("class_name") != "Sequential":
+        raise ValueError(f"Only Sequential models are supported, not {model_config.get('class_name')}.")
+    dense = []
+    names = []
+    features = None
+    for layer in model_config["config"]["layers"]:
+        class_name, config = layer["class_name"], layer["config"]
+        if class_name == "InputLayer":
+            shape = config.get("batch_shape") or config.get("batch_input_shape")
+            features = int(np.prod(shape[1:]))
+            continue
+        names.append(config["name"])
+        if class_name == "Dense":
+            kernel_init = config.get("kernel_initializer", {}).get("class_name", "GlorotUniform")
+            bias_init = config.get("bias_initializer", {}).get("class_name", "Zeros")
+            if kernel_init != "GlorotUniform" or bias_init != "Zeros":
+                raise ValueError(f"Layer {config['name']} uses unsupported initializers {kernel_init}/{bias_init}.")
+            dense.append((config["name"], features, config["units"], config.get("use_bias", True)))
+            features = config["units"]
+        elif class_name not in ("Flatten", "Dropout"):
+            raise ValueError(f"Layer type {class_name} is not supported.")
+    if features is None:
+        raise ValueError("The model has no InputLayer.")
+    return dense, names
+
+
+def glorot_uniform(fan_in, fan_out, rng):
+    """Samples a (fan_in, fan_out) kernel uniformly from +-sqrt(6 / (fan_in + fan_out)), like Keras."""
+    limit = np.sqrt(6.0 / (fan_in + fan_out))
+    return rng.uniform(-limit, limit, size=(fan_in, fan_out)).astype(np.float32)
+
+
+def write_initial_weights(model_config, weights_path, seed=None):
+    """
+    Writes freshly initialized weights for a model configuration in the Keras .weights.h5 layout.
+
+    Every layer gets a layers/<name>/vars group, with the kernel as dataset 0
+    and the bias as dataset 1 for Dense layers, so the file loads with
+    load_weights into the model built by model_from_json. The file is written
+    next to weights_path and renamed into place.
+
+    Args:
+        model_config (dict): Output of build_model_config or a parsed model_config.json.
+        weights_path (str): Path of the weights file to write.
+        seed (int): Seed of the kernel initialization. Random if None.
+
+    Returns:
+        int: Number of parameters written.
+    """
+    dense, names = dense_kernel_shapes(model_config)
+    shapes = {name: (fan_in, units, use_bias) for name, fan_in, units, use_bias in dense}
+    rng = np.random.default_rng(seed)
+    temp_path = f"{weights_path}.init-{os.getpid()}.tmp"
+    parameters = 0
+    try:
+        with h5py.File(temp_path, "w") as f:
+            layers_group = f.create_group("layers")
+            for name in names:
+                vars_group = layers_group.create_group(name).create_group("vars")
+                vars_group.attrs["name"] = name
+                if name in shapes:
+                    fan_in, units, use_bias = shapes[name]
+                    vars_group.create_dataset("0", data=glorot_uniform(fan_in, units, rng))
+                    parameters += fan_in * units
+                    if use_bias:
+                        vars_group.create_dataset("1", data=np.zeros(units, dtype=np.float32))
+                        parameters += units
+            f.create_group("vars").attrs["name"] = model_config["config"].get("name", "sequential")
+        os.replace(temp_path, weights_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return parameters
+
+
+def write_model_config(model_config, config_path):
+    """Writes a model configuration as model_config.json, atomically."""
+    temp_path = f"{config_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(model_config, f)
+    os.replace(temp_path, config_path)
@@ -0,0 +1,111 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import zipfile
+
+from precision import file_precision
+
+BUNDLE_MANIFEST = "model_bundle.json"
+BUNDLE_FILES = ("model_config.json", "model.weights.h5")
+
+
+def sha256_of_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def bundle_path(project_dir, version):
+    return os.path.join(project_dir, "bundles", f"{version}.zip")
+
+
+def build_bundle(project_dir, version):
+    """
+    Packs the model configuration and the distributed weights into a ready-to-serve zip.
+
+    The zip holds model_config.json, model.weights.h5 and a manifest.json with
+    the SHA-256 of each file and a content hash over both, which the server
+    uses as the ETag of the download. Bundles are immutable and named by
+    version; model_bundle.json, the manifest of the latest one, is replaced
+    atomically, so a download never mixes two versions. Only the latest two
+    bundles are kept, the older one for downloads that are still running.
+
+    Must be called while holding the project lock, right after a version is committed.
+
+    Args:
+        project_dir (str): Directory of the project.
+        version (int): The committed version.
+
+    Returns:
+        dict: The manifest.
+    """
+    files = {}
+    content_hash = hashlib.sha256()
+    for filename in BUNDLE_FILES:
+        file_hash = sha256_of_file(os.path.join(project_dir, filename))
+        files[filename] = {"sha256": file_hash, "bytes": os.path.getsize(os.path.join(project_dir, filename))}
+        content_hash.update(f"{filename}:{file_hash}\n".encode())
+
+    manifest = {
+        "version": version,
+        "content_hash": content_hash.hexdigest(),
+        "precision": file_precision(os.path.join(project_dir, "model.weights.h5")),
+        "created": time.time(),
+        "files": files,
+        "bundle": os.path.join("bundles", f"{version}.zip"),
+    }
+
+    path = bundle_path(project_dir, version)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    try:
+        with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+            for filename in BUNDLE_FILES:
+                bundle.write(os.path.join(project_dir, filename), filename)
+            bundle.writestr("manifest.json", json.dumps(manifest, indent=1))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    manifest["bundle_bytes"] = os.path.getsize(path)
+
+    manifest_path = os.path.join(project_dir, BUNDLE_MANIFEST)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, manifest_path)
+
+    for filename in os.listdir(os.path.dirname(path)):
+        name, extension = os.path.splitext(filename)
+        if extension == ".zip" and name.isdigit() and int(name) < version - 1:
+            os.remove(os.path.join(os.path.dirname(path), filename))
+    return manifest
+
+
+def main(username, projectname):
+    try:
+        # Imported here because contribution.py itself depends on this module
+        from contribution import get_model_version, get_project_paths, project_lock
+
+        paths = get_project_paths(username, projectname)
+        with project_lock(paths):
+            manifest = build_bundle(paths["project_dir"], get_model_version(paths))
+        print(f"Built the bundle of version {manifest['version']} ({manifest['bundle_bytes']} bytes, "
+              f"content hash {manifest['content_hash']}).")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the download bundle of a project's current global model.")
+    parser.add_argument("username", type=str, help="Username directory")
+    parser.add_argument("projectname", type=str, help="Project directory")
+
+    args = parser.parse_args()
+    main(args.username, args.projectname)
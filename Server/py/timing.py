@@ -0,0 +1,73 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+# Path of the file spans are appended to as JSON lines. Unset, they go to stderr
+SPAN_LOG_ENV = "FEDLEARN_SPAN_LOG"
+
+_listeners = []
+_lock = threading.Lock()
+
+
+def add_listener(listener):
+    """Registers a callable that receives every finished span as a dict, e.g. to feed metrics."""
+    _listeners.append(listener)
+
+
+def emit(record):
+    """Writes one span record as a JSON line and passes it to the listeners."""
+    line = json.dumps(record, default=str)
+    log_path = os.environ.get(SPAN_LOG_ENV)
+    with _lock:
+        if log_path:
+            with open(log_path, "a") as f:
+                f.write(line + "\n")
+        else:
+            sys.stderr.write(line + "\n")
+            sys.stderr.flush()
+    for listener in _listeners:
+        listener(record)
+
+
+@contextlib.contextmanager
+def span(phase, **fields):
+    """
+    Times a phase and emits it as a structured span when it ends.
+
+    The yielded dict can be filled with fields only known at the end of the
+    phase, such as byte counts. A span that raises is emitted with status
+    'error' and the exception message before the exception propagates.
+
+    Example:
+        with span("save_weights", project=projectname) as info:
+            model.save_weights(path)
+            info["bytes"] = os.path.getsize(path)
+
+    Args:
+        phase (str): Name of the phase, like load_weights or upload.
+        **fields: Context such as project, hash or bytes.
+    """
+    info = dict(fields)
+    started = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield info
+    except BaseException as e:
+        status = "error"
+        info["error"] = str(e)
+        raise
+    finally:
+        record = {
+            "ts": started,
+            "phase": phase,
+            "duration_ms": (time.perf_counter() - start) * 1000.0,
+            "status": status,
+            "pid": os.getpid(),
+            "script": os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        }
+        record.update(info)
+        emit(record)
@@ -8,8 +8,14 @@ const {
     addCollaborator,
     uploadTestFile,
     getModel,
+    getWeightsManifest,
+    getWeightsBlob,
     testModel,
     contribute,
+    startUpload,
+    getUploadStatus,
+    putUploadChunk,
+    completeUpload,
     getJson
 } = require('../controllers/projectController'); 
 const { fuzzyFindUsernames } = require('../controllers/userController');
@@ -32,10 +38,22 @@ router.get('/search/:query', authMiddleware, fuzzyFindUsernames);
 
 router.get('/:projectName/model', authMiddleware, getModel);
 
+router.get('/:projectName/weights/manifest', authMiddleware, getWeightsManifest);
+
+router.get('/:projectName/weights/:kind/:blob', authMiddleware, getWeightsBlob);
+
 router.post('/:projectName/test-model', authMiddleware, testModel);
 
 router.post('/:projectName/contribute', authMiddleware, contribute);
 
+router.post('/:projectName/uploads', authMiddleware, startUpload);
+
+router.get('/:projectName/uploads/:uploadId', authMiddleware, getUploadStatus);
+
+router.put('/:projectName/uploads/:uploadId/chunks/:index', authMiddleware, express.raw({ type: 'application/octet-stream', limit: '64mb' }), putUploadChunk);
+
+router.post('/:projectName/uploads/:uploadId/complete', authMiddleware, completeUpload);
+
 router.get('/:projectName/json', authMiddleware, getJson);
 
 
@@ -0,0 +1,308 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Benchmarks run on the CPU only, before TensorFlow is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "client"))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, "server"))
+
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+import client
+import contribution
+import init
+import test
+from weights_h5 import weighted_sum_files
+
+BENCH_USER = "bench"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class PeakRssSampler:
+    """
+    Samples the resident set size of this process in a background thread.
+
+    ru_maxrss only ever grows over the life of the process, so the peak of a
+    single stage is taken from /proc/self/statm, sampled every interval seconds.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def current_rss():
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+
+    def _sample(self):
+        while self.running:
+            self.peak = max(self.peak, self.current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Records the wall time of every training epoch."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = []
+        self.started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.seconds.append(time.perf_counter() - self.started)
+
+
+def run_stage(results, stage, fn, quiet=True):
+    """
+    Runs fn, recording its wall time and peak RSS under results[stage].
+
+    The scripts print every step, which is silenced unless quiet is False.
+
+    Returns:
+        The return value of fn.
+    """
+    output = io.StringIO() if quiet else sys.stdout
+    with PeakRssSampler() as sampler, contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+    results[stage] = {"seconds": seconds, "peak_rss_mb": sampler.peak / 1024 ** 2}
+    if quiet and "An error occurred" in output.getvalue():
+        raise RuntimeError(f"Stage {stage} failed:\n{output.getvalue()}")
+    return value
+
+
+def write_config(path, num_layers, units_per_layer, input_shape, num_classes):
+    """Writes a config.txt in the format init.py reads."""
+    config_values = {
+        "activation_function": "relu",
+        "dropout_rate": "0.2",
+        "combining_method": "average",
+        "input_shape": ",".join(str(dim) for dim in input_shape),
+        "num_layers": str(num_layers),
+        "units_per_layer": str(units_per_layer),
+        "num_classes": str(num_classes),
+    }
+    with open(path, "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in config_values.items())
+
+
+def write_image_dataset(dataset_dir, num_images, input_shape, num_classes, seed):
+    """
+    Writes random PNG images into one folder per class, like the datasets users upload.
+
+    Each class gets its own mean brightness, so training has something to learn.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = input_shape[:2]
+    channels = input_shape[2] if len(input_shape) == 3 else 1
+    for i in range(num_images):
+        label = i % num_classes
+        class_dir = os.path.join(dataset_dir, f"class_{label:02d}")
+        os.makedirs(class_dir, exist_ok=True)
+        mean = 255.0 * (label + 0.5) / num_classes
+        pixels = np.clip(rng.normal(mean, 40.0, size=(height, width, channels)), 0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels[:, :, 0] if channels == 1 else pixels)
+        image.save(os.path.join(class_dir, f"{i:06d}.png"))
+
+
+def benchmark_config(num_layers, units_per_layer, input_shape, num_samples, num_classes, epochs, seed):
+    """
+    Benchmarks every stage of one round for a synthetic project.
+
+    The project is created by init.py from a generated config.txt, its global
+    weights are trained on by client.py, combined like contribution.py does and
+    evaluated by test.py, all relative to the current directory.
+
+    Returns:
+        dict: The parameters and a {'seconds', 'peak_rss_mb'} entry per stage.
+    """
+    projectname = f"l{num_layers}_u{units_per_layer}_{'x'.join(map(str, input_shape))}_n{num_samples}"
+    project_dir = os.path.join("users", BENCH_USER, projectname)
+    client_dir = os.path.join("projects", projectname)
+    stages = {}
+
+    write_config("config.txt", num_layers, units_per_layer, input_shape, num_classes)
+    run_stage(stages, "init", lambda: init.main(BENCH_USER, projectname))
+    model_config_path = os.path.join(project_dir, "model_config.json")
+    model_weights_path = os.path.join(project_dir, "model.weights.h5")
+
+    def load():
+        model = contribution.load_model_from_config(model_config_path)
+        model.load_weights(model_weights_path)
+        return model
+
+    existing_model = run_stage(stages, "load", load)
+    parameters = int(existing_model.count_params())
+
+    # The client trains on the global weights
+    write_image_dataset(os.path.join(client_dir, "training_data"), num_samples, input_shape, num_classes, seed)
+    write_image_dataset(os.path.join(project_dir, "test_set"), max(num_samples // 5, num_classes), input_shape,
+                        num_classes, seed + 1)
+    shutil.copyfile(model_config_path, os.path.join(client_dir, "model_config.json"))
+    shutil.copyfile(model_weights_path, os.path.join(client_dir, "model.weights.h5"))
+
+    timer = EpochTimer()
+    hash_value = run_stage(stages, "train", lambda: client.main(projectname, epochs, callbacks=[timer]))
+    stages["train_epoch"] = {"seconds": min(timer.seconds), "epochs": timer.seconds}
+    contribution_path = os.path.join(client_dir, "contrib", f"{hash_value}.weights.h5")
+
+    new_model = contribution.load_model_from_config(model_config_path)
+    new_model.load_weights(contribution_path)
+    combined_model = run_stage(
+        stages, "combine_keras", lambda: contribution.combine_model_with_existing(existing_model, new_model)
+    )
+    run_stage(stages, "save", lambda: combined_model.save_weights(os.path.join(project_dir, "combined.weights.h5")))
+    run_stage(stages, "combine_h5", lambda: weighted_sum_files(
+        [model_weights_path, contribution_path], [0.5, 0.5], os.path.join(project_dir, "combined_h5.weights.h5")
+    ))
+
+    # The first evaluation decodes the test set into its cache, the second reads the cache
+    run_stage(stages, "evaluate_cold", lambda: test.main(BENCH_USER, projectname))
+    run_stage(stages, "evaluate_warm", lambda: test.main(BENCH_USER, projectname))
+
+    return {
+        "num_layers": num_layers,
+        "units_per_layer": units_per_layer,
+        "input_shape": list(input_shape),
+        "num_samples": num_samples,
+        "num_classes": num_classes,
+        "parameters": parameters,
+        "weights_bytes": os.path.getsize(model_weights_path),
+        "stages": stages,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline_path, results_path):
+    """Prints the relative change of every stage's time between two result files."""
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    with open(results_path, "r") as f:
+        results = json.load(f)
+
+    def key(record):
+        return (record["num_layers"], record["units_per_layer"], tuple(record["input_shape"]), record["num_samples"])
+
+    baseline_records = {key(record): record for record in baseline["results"]}
+    print(f"Comparing {results.get('commit')} against {baseline.get('commit')}")
+    for record in results["results"]:
+        before = baseline_records.get(key(record))
+        if before is None:
+            continue
+        print(f"{key(record)}:")
+        for stage, values in record["stages"].items():
+            if stage in before["stages"]:
+                old, new = before["stages"][stage]["seconds"], values["seconds"]
+                print(f"  {stage:14s} {old:9.4f}s -> {new:9.4f}s ({(new - old) / old * 100:+.1f}%)")
+
+
+def parse_ints(value):
+    return [int(item) for item in value.split(",")]
+
+
+def parse_shapes(value):
+    return [tuple(int(dim) for dim in shape.split("x")) for shape in value.split(",")]
+
+
+def main(layers, units, input_shapes, samples, num_classes, epochs, output_path, workspace=None, seed=0):
+    try:
+        tf.keras.utils.set_random_seed(seed)
+        own_workspace = workspace is None
+        workspace = os.path.abspath(workspace or tempfile.mkdtemp(prefix="fedlearn-bench-"))
+        os.makedirs(workspace, exist_ok=True)
+        output_path = os.path.abspath(output_path)
+        print(f"Benchmark workspace: {workspace}")
+
+        records = []
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            for num_layers, units_per_layer, input_shape, num_samples in itertools.product(layers, units, input_shapes, samples):
+                record = benchmark_config(num_layers, units_per_layer, input_shape, num_samples, num_classes, epochs, seed)
+                records.append(record)
+                summary = ", ".join(f"{stage} {values['seconds']:.3f}s" for stage, values in record["stages"].items())
+                print(f"layers={num_layers} units={units_per_layer} shape={input_shape} samples={num_samples}: {summary}")
+        finally:
+            os.chdir(cwd)
+            if own_workspace:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+        report = {
+            "commit": get_git_commit(),
+            "created": time.time(),
+            "python": platform.python_version(),
+            "tensorflow": tf.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "results": records,
+        }
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"Saved benchmark results to {output_path}.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark init, train, aggregate and evaluate on synthetic projects.")
+    parser.add_argument("--layers", type=parse_ints, default=[1, 3], help="Comma-separated num_layers values")
+    parser.add_argument("--units", type=parse_ints, default=[64, 256], help="Comma-separated units_per_layer values")
+    parser.add_argument("--input-shapes", type=parse_shapes, default=[(28, 28)], help="Comma-separated shapes like 28x28,32x32x3")
+    parser.add_argument("--samples", type=parse_ints, default=[1000], help="Comma-separated training set sizes")
+    parser.add_argument("--num-classes", type=int, default=10, help="Number of classes of the synthetic datasets")
+    parser.add_argument("--epochs", type=int, default=2, help="Training epochs per configuration")
+    parser.add_argument("--output", type=str, default="bench_results.json", help="Path of the JSON results")
+    parser.add_argument("--workspace", type=str, default=None, help="Keep the generated projects in this directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data")
+    parser.add_argument("--compare", type=str, default=None, help="Compare --output against this earlier results file instead of running")
+
+    args = parser.parse_args()
+    if args.compare:
+        compare_results(args.compare, args.output)
+    else:
+        main(args.layers, args.units, args.input_shapes, args.samples, args.num_classes, args.epochs, args.output,
+             args.workspace, args.seed)
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# bench.py puts the client and server scripts on the path and keeps TensorFlow on the CPU
+from bench import get_git_commit, parse_ints, run_stage, write_config, write_image_dataset
+
+import numpy as np
+import tensorflow as tf
+
+import client
+import contribution
+import init
+import test
+from data_pipeline import list_image_files
+from weights_sync import apply_manifest
+
+SIM_USER = "sim"
+
+
+def partition_indices(labels, num_clients, mode, alpha, rng):
+    """
+    Splits sample indices across clients.
+
+    'iid' shuffles the samples and deals them out evenly. 'noniid' draws, per
+    class, the share of every client from a Dirichlet distribution with
+    concentration alpha, so small alphas give each client only a few classes.
+    Every client gets at least one sample.
+
+    Returns:
+        list: One array of sample indices per client.
+    """
+    labels = np.asarray(labels)
+    if len(labels) < num_clients:
+        raise ValueError(f"{len(labels)} training images cannot be split across {num_clients} clients.")
+    if mode == "iid":
+        return [np.sort(shard) for shard in np.array_split(rng.permutation(len(labels)), num_clients)]
+
+    shards = [[] for _ in range(num_clients)]
+    for label in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label))
+        shares = rng.dirichlet(np.full(num_clients, alpha))
+        cuts = (np.cumsum(shares)[:-1] * len(indices)).astype(int)
+        for shard, part in zip(shards, np.split(indices, cuts)):
+            shard.extend(part.tolist())
+    for shard in shards:
+        if not shard:
+            largest = max(shards, key=len)
+            shard.append(largest.pop())
+    return [np.sort(np.array(shard, dtype=int)) for shard in shards]
+
+
+def link_images(paths, labels, class_names, target_dir):
+    """Hard-links images into a class-per-folder tree, with a folder for every class so label indices agree."""
+    for class_name in class_names:
+        os.makedirs(os.path.join(target_dir, class_name), exist_ok=True)
+    for i, (path, label) in enumerate(zip(paths, labels)):
+        target = os.path.join(target_dir, class_names[label], f"{i:06d}{os.path.splitext(path)[1]}")
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+
+
+def prepare_dataset(dataset_dir, pool_dir, num_samples, input_shape, num_classes, seed):
+    """
+    Lists the images to simulate with, generating a synthetic dataset unless dataset_dir is given.
+
+    Returns:
+        tuple: (list of image paths, list of class indices, sorted class names)
+    """
+    if dataset_dir is None:
+        dataset_dir = pool_dir
+        write_image_dataset(dataset_dir, num_samples, input_shape, num_classes, seed)
+    paths, labels, class_indices = list_image_files(dataset_dir)
+    return paths, labels, sorted(class_indices, key=class_indices.get)
+
+
+def distribute(server_dir, client_dir):
+    """
+    Brings a client's copy of the global model up to date, like the client's sync step.
+
+    Returns:
+        int: Bytes a real client would have downloaded.
+    """
+    with open(os.path.join(server_dir, "weights_manifest.json"), "r") as f:
+        manifest = json.load(f)
+    weights_path = os.path.join(client_dir, "model.weights.h5")
+    if not os.path.exists(weights_path):
+        for filename in ("model_config.json", "model.weights.h5"):
+            shutil.copyfile(os.path.join(server_dir, filename), os.path.join(client_dir, filename))
+        downloaded = sum(os.path.getsize(os.path.join(client_dir, name)) for name in ("model_config.json", "model.weights.h5"))
+    else:
+        def fetch(blob_path):
+            with open(os.path.join(server_dir, blob_path), "rb") as f:
+                return f.read()
+
+        downloaded = apply_manifest(weights_path, manifest, fetch)["fetched_bytes"]
+    with open(os.path.join(client_dir, "version.txt"), "w") as f:
+        f.write(f"{manifest['version']}\n")
+    return downloaded
+
+
+def simulate(num_clients, rounds, args, paths, labels, class_names, test_indices, seed):
+    """
+    Runs rounds of federated training with num_clients virtual clients in this process.
+
+    Every round each client syncs the global model, trains on its shard with
+    client.main and contributes through contribution.main. The project
+    buffers a whole round before it aggregates, so each round is one
+    sample-weighted FedAvg step. test.py then evaluates the new global model.
+
+    Returns:
+        dict: The parameters and one record per round.
+    """
+    projectname = f"sim_{args.partition}_c{num_clients}"
+    project_dir = os.path.join("users", SIM_USER, projectname)
+    stages = {}
+
+    write_config("config.txt", args.layers, args.units, args.input_shape, len(class_names))
+    with open("config.txt", "a") as f:
+        f.write(f"aggregation_buffer_size={num_clients}\n")
+        if args.precision != "float32":
+            f.write(f"weights_precision={args.precision}\n")
+    run_stage(stages, "init", lambda: init.main(SIM_USER, projectname, seed=seed))
+
+    link_images([paths[i] for i in test_indices], [labels[i] for i in test_indices], class_names,
+                os.path.join(project_dir, "test_set"))
+    train_indices = np.setdiff1d(np.arange(len(labels)), test_indices)
+    rng = np.random.default_rng(seed)
+    shards = partition_indices([labels[i] for i in train_indices], num_clients, args.partition, args.alpha, rng)
+    client_names = []
+    for i, shard in enumerate(shards):
+        client_name = f"{projectname}_client{i:03d}"
+        link_images([paths[train_indices[j]] for j in shard], [labels[train_indices[j]] for j in shard], class_names,
+                    os.path.join("projects", client_name, "training_data"))
+        client_names.append(client_name)
+    print(f"{num_clients} clients with {[len(shard) for shard in shards]} training images, {len(test_indices)} test images.")
+
+    records = []
+    for round_number in range(1, rounds + 1):
+        round_stages = {}
+        round_start = time.perf_counter()
+        downloaded = 0
+        start = time.perf_counter()
+        for client_name in client_names:
+            downloaded += distribute(project_dir, os.path.join("projects", client_name))
+        round_stages["distribute"] = time.perf_counter() - start
+
+        uploaded = 0
+        train_seconds = []
+        contribute_seconds = 0.0
+        for client_name, shard in zip(client_names, shards):
+            client_dir = os.path.join("projects", client_name)
+            with open(os.path.join(client_dir, "version.txt"), "r") as f:
+                base_version = int(f.read().strip())
+            train_info = {}
+            client_stages = {}
+            hash_value = run_stage(client_stages, "train", lambda: client.main(
+                client_name, args.epochs, train_info, precision=args.precision
+            ))
+            train_seconds.append(client_stages["train"]["seconds"])
+
+            contribution_path = os.path.join(client_dir, "contrib", f"{hash_value}.weights.h5")
+            uploaded += os.path.getsize(contribution_path)
+            shutil.move(contribution_path, os.path.join(project_dir, "contrib", f"{hash_value}.weights.h5"))
+            run_stage(client_stages, "contribute", lambda: contribution.main(
+                SIM_USER, projectname, hash_value, train_info.get("num_samples", len(shard)), base_version, client_name
+            ))
+            contribute_seconds += client_stages["contribute"]["seconds"]
+        round_stages["train"] = sum(train_seconds)
+        round_stages["aggregate"] = contribute_seconds
+
+        evaluate_stages = {}
+        run_stage(evaluate_stages, "evaluate", lambda: test.main(SIM_USER, projectname))
+        round_stages["evaluate"] = evaluate_stages["evaluate"]["seconds"]
+        with open(os.path.join(project_dir, "accuracy.txt"), "r") as f:
+            accuracy = float(f.read().strip().rstrip("%")) / 100.0
+
+        wall = time.perf_counter() - round_start
+        # Real clients train at the same time, so a round lasts as long as its slowest client
+        parallel = wall - round_stages["train"] + max(train_seconds)
+        record = {
+            "round": round_number,
+            "version": contribution.get_model_version(contribution.get_project_paths(SIM_USER, projectname)),
+            "accuracy": accuracy,
+            "seconds": wall,
+            "parallel_seconds": parallel,
+            "stages": round_stages,
+            "client_train_seconds": train_seconds,
+            "download_bytes": downloaded,
+            "upload_bytes": uploaded,
+        }
+        records.append(record)
+        print(f"clients={num_clients} round {round_number}: accuracy {accuracy * 100:.2f}%, {wall:.2f}s "
+              f"({parallel:.2f}s with parallel clients), {downloaded} bytes down, {uploaded} bytes up")
+
+    total_seconds = sum(record["seconds"] for record in records)
+    total_parallel = sum(record["parallel_seconds"] for record in records)
+    return {
+        "clients": num_clients,
+        "rounds": rounds,
+        "shard_sizes": [len(shard) for shard in shards],
+        "init_seconds": stages["init"]["seconds"],
+        "rounds_per_hour": 3600.0 * len(records) / total_seconds,
+        "rounds_per_hour_parallel": 3600.0 * len(records) / total_parallel,
+        "final_accuracy": records[-1]["accuracy"],
+        "results": records,
+    }
+
+
+def main(args):
+    try:
+        tf.keras.utils.set_random_seed(args.seed)
+        own_workspace = args.workspace is None
+        workspace = os.path.abspath(args.workspace or tempfile.mkdtemp(prefix="fedlearn-sim-"))
+        os.makedirs(workspace, exist_ok=True)
+        output_path = os.path.abspath(args.output)
+        dataset_dir = os.path.abspath(args.dataset) if args.dataset else None
+        print(f"Simulation workspace: {workspace}")
+
+        simulations = []
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            paths, labels, class_names = prepare_dataset(
+                dataset_dir, os.path.join(workspace, "pool"), args.samples, args.input_shape, args.num_classes, args.seed
+            )
+            rng = np.random.default_rng(args.seed)
+            test_indices = np.sort(rng.permutation(len(labels))[:max(int(len(labels) * args.test_fraction), 1)])
+            for num_clients in args.clients:
+                simulations.append(simulate(num_clients, args.rounds, args, paths, labels, class_names, test_indices, args.seed))
+        finally:
+            os.chdir(cwd)
+            if own_workspace:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+        report = {
+            "commit": get_git_commit(),
+            "created": time.time(),
+            "tensorflow": tf.__version__,
+            "partition": args.partition,
+            "alpha": args.alpha if args.partition == "noniid" else None,
+            "epochs": args.epochs,
+            "layers": args.layers,
+            "units": args.units,
+            "input_shape": list(args.input_shape),
+            "precision": args.precision,
+            "simulations": simulations,
+        }
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=1)
+        for simulation in simulations:
+            print(f"clients={simulation['clients']}: final accuracy {simulation['final_accuracy'] * 100:.2f}%, "
+                  f"{simulation['rounds_per_hour']:.1f} rounds/hour "
+                  f"({simulation['rounds_per_hour_parallel']:.1f} with parallel clients)")
+        print(f"Saved simulation results to {output_path}.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate federated rounds with virtual clients in one process.")
+    parser.add_argument("--clients", type=parse_ints, default=[4], help="Comma-separated numbers of virtual clients")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per simulation")
+    parser.add_argument("--partition", choices=("iid", "noniid"), default="iid", help="How the training data is split")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Dirichlet concentration of the non-IID split")
+    parser.add_argument("--dataset", type=str, default=None, help="Class-per-folder image dataset, synthetic if omitted")
+    parser.add_argument("--samples", type=int, default=2000, help="Number of synthetic images")
+    parser.add_argument("--input-shape", type=lambda value: tuple(int(dim) for dim in value.split("x")), default=(28, 28),
+                        help="Input shape like 28x28 or 32x32x3")
+    parser.add_argument("--num-classes", type=int, default=10, help="Number of classes of the synthetic dataset")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Fraction of the images held out as the test set")
+    parser.add_argument("--epochs", type=int, default=1, help="Local epochs per round")
+    parser.add_argument("--layers", type=int, default=2, help="num_layers of the model")
+    parser.add_argument("--units", type=int, default=128, help="units_per_layer of the model")
+    parser.add_argument("--precision", choices=("float32", "float16", "bfloat16"), default="float32",
+                        help="weights_precision of the project")
+    parser.add_argument("--output", type=str, default="sim_results.json", help="Path of the JSON results")
+    parser.add_argument("--workspace", type=str, default=None, help="Keep the simulated projects in this directory")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the data, the split and the initial weights")
+
+    main(parser.parse_args())
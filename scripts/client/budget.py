@@ -0,0 +1,127 @@
+import math
+import time
+
+import tensorflow as tf
+
+# Upper bound on epochs when training is limited by a budget and no epoch count was given
+MAX_BUDGET_EPOCHS = 1000
+
+
+def count_steps_per_epoch(train_data, num_samples, batch_size=32):
+    """Returns the number of batches per epoch of a tf.data dataset or a generator."""
+    try:
+        steps = len(train_data)
+    except (TypeError, ValueError):
+        steps = 0
+    return steps if steps > 0 else math.ceil(num_samples / batch_size)
+
+
+class TrainingBudget(tf.keras.callbacks.Callback):
+    """
+    Stops training once a wall-clock or step budget is used up.
+
+    The first warmup_steps batches measure how long a step takes (the very
+    first one, which traces the training function, is left out), and the
+    number of steps and epochs expected to fit is printed. Training stops
+    after the batch that reaches the step budget, or once the next step would
+    overrun the deadline. The step time keeps being re-estimated as a moving
+    average, so a slowdown ends training earlier instead of overrunning.
+
+    After training, samples_trained is the number of samples the stopped
+    training went through, counting partial epochs.
+    """
+
+    def __init__(self, num_samples, time_budget=None, step_budget=None, steps_per_epoch=None, warmup_steps=5,
+                 smoothing=0.1):
+        super().__init__()
+        self.num_samples = num_samples
+        self.time_budget = time_budget
+        self.step_budget = step_budget
+        self.steps_per_epoch = steps_per_epoch
+        self.warmup_steps = max(warmup_steps, 2)
+        self.smoothing = smoothing
+        self.started = None
+        self.last_step_end = None
+        self.step_seconds = None
+        self.steps = 0
+        self.epoch_steps = 0
+        self.epochs_completed = 0
+        self.planned_steps = None
+        self.stopped_by = None
+
+    def on_train_begin(self, logs=None):
+        self.started = time.perf_counter()
+        self.last_step_end = self.started
+        self.steps_per_epoch = self.steps_per_epoch or self.params.get('steps')
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_steps = 0
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.stopped_by is None:
+            self.epochs_completed += 1
+            self.epoch_steps = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        seconds = now - self.last_step_end
+        self.last_step_end = now
+        self.steps += 1
+        self.epoch_steps += 1
+
+        if self.steps == 2:
+            self.step_seconds = seconds
+        elif self.steps > 2:
+            self.step_seconds += self.smoothing * (seconds - self.step_seconds)
+
+        if self.steps == self.warmup_steps:
+            self.plan()
+
+        elapsed = now - self.started
+        if self.step_budget is not None and self.steps >= self.step_budget:
+            self.stop('steps')
+        elif self.time_budget is not None and self.step_seconds is not None \
+                and elapsed + self.step_seconds > self.time_budget:
+            self.stop('time')
+        elif self.time_budget is not None and elapsed >= self.time_budget:
+            self.stop('time')
+
+    def plan(self):
+        """Prints how many steps and epochs are expected to fit the budget."""
+        steps = self.step_budget
+        if self.time_budget is not None:
+            remaining = self.time_budget - (time.perf_counter() - self.started)
+            fit = self.steps + max(int(remaining / self.step_seconds), 0)
+            steps = fit if steps is None else min(steps, fit)
+        if self.steps_per_epoch and self.params.get('epochs'):
+            steps = min(steps, self.params['epochs'] * self.steps_per_epoch)
+        self.planned_steps = steps
+        epochs = f" ({steps / self.steps_per_epoch:.2f} epochs)" if self.steps_per_epoch else ""
+        print(f"Measured {self.step_seconds * 1000:.1f} ms per step. Planning {steps} steps{epochs} within the budget.")
+
+    def stop(self, reason):
+        self.stopped_by = reason
+        self.model.stop_training = True
+        print(f"Stopping training after {self.steps} steps: the {reason} budget is used up.")
+
+    @property
+    def epochs_trained(self):
+        """Completed epochs plus the fraction of the epoch training stopped in."""
+        if not self.steps_per_epoch:
+            return float(self.epochs_completed)
+        return self.epochs_completed + min(self.epoch_steps / self.steps_per_epoch, 1.0)
+
+    @property
+    def samples_trained(self):
+        return int(round(self.epochs_trained * self.num_samples))
+
+    def summary(self):
+        return {
+            'steps': self.steps,
+            'planned_steps': self.planned_steps,
+            'epochs_trained': self.epochs_trained,
+            'samples_trained': self.samples_trained,
+            'step_seconds': self.step_seconds,
+            'seconds': time.perf_counter() - self.started if self.started is not None else 0.0,
+            'stopped_by': self.stopped_by or 'epochs',
+        }
@@ -0,0 +1,159 @@
+import hashlib
+import os
+import random
+import time
+
+import requests
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Completing an upload aggregates the contribution on the server, which takes far longer than a chunk
+DEFAULT_COMPLETE_TIMEOUT = 600
+
+
+class UploadError(Exception):
+    """Raised when an upload cannot be completed within its retry budget."""
+
+    def __init__(self, message, status_code=500, response_text=''):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def upload_file(base_url, headers, path, sha1, fields=None, chunk_size=DEFAULT_CHUNK_SIZE, max_retries=8,
+                base_delay=0.5, max_delay=30.0, progress=None, timeout=60, complete_timeout=DEFAULT_COMPLETE_TIMEOUT):
+    """
+    Uploads a file in fixed-size, checksummed chunks, resuming from the last acknowledged offset.
+
+    The protocol, relative to base_url (e.g. http://host/project/<name>):
+        POST /uploads                          start or resume a session, returns {upload_id, received}
+        GET  /uploads/<id>                     returns {received}
+        PUT  /uploads/<id>/chunks/<index>      raw chunk with X-Chunk-Offset and X-Chunk-SHA1 headers
+        POST /uploads/<id>/complete            verifies the file and processes the contribution
+
+    Sessions are keyed by the file's SHA1, so a retried round resumes the bytes
+    a previous attempt already delivered. A failed chunk is retried with
+    exponential backoff, and after a dropped connection the offset is re-read
+    from the receiver, so at most one chunk per failure is sent again.
+
+    Completing is idempotent on the receiver, which keeps the result of a
+    completed upload. It is retried when the request fails to connect or gets
+    a 5xx status, and polled while the receiver answers 202. It is not retried
+    after a read timeout, since the receiver may still be aggregating; running
+    the upload again later returns the stored result.
+
+    Args:
+        base_url (str): URL of the project on the receiver.
+        headers (dict): Headers sent with every request, such as Authorization.
+        path (str): File to upload.
+        sha1 (str): SHA1 hash identifying the contribution.
+        fields (dict): Form fields passed along to the contribution, like num_samples.
+        chunk_size (int): Bytes per chunk.
+        max_retries (int): Consecutive failures tolerated before giving up.
+        base_delay (float): First backoff delay in seconds.
+        max_delay (float): Longest backoff delay in seconds.
+        progress (callable): Called with (bytes acknowledged, total bytes).
+        timeout (float): Timeout of each request in seconds.
+        complete_timeout (float): Timeout of the complete request in seconds.
+
+    Raises:
+        UploadError: If a request keeps failing, a chunk is rejected, or the
+            complete request times out (status 504).
+
+    Returns:
+        requests.Response: The response of the complete request.
+    """
+    size = os.path.getsize(path)
+    session = requests.Session()
+    session.headers.update(headers)
+
+    def request_with_retries(method, url, request_timeout=timeout, retry_read_timeout=True, **kwargs):
+        for attempt in range(max_retries + 1):
+            try:
+                response = session.request(method, url, timeout=request_timeout, **kwargs)
+                if response.status_code < 500:
+                    return response
+                error = f"status {response.status_code}"
+            except requests.ReadTimeout as e:
+                if not retry_read_timeout:
+                    raise UploadError(f"{method} {url} got no response within {request_timeout}s. The server may still "
+                                      f"be processing it, upload again to get its result.", 504, str(e))
+                error = str(e)
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt == max_retries:
+                raise UploadError(f"{method} {url} failed after {max_retries} retries: {error}")
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            print(f"{method} {url} failed ({error}). Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+    response = request_with_retries('POST', f"{base_url}/uploads", json=dict(
+        fields or {}, sha1=sha1, size=size, chunk_size=chunk_size
+    ))
+    if response.status_code != 200:
+        raise UploadError(f"Failed to start upload. Status: {response.status_code}", response.status_code, response.text)
+    upload_id = response.json()['upload_id']
+    received = response.json()['received']
+    if received:
+        print(f"Resuming upload {upload_id} at byte {received} of {size}.")
+    if progress:
+        progress(received, size)
+
+    failures = 0
+    with open(path, 'rb') as f:
+        while received < size:
+            f.seek(received)
+            chunk = f.read(chunk_size)
+            chunk_headers = {
+                'Content-Type': 'application/octet-stream',
+                'X-Chunk-Offset': str(received),
+                'X-Chunk-SHA1': hashlib.sha1(chunk).hexdigest(),
+            }
+            try:
+                response = session.put(
+                    f"{base_url}/uploads/{upload_id}/chunks/{received // chunk_size}",
+                    data=chunk,
+                    headers=chunk_headers,
+                    timeout=timeout
+                )
+            except requests.RequestException as e:
+                response = None
+                error = str(e)
+
+            if response is not None and response.status_code in (200, 409):
+                # 409 means the receiver holds a different offset than we sent, continue from its offset
+                received = response.json()['received']
+                failures = 0
+                if progress:
+                    progress(received, size)
+                continue
+            if response is not None and response.status_code < 500 and response.status_code != 400:
+                raise UploadError(f"Chunk rejected. Status: {response.status_code}", response.status_code, response.text)
+
+            error = error if response is None else f"status {response.status_code}: {response.text}"
+            failures += 1
+            if failures > max_retries:
+                raise UploadError(f"Upload {upload_id} failed at byte {received} after {max_retries} retries: {error}")
+            delay = backoff_delay(failures - 1, base_delay, max_delay)
+            print(f"Chunk at byte {received} failed ({error}). Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+            # The chunk may have arrived even if the acknowledgement did not
+            status = request_with_retries('GET', f"{base_url}/uploads/{upload_id}")
+            if status.status_code == 200:
+                received = status.json()['received']
+
+    complete_url = f"{base_url}/uploads/{upload_id}/complete"
+    for attempt in range(max_retries + 1):
+        response = request_with_retries('POST', complete_url, request_timeout=complete_timeout,
+                                        retry_read_timeout=False)
+        if response.status_code != 202 or attempt == max_retries:
+            return response
+        # An earlier complete request is still being processed
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        print(f"Upload {upload_id} is still being processed. Checking again in {delay:.1f}s.")
+        time.sleep(delay)
@@ -1,20 +1,40 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+import argparse
 import os
 import shutil
 import zipfile
 import hashlib
 import requests
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from flask_cors import CORS
 import json
+import uuid
 from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from tqdm import tqdm
 
+from budget import MAX_BUDGET_EPOCHS, TrainingBudget, count_steps_per_epoch
+from chunked_upload import UploadError, upload_file
+from compression import encode_update
+from dataset_cache import DatasetCache, save_and_hash
+from data_pipeline import build_dataset, build_generator, build_zip_dataset
+from image_settings import get_image_settings
+from jobs import JobManager, ProgressCallback
+from model_cache import ModelCache
+import metrics
+from precision import PRECISIONS, convert_weight_file, file_precision
+from timing import add_listener, span
+from weights_sync import apply_manifest, file_sha256, tensor_manifest
+
 app = Flask(__name__)
 CORS(app)
 
-def main(projectname, epochs):
+# Created from the command line options in __main__
+job_manager = None
+model_cache = None
+
+def main(projectname, epochs, train_info=None, loader_options=None, callbacks=None, model_cache=None, precision=None,
+         time_budget=None, step_budget=None):
+    dataset_cache = None
     try:
         # Define paths
         project_dir = os.path.join("projects", projectname)
@@ -38,70 +58,129 @@ def main(projectname, epochs):
             print(f"Model configuration file not found at {model_config_path}.")
             return
 
-        with open(model_config_path, 'r') as json_file:
-            model_json = json_file.read()
-        model = tf.keras.models.model_from_json(model_json)
-        print("Loaded model configuration from JSON.")
-
-        # Load model weights if they exist
-        if os.path.exists(model_weights_path):
-            model.load_weights(model_weights_path)
-            print(f"Loaded existing model weights from {model_weights_path}.")
+        if model_cache is not None:
+            # Reuses the compiled model and optimizer state of previous rounds
+            with span("load_model", project=projectname) as info:
+                model, cache_hit = model_cache.get(project_dir, model_config_path, model_weights_path)
+                info["cache_hit"] = cache_hit
+            print(f"Got {'cached' if cache_hit else 'new'} compiled model for {projectname}.")
         else:
-            print(f"No existing weights found at {model_weights_path}. Training from scratch.")
+            with span("load_config", project=projectname):
+                with open(model_config_path, 'r') as json_file:
+                    model_json = json_file.read()
+                model = tf.keras.models.model_from_json(model_json)
+            print("Loaded model configuration from JSON.")
+
+            # Load model weights if they exist
+            if os.path.exists(model_weights_path):
+                with span("load_weights", project=projectname, bytes=os.path.getsize(model_weights_path)):
+                    model.load_weights(model_weights_path)
+                print(f"Loaded existing model weights from {model_weights_path}.")
+            else:
+                print(f"No existing weights found at {model_weights_path}. Training from scratch.")
 
         # Prepare training data
         input_shape = model.input_shape[1:]  # Exclude batch dimension
         print(f"Model input shape: {input_shape}")
 
         # Determine color mode based on input shape
-        if len(input_shape) == 2:
-            img_height, img_width = input_shape
-            color_mode = 'grayscale'
-        elif len(input_shape) == 3:
-            img_height, img_width, channels = input_shape
-            color_mode = 'rgb' if channels == 3 else 'grayscale'
-        else:
-            raise ValueError(f"Invalid input shape: {input_shape}")
+        target_size, color_mode, channels = get_image_settings(input_shape)
+        img_height, img_width = target_size
 
         print(f"Using color mode: {color_mode}")
         print(f"Image target size: ({img_height}, {img_width})")
 
-        # Create ImageDataGenerator for loading images
-        datagen = ImageDataGenerator(rescale=1./255)
-
-        train_generator = datagen.flow_from_directory(
-            training_data_dir,
-            target_size=(img_height, img_width),
-            batch_size=32,
-            class_mode='categorical',
-            color_mode=color_mode
-        )
-        print("Initialized ImageDataGenerator and train generator.")
+        loader_options = loader_options or {}
+        loader = loader_options.get('loader', 'tfdata')
+        with span("build_dataset", project=projectname, loader=loader) as dataset_span:
+            if loader == 'generator':
+                train_data, data_info = build_generator(training_data_dir, target_size, color_mode)
+                print("Initialized ImageDataGenerator and train generator.")
+            elif loader_options.get('dataset_hash'):
+                cache = DatasetCache(limit_bytes=loader_options.get('cache_limit_mb', 2048) * 1024 * 1024)
+                train_data, data_info = cache.get_or_build(
+                    project_dir,
+                    loader_options['dataset_hash'],
+                    loader_options['zip_path'],
+                    target_size,
+                    channels,
+                    num_parallel_calls=loader_options.get('parallel_calls')
+                )
+                dataset_cache = cache
+                # The shards replace the zip until the dataset changes
+                if os.path.exists(loader_options['zip_path']):
+                    os.remove(loader_options['zip_path'])
+                print(f"Loaded {data_info['samples']} images in {len(data_info['class_indices'])} classes from the dataset cache.")
+            elif loader_options.get('zip_path'):
+                train_data, data_info = build_zip_dataset(
+                    loader_options['zip_path'],
+                    target_size,
+                    color_mode,
+                    cache=loader_options.get('cache', False),
+                    num_parallel_calls=loader_options.get('parallel_calls')
+                )
+                print(f"Streaming {data_info['samples']} images in {len(data_info['class_indices'])} classes from {loader_options['zip_path']}.")
+            else:
+                train_data, data_info = build_dataset(
+                    training_data_dir,
+                    target_size,
+                    color_mode,
+                    cache=loader_options.get('cache', False),
+                    num_parallel_calls=loader_options.get('parallel_calls')
+                )
+                print(f"Initialized tf.data pipeline with {data_info['samples']} images in {len(data_info['class_indices'])} classes.")
+            dataset_span['samples'] = data_info['samples']
 
         # Compile the model
-        model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-        print("Compiled the model.")
-
-        # Train the model
-        print(f"Starting training for {epochs} epochs...")
-        model.fit(train_generator, epochs=epochs)
+        if model_cache is None:
+            model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+            print("Compiled the model.")
+
+        # Train the model, for at most epochs epochs when limited by a time or step budget
+        budget = None
+        callbacks = list(callbacks or [])
+        if time_budget is not None or step_budget is not None:
+            budget = TrainingBudget(
+                data_info['samples'],
+                time_budget=time_budget,
+                step_budget=step_budget,
+                steps_per_epoch=count_steps_per_epoch(train_data, data_info['samples'])
+            )
+            callbacks.append(budget)
+            print(f"Starting training within a budget of {time_budget or '-'} seconds and {step_budget or '-'} steps, "
+                  f"at most {epochs} epochs...")
+        else:
+            print(f"Starting training for {epochs} epochs...")
+        with span("fit", project=projectname, epochs=epochs, samples=data_info['samples']) as info:
+            model.fit(train_data, epochs=epochs, callbacks=callbacks)
+            if budget is not None:
+                info.update(budget.summary())
         print("Training completed.")
 
         # Save the model weights to a temporary file
         temp_weights_path = os.path.join(contrib_dir, 'temp.weights.h5')
-        model.save_weights(temp_weights_path)
+        with span("save_weights", project=projectname) as info:
+            model.save_weights(temp_weights_path)
+            info["bytes"] = os.path.getsize(temp_weights_path)
         print(f"Saved temporary weights to {temp_weights_path}.")
 
+        # Store the weights in the project's precision before hashing, the server accumulates in float32
+        if precision and precision != 'float32':
+            with span("convert", project=projectname, precision=precision) as info:
+                info["bytes"] = convert_weight_file(temp_weights_path, temp_weights_path, precision)
+            print(f"Converted the weights to {precision} ({info['bytes']} bytes).")
+
         # Compute SHA1 hash of the weights file
-        sha1 = hashlib.sha1()
-        with open(temp_weights_path, 'rb') as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                sha1.update(chunk)
-        hash_hex = sha1.hexdigest()
+        with span("hash", project=projectname, bytes=os.path.getsize(temp_weights_path)) as info:
+            sha1 = hashlib.sha1()
+            with open(temp_weights_path, 'rb') as f:
+                while True:
+                    chunk = f.read(8192)
+                    if not chunk:
+                        break
+                    sha1.update(chunk)
+            hash_hex = sha1.hexdigest()
+            info["hash"] = hash_hex
         print(f"Computed SHA1 hash: {hash_hex}")
 
         # Rename the weights file with the SHA1 hash
@@ -110,11 +189,376 @@ def main(projectname, epochs):
         os.rename(temp_weights_path, final_weights_path)
         print(f"Renamed weights file to {final_weights_filename} and saved at {final_weights_path}.")
 
+        # Report what the server needs to weight this contribution. A budget may stop
+        # within the first epoch, then only the samples trained on count
+        if train_info is not None:
+            train_info['num_samples'] = data_info['samples']
+            if budget is not None:
+                train_info['budget'] = budget.summary()
+                train_info['num_samples'] = max(min(budget.samples_trained, data_info['samples']), 1)
+
         return hash_hex
 
     except Exception as e:
         print(f"An error occurred: {e}")
         return None
+    finally:
+        # Other jobs may evict the cached shards once training no longer reads them
+        if dataset_cache is not None:
+            dataset_cache.release(data_info['entry_dir'])
+
+def extract_dataset(file, project_dir, training_data_dir):
+    """Extracts an uploaded dataset zip into training_data_dir."""
+    # Create temporary directory for extraction
+    temp_extract_dir = os.path.join(project_dir, "temp_extract")
+    if os.path.exists(temp_extract_dir):
+        shutil.rmtree(temp_extract_dir)
+    os.makedirs(temp_extract_dir)
+
+    try:
+        # Extract zip file to temp directory
+        with zipfile.ZipFile(file, 'r') as zip_ref:
+            zip_ref.extractall(temp_extract_dir)
+        print("Extracted zip file successfully")
+
+        # Find the actual data directory (it should contain class folders)
+        extracted_contents = os.listdir(temp_extract_dir)
+        if len(extracted_contents) == 1:  # If there's only one item in the extracted folder
+            nested_dir = os.path.join(temp_extract_dir, extracted_contents[0])
+            if os.path.isdir(nested_dir):  # If it's a directory
+                # Remove existing training_data directory if it exists
+                if os.path.exists(training_data_dir):
+                    shutil.rmtree(training_data_dir)
+                
+                # Rename the nested directory to training_data
+                shutil.move(nested_dir, training_data_dir)
+                print("Moved nested directory to training_data")
+        else:
+            # If structure is different than expected, just move the temp directory
+            if os.path.exists(training_data_dir):
+                shutil.rmtree(training_data_dir)
+            shutil.move(temp_extract_dir, training_data_dir)
+            print("Moved extracted contents to training_data")
+
+    except Exception as e:
+        if os.path.exists(temp_extract_dir):
+            shutil.rmtree(temp_extract_dir)
+        raise Exception(f"Failed to process zip file: {str(e)}")
+    finally:
+        # Clean up temp directory if it still exists
+        if os.path.exists(temp_extract_dir):
+            shutil.rmtree(temp_extract_dir)
+
+def download_model_bundle(params, project_dir):
+    """
+    Downloads the full model zip and extracts model_config.json and model.weights.h5 into project_dir.
+
+    Returns:
+        tuple: (number of bytes downloaded, the version the server reports for the zip or None)
+    """
+    headers = {'Authorization': f'Bearer {params["token"]}'}
+    response = requests.get(f"{params['server_url']}/{params['project_name']}/model", headers=headers)
+    if response.status_code != 200:
+        raise Exception(f'Failed to download the model. Status: {response.status_code}. {response.text}')
+    zip_path = os.path.join(project_dir, f"model-{uuid.uuid4().hex}.zip")
+    try:
+        with open(zip_path, 'wb') as f:
+            f.write(response.content)
+        with zipfile.ZipFile(zip_path, 'r') as bundle:
+            for filename in ('model_config.json', 'model.weights.h5'):
+                temp_path = os.path.join(project_dir, f"{filename}.tmp")
+                with bundle.open(filename) as source, open(temp_path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                os.replace(temp_path, os.path.join(project_dir, filename))
+    finally:
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+    version = response.headers.get('X-Model-Version')
+    return len(response.content), int(version) if version else None
+
+def sync_global_weights(params, project_dir):
+    """
+    Brings the local global weights up to the server's latest version before training.
+
+    The server's weights manifest lists a SHA-256 hash per tensor. Only tensors
+    whose local hash differs are fetched, as a binary patch from the local
+    content when the server has one, and the assembled file is verified against
+    the manifest. Without local weights, or if they do not fit the manifest,
+    the full model is downloaded instead. version.txt records the version the
+    local weights hold.
+
+    Returns:
+        dict: The synced version and the number of bytes fetched, or None if the server has no manifest.
+    """
+    base_url = f"{params['server_url']}/{params['project_name']}/weights"
+    headers = {'Authorization': f'Bearer {params["token"]}'}
+    response = requests.get(f"{base_url}/manifest", headers=headers)
+    if response.status_code == 404:
+        print("Server has no weights manifest for this project. Training from the local weights.")
+        return None
+    if response.status_code != 200:
+        raise Exception(f'Failed to download the weights manifest. Status: {response.status_code}. {response.text}')
+    manifest = response.json()
+    fetched_bytes = len(response.content)
+
+    def fetch(blob_path):
+        blob_response = requests.get(f"{base_url}/{blob_path}", headers=headers)
+        if blob_response.status_code != 200:
+            raise Exception(f'Failed to download {blob_path}. Status: {blob_response.status_code}.')
+        return blob_response.content
+
+    model_config_path = os.path.join(project_dir, "model_config.json")
+    model_weights_path = os.path.join(project_dir, "model.weights.h5")
+    stats = None
+    if os.path.exists(model_weights_path) and os.path.exists(model_config_path) \
+            and file_sha256(model_config_path) == manifest.get('config_sha256'):
+        try:
+            stats = apply_manifest(model_weights_path, manifest, fetch)
+            fetched_bytes += stats['fetched_bytes']
+            print(f"Synced {stats['changed']} of {stats['tensors']} tensors ({stats['patched']} as patches, "
+                  f"{stats['fetched_bytes']} bytes) to version {manifest['version']}.")
+        except ValueError as e:
+            print(f"Could not sync the local weights: {e}")
+    version = manifest['version']
+    if stats is None:
+        bundle_bytes, bundle_version = download_model_bundle(params, project_dir)
+        fetched_bytes += bundle_bytes
+        local = tensor_manifest(model_weights_path)
+        if any(local.get(name, {}).get('sha256') != entry['sha256'] for name, entry in manifest['tensors'].items()):
+            # A new version was committed between the two requests
+            version = bundle_version
+        print(f"Downloaded the full model of version {version}.")
+
+    version_path = os.path.join(project_dir, "version.txt")
+    if version is None:
+        if os.path.exists(version_path):
+            os.remove(version_path)
+    else:
+        with open(f"{version_path}.tmp", 'w') as f:
+            f.write(f"{version}\n")
+        os.replace(f"{version_path}.tmp", version_path)
+    return {'version': version, 'fetched_bytes': fetched_bytes}
+
+def upload_progress_reporter(job):
+    """Returns a callback recording upload progress on the job, and on a console progress bar."""
+    progress = {'bar': None, 'last_event': 0}
+
+    def report(done, total):
+        if progress['bar'] is None:
+            progress['bar'] = tqdm(total=total, unit='B', unit_scale=True, desc='Uploading')
+        progress['bar'].update(done - progress['bar'].n)
+        job.upload = {'bytes': done, 'total': total}
+        # Emit at most one event per percent uploaded
+        if done == total or done - progress['last_event'] >= total / 100:
+            progress['last_event'] = done
+            job.emit('upload', **job.upload)
+        if done == total:
+            progress['bar'].close()
+
+    return report
+
+def upload_multipart(params, project_name, form_data, model_file_path, report_progress):
+    """Uploads the weights to /<project>/contribute in a single multipart request."""
+    with open(model_file_path, 'rb') as model_file:
+        form_data = dict(form_data, file=('model.h5', model_file, 'application/octet-stream'))
+
+        # Create MultipartEncoder
+        encoder = MultipartEncoder(fields=form_data)
+
+        # Callback function to update progress
+        def progress_callback(monitor):
+            report_progress(monitor.bytes_read, encoder.len)
+
+        # Create MultipartEncoderMonitor
+        encoder_monitor = MultipartEncoderMonitor(encoder, progress_callback)
+
+        # Set the headers
+        headers = {
+            'Authorization': f'Bearer {params["token"]}',
+            'Content-Type': encoder.content_type
+        }
+
+        # Construct the contribution URL
+        contribution_url = f"{params['server_url']}/{project_name}/contribute"
+
+        print(f"Uploading model to: {contribution_url}")
+        # Make the request to the Express server
+        return requests.post(
+            contribution_url,
+            data=encoder_monitor,
+            headers=headers
+        )
+
+def full_upload_required(response):
+    """Returns True if the server rejected a compressed update and asks for the full weights."""
+    try:
+        return bool(response.json().get('full_upload_required'))
+    except ValueError:
+        return False
+
+def train_and_upload(job, params):
+    """
+    Runs a queued training job: prepares the dataset, trains, and uploads the weights.
+
+    Args:
+        job (Job): The job to report progress to.
+        params (dict): Options parsed from the /train request.
+
+    Returns:
+        dict: The hash of the uploaded weights and the compression stats, if any.
+    """
+    project_name = params['project_name']
+    project_dir = os.path.join("projects", project_name)
+    contrib_dir = os.path.join(project_dir, "contrib")
+    training_data_dir = os.path.join(project_dir, "training_data")
+    upload_path = params['upload_path']
+    loader_options = params['loader_options']
+
+    # Clean up existing directories
+    if os.path.exists(contrib_dir):
+        shutil.rmtree(contrib_dir)
+    os.makedirs(contrib_dir, exist_ok=True)
+    print("Reset contrib directory")
+
+    try:
+        # Start from the current global model, fetching only what changed since the last round
+        if params['sync']:
+            job.set_stage('syncing')
+            with span("sync", project=project_name) as info:
+                synced = sync_global_weights(params, project_dir)
+                if synced is not None:
+                    info.update(version=synced['version'], bytes=synced['fetched_bytes'])
+
+        # Read the dataset straight from the zip unless the old loader needs it extracted
+        if params['extract'] or loader_options['loader'] == 'generator':
+            job.set_stage('extracting')
+            with span("extract", project=project_name, bytes=os.path.getsize(upload_path)):
+                extract_dataset(upload_path, project_dir, training_data_dir)
+        else:
+            loader_options['zip_path'] = upload_path
+            if params['use_dataset_cache']:
+                loader_options['dataset_hash'] = params['dataset_hash']
+
+        # Upload in the precision the global weights are distributed in, unless asked for another one
+        precision = params['precision']
+        base_weights_path = os.path.join(project_dir, "model.weights.h5")
+        if precision == 'auto':
+            precision = file_precision(base_weights_path) if os.path.exists(base_weights_path) else 'float32'
+
+        # Run training
+        job.set_stage('training')
+        train_info = {}
+        result_hash = main(project_name, params['epochs'], train_info, loader_options,
+                           callbacks=[ProgressCallback(job)], model_cache=model_cache, precision=precision,
+                           time_budget=params['time_budget'], step_budget=params['step_budget'])
+        if not result_hash:
+            raise Exception('Training failed')
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+    # Prepare to send the model file to Express server
+    model_file_path = os.path.join(contrib_dir, f"{result_hash}.weights.h5")
+    if not os.path.exists(model_file_path):
+        raise Exception('Model file not found after training')
+
+    # Prepare the form fields and files
+    form_data = {
+        'sha1': result_hash,
+        'num_samples': str(train_info.get('num_samples', 0)),
+    }
+
+    # Send only the compressed difference from the global weights when asked to
+    compression = params['compression']
+    compression_stats = None
+    if compression != 'none' and not os.path.exists(base_weights_path):
+        print("No base weights to compute an update from. Uploading full weights.")
+    elif compression != 'none':
+        job.set_stage('compressing')
+        update_path = os.path.join(contrib_dir, f"{result_hash}.update.h5")
+        residual_path = os.path.join(project_dir, "residual.npz") if params['error_feedback'] else None
+        with span("compress", project=project_name, hash=result_hash, quantization=compression) as info:
+            compression_stats = encode_update(
+                base_weights_path,
+                model_file_path,
+                update_path,
+                quantization=compression,
+                topk_ratio=params['topk'],
+                residual_path=residual_path
+            )
+            info["bytes"] = compression_stats['update_bytes']
+        print(f"Compressed update: {compression_stats['full_bytes']} -> {compression_stats['update_bytes']} bytes "
+              f"(ratio {compression_stats['compression_ratio']:.1f}x, "
+              f"relative error {compression_stats['relative_error']:.4f})")
+        model_file_path = update_path
+        form_data['encoding'] = 'update'
+        form_data['compression_ratio'] = f"{compression_stats['compression_ratio']:.4f}"
+        form_data['reconstruction_error'] = f"{compression_stats['relative_error']:.6f}"
+
+    # Report the global model version the weights were trained from, if known
+    version_path = os.path.join(project_dir, "version.txt")
+    if os.path.exists(version_path):
+        with open(version_path, 'r') as f:
+            form_data['base_version'] = f.read().strip()
+
+    job.set_stage('uploading')
+    report_progress = upload_progress_reporter(job)
+    response = None
+    upload_bytes = os.path.getsize(model_file_path)
+    if params['chunked_upload']:
+        project_url = f"{params['server_url']}/{project_name}"
+        print(f"Uploading model in chunks to: {project_url}/uploads")
+        try:
+            with span("upload", project=project_name, hash=result_hash, bytes=upload_bytes, method="chunked"):
+                response = upload_file(
+                    project_url,
+                    {'Authorization': f'Bearer {params["token"]}'},
+                    model_file_path,
+                    result_hash,
+                    fields=form_data,
+                    progress=report_progress
+                )
+        except UploadError as e:
+            if e.status_code != 404:
+                raise
+            print("Server does not support chunked uploads. Falling back to a single request.")
+
+    if response is None:
+        with span("upload", project=project_name, hash=result_hash, bytes=upload_bytes, method="multipart"):
+            response = upload_multipart(params, project_name, form_data, model_file_path, report_progress)
+
+    # The server no longer keeps the version the update was computed from and asks for the full weights
+    if response.status_code == 409 and form_data.get('encoding') == 'update' and full_upload_required(response):
+        print("Server cannot decode the update against its base version. Uploading the full weights.")
+        for field in ('encoding', 'compression_ratio', 'reconstruction_error'):
+            form_data.pop(field)
+        # The carried-over residual assumed the update was applied
+        if params['error_feedback'] and os.path.exists(os.path.join(project_dir, "residual.npz")):
+            os.remove(os.path.join(project_dir, "residual.npz"))
+        model_file_path = os.path.join(contrib_dir, f"{result_hash}.weights.h5")
+        compression_stats = None
+        with span("upload", project=project_name, hash=result_hash, bytes=os.path.getsize(model_file_path), method="multipart"):
+            response = upload_multipart(params, project_name, form_data, model_file_path, report_progress)
+
+    if response.status_code != 200:
+        raise Exception(f'Failed to upload model to server. Status: {response.status_code}. {response.text}')
+
+    return {
+        'hash': result_hash,
+        'compression': compression_stats,
+        'budget': train_info.get('budget'),
+        'message': 'Training and upload successful'
+    }
+
+def run_training_job(job, params):
+    """Runs train_and_upload and counts the job's outcome for /metrics."""
+    try:
+        result = train_and_upload(job, params)
+    except Exception:
+        metrics.jobs_total.inc(status='failed')
+        raise
+    metrics.jobs_total.inc(status='succeeded')
+    return result
 
 @app.route('/train', methods=['POST'])
 def train():
@@ -130,7 +574,28 @@ def train():
         token = request.form.get('token')
         server_url = request.form.get('url')  # This should be like http://localhost:3000
         project_name = request.form.get('projectName')
-        epochs = int(request.form.get('epochs', 1))
+        # A time budget in seconds or a step budget bounds training, epochs is then the upper limit
+        time_budget = float(request.form['time_budget']) if request.form.get('time_budget') else None
+        step_budget = int(request.form['step_budget']) if request.form.get('step_budget') else None
+        if request.form.get('epochs'):
+            epochs = int(request.form['epochs'])
+        else:
+            epochs = MAX_BUDGET_EPOCHS if time_budget is not None or step_budget is not None else 1
+        compression = request.form.get('compression', 'none')  # none, int8 or stochastic
+        topk = request.form.get('topk')  # Fraction of each tensor to upload, e.g. 0.01
+        loader_options = {
+            'loader': request.form.get('loader', 'tfdata'),  # tfdata or generator
+            'cache': request.form.get('cache', 'false').lower() == 'true',
+            'parallel_calls': int(request.form['parallel_calls']) if request.form.get('parallel_calls') else None,
+            'cache_limit_mb': int(request.form.get('cache_limit_mb', 2048))
+        }
+
+        if compression not in ('none', 'int8', 'stochastic'):
+            return jsonify({'error': f'Unsupported compression: {compression}'}), 400
+
+        precision = request.form.get('precision', 'auto')  # auto, float32, float16 or bfloat16
+        if precision != 'auto' and precision not in PRECISIONS:
+            return jsonify({'error': f'Unsupported precision: {precision}'}), 400
 
         if not all([token, server_url, project_name]):
             return jsonify({'error': 'Missing required fields (token, url, or projectName)'}), 400
@@ -141,7 +606,7 @@ def train():
         # Define directory paths
         project_dir = os.path.join("projects", project_name)
         contrib_dir = os.path.join(project_dir, "contrib")
-        training_data_dir = os.path.join(project_dir, "training_data")
+        uploads_dir = os.path.join(project_dir, "uploads")
         model_config_path = os.path.join(project_dir, "model_config.json")
 
         # Create project directory if it doesn't exist
@@ -168,117 +633,93 @@ def train():
                 f.write(response.text)
             print(f"Downloaded and saved model_config.json to {model_config_path}")
 
-        # Clean up existing directories
-        if os.path.exists(contrib_dir):
-            shutil.rmtree(contrib_dir)
-        os.makedirs(contrib_dir, exist_ok=True)
-        print("Reset contrib directory")
-
-        # Create temporary directory for extraction
-        temp_extract_dir = os.path.join(project_dir, "temp_extract")
-        if os.path.exists(temp_extract_dir):
-            shutil.rmtree(temp_extract_dir)
-        os.makedirs(temp_extract_dir)
-
-        try:
-            # Extract zip file to temp directory
-            with zipfile.ZipFile(file, 'r') as zip_ref:
-                zip_ref.extractall(temp_extract_dir)
-            print("Extracted zip file successfully")
-
-            # Find the actual data directory (it should contain class folders)
-            extracted_contents = os.listdir(temp_extract_dir)
-            if len(extracted_contents) == 1:  # If there's only one item in the extracted folder
-                nested_dir = os.path.join(temp_extract_dir, extracted_contents[0])
-                if os.path.isdir(nested_dir):  # If it's a directory
-                    # Remove existing training_data directory if it exists
-                    if os.path.exists(training_data_dir):
-                        shutil.rmtree(training_data_dir)
-                    
-                    # Rename the nested directory to training_data
-                    shutil.move(nested_dir, training_data_dir)
-                    print("Moved nested directory to training_data")
-            else:
-                # If structure is different than expected, just move the temp directory
-                if os.path.exists(training_data_dir):
-                    shutil.rmtree(training_data_dir)
-                shutil.move(temp_extract_dir, training_data_dir)
-                print("Moved extracted contents to training_data")
-
-        except Exception as e:
-            if os.path.exists(temp_extract_dir):
-                shutil.rmtree(temp_extract_dir)
-            raise Exception(f"Failed to process zip file: {str(e)}")
-        finally:
-            # Clean up temp directory if it still exists
-            if os.path.exists(temp_extract_dir):
-                shutil.rmtree(temp_extract_dir)
-
-        # Run training
-        result_hash = main(project_name, epochs)
-        if not result_hash:
-            return jsonify({'error': 'Training failed'}), 500
-
-        # Prepare to send the model file to Express server
-        model_file_path = os.path.join(contrib_dir, f"{result_hash}.weights.h5")
-        if not os.path.exists(model_file_path):
-            return jsonify({'error': 'Model file not found after training'}), 500
-
-        # Prepare the form fields and files
-        form_data = {
-            'sha1': result_hash,
-            'file': ('model.h5', open(model_file_path, 'rb'), 'application/octet-stream')
-        }
-
-        # Create MultipartEncoder
-        encoder = MultipartEncoder(fields=form_data)
-
-        # Create a progress bar
-        progress = tqdm(total=encoder.len, unit='B', unit_scale=True, desc='Uploading')
-
-        # Callback function to update progress bar
-        def progress_callback(monitor):
-            progress.update(monitor.bytes_read - progress.n)
-
-        # Create MultipartEncoderMonitor
-        encoder_monitor = MultipartEncoderMonitor(encoder, progress_callback)
-
-        # Set the headers
-        headers = {
-            'Authorization': f'Bearer {token}',
-            'Content-Type': encoder.content_type
+        # Keep the uploaded dataset until its job runs, the request stream closes when we return
+        os.makedirs(uploads_dir, exist_ok=True)
+        upload_path = os.path.join(uploads_dir, f"{uuid.uuid4().hex}.zip")
+        dataset_hash = save_and_hash(file, upload_path)
+        print(f"Saved dataset zip to {upload_path} (SHA1 {dataset_hash})")
+
+        params = {
+            'project_name': project_name,
+            'token': token,
+            'server_url': server_url,
+            'epochs': epochs,
+            'time_budget': time_budget,
+            'step_budget': step_budget,
+            'compression': compression,
+            'precision': precision,
+            'topk': float(topk) if topk else None,
+            'error_feedback': request.form.get('error_feedback', 'true').lower() == 'true',
+            'loader_options': loader_options,
+            'extract': request.form.get('extract', 'false').lower() == 'true',
+            'use_dataset_cache': request.form.get('dataset_cache', 'true').lower() == 'true',
+            'chunked_upload': request.form.get('chunked_upload', 'true').lower() == 'true',
+            'sync': request.form.get('sync', 'true').lower() == 'true',
+            'upload_path': upload_path,
+            'dataset_hash': dataset_hash,
         }
-
-        # Construct the contribution URL
-        contribution_url = f"{server_url}/{project_name}/contribute"
-
-        print(f"Uploading model to: {contribution_url}")
-        # Make the request to the Express server
-        try:
-            response = requests.post(
-                contribution_url,
-                data=encoder_monitor,
-                headers=headers
-            )
-            progress.close()
-            if response.status_code != 200:
-                return jsonify({
-                    'error': f'Failed to upload model to server. Status: {response.status_code}',
-                    'server_response': response.text
-                }), response.status_code
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            progress.close()
-            return jsonify({'error': str(e)}), 500
+        job = job_manager.submit(project_name, run_training_job, params)
 
         return jsonify({
-            'hash': result_hash,
-            'message': 'Training and upload successful'
-        }), 200
+            'job_id': job.id,
+            'status_url': f"/jobs/{job.id}",
+            'message': 'Training job queued'
+        }), 202
 
     except Exception as e:
         print(e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Training and upload counters and latency histograms in the Prometheus text format."""
+    jobs = job_manager.list()
+    metrics.jobs_in_progress.set(sum(job['status'] in ('queued', 'running') for job in jobs))
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': job_manager.list()}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.snapshot()), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Streams the job's progress events as server-sent events until it finishes."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def stream():
+        after = int(request.args.get('after', 0))
+        while True:
+            events = job.wait_for_events(after)
+            for event in events:
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            after += len(events)
+            if job.is_done() and after >= len(job.events):
+                return
+            if not events:
+                # Keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream')
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=4000, debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="FedLearn training client")
+    parser.add_argument("--cpu-slots", type=int, default=os.cpu_count() or 1, help="CPU cores available to training jobs")
+    parser.add_argument("--threads-per-job", type=int, default=2, help="TensorFlow threads (CPU slots) used by each job")
+    parser.add_argument("--max-cached-models", type=int, default=4, help="Projects whose compiled model is kept in memory, 0 to disable")
+    parser.add_argument("--debug", action="store_true", help="Run Flask in debug mode, without the reloader")
+
+    args = parser.parse_args()
+    job_manager = JobManager(args.cpu_slots, min(args.threads_per_job, args.cpu_slots))
+    add_listener(metrics.observe_span)
+    model_cache = ModelCache(args.max_cached_models) if args.max_cached_models > 0 else None
+    # The reloader would run this block again in a child process, starting a second job manager and model cache
+    app.run(host='0.0.0.0', port=4000, debug=args.debug, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+
+import h5py
+import numpy as np
+
+UPDATE_FORMAT = "fedlearn-update-v1"
+
+
+def list_float_datasets(weights_path):
+    """Returns the names of the floating point tensors in a .weights.h5 file."""
+    names = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and np.issubdtype(obj.dtype, np.floating):
+            names.append(name)
+
+    with h5py.File(weights_path, "r") as f:
+        f.visititems(visit)
+    return sorted(names)
+
+
+def load_residual(residual_path):
+    if residual_path is None or not os.path.exists(residual_path):
+        return {}
+    with np.load(residual_path) as residual:
+        return {name: residual[name] for name in residual.files}
+
+
+def quantize(values, quantization, rng):
+    """
+    Quantizes values to int8 with one scale per tensor.
+
+    'int8' rounds to the nearest level, 'stochastic' rounds up or down with a
+    probability proportional to the distance, which keeps the rounding unbiased.
+    """
+    max_abs = float(np.max(np.abs(values))) if values.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0 else 1.0
+    scaled = values / scale
+    if quantization == "stochastic":
+        scaled = np.floor(scaled + rng.random(scaled.shape, dtype=np.float32))
+    else:
+        scaled = np.rint(scaled)
+    return np.clip(scaled, -127, 127).astype(np.int8), scale
+
+
+def encode_update(base_weights_path, trained_weights_path, output_path, quantization="int8",
+                  topk_ratio=None, residual_path=None, seed=None):
+    """
+    Encodes the difference between trained and base weights as a compressed update file.
+
+    Every tensor's delta (plus the residual left over from the previous upload,
+    when error feedback is enabled) is optionally sparsified to its top-k entries
+    by magnitude and quantized to int8. The part of the delta that was not sent
+    is saved as the new residual and added to the next upload.
+
+    Args:
+        base_weights_path (str): Global weights the training started from.
+        trained_weights_path (str): Weights after local training.
+        output_path (str): Path of the update file to write.
+        quantization (str): 'int8' or 'stochastic'.
+        topk_ratio (float): Fraction of entries to keep per tensor, None to keep all.
+        residual_path (str): .npz file holding the error feedback residual, None to disable it.
+        seed (int): Seed for stochastic rounding.
+
+    Returns:
+        dict: Compression ratio and reconstruction error of the upload.
+    """
+    if quantization not in ("int8", "stochastic"):
+        raise ValueError(f"Unsupported quantization: {quantization}")
+
+    rng = np.random.default_rng(seed)
+    residual = load_residual(residual_path)
+    new_residual = {}
+    squared_error = 0.0
+    squared_norm = 0.0
+    max_error = 0.0
+
+    with h5py.File(base_weights_path, "r") as base, \
+            h5py.File(trained_weights_path, "r") as trained, \
+            h5py.File(output_path, "w") as out:
+        out.attrs["format"] = UPDATE_FORMAT
+        out.attrs["quantization"] = quantization
+        for name in list_float_datasets(trained_weights_path):
+            delta = trained[name][()].astype(np.float32) - base[name][()].astype(np.float32)
+            if name in residual and residual[name].shape == delta.shape:
+                delta += residual[name]
+            flat = delta.ravel()
+
+            group = out.create_group(name)
+            group.attrs["shape"] = delta.shape
+            if topk_ratio is not None and 0 < topk_ratio < 1 and flat.size > 1:
+                k = max(int(np.ceil(flat.size * topk_ratio)), 1)
+                indices = np.argpartition(np.abs(flat), flat.size - k)[flat.size - k:]
+                indices.sort()
+                group.create_dataset("indices", data=indices.astype(np.uint32), compression="gzip")
+            else:
+                indices = None
+
+            values = flat if indices is None else flat[indices]
+            quantized, scale = quantize(values, quantization, rng)
+            group.create_dataset("values", data=quantized, compression="gzip")
+            group.attrs["scale"] = scale
+
+            reconstructed = np.zeros_like(flat)
+            if indices is None:
+                reconstructed[:] = quantized.astype(np.float32) * scale
+            else:
+                reconstructed[indices] = quantized.astype(np.float32) * scale
+            error = flat - reconstructed
+            new_residual[name] = error.reshape(delta.shape)
+
+            squared_error += float(np.dot(error, error))
+            squared_norm += float(np.dot(flat, flat))
+            if error.size:
+                max_error = max(max_error, float(np.max(np.abs(error))))
+
+    if residual_path is not None:
+        np.savez(residual_path, **new_residual)
+
+    full_size = os.path.getsize(trained_weights_path)
+    update_size = os.path.getsize(output_path)
+    return {
+        "full_bytes": full_size,
+        "update_bytes": update_size,
+        "compression_ratio": full_size / update_size if update_size else 0.0,
+        "relative_error": float(np.sqrt(squared_error / squared_norm)) if squared_norm > 0 else 0.0,
+        "max_abs_error": max_error,
+    }
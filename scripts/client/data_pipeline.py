@@ -0,0 +1,305 @@
+import argparse
+import io
+import os
+import random
+import time
+import zipfile
+
+import numpy as np
+import tensorflow as tf
+
+from image_settings import IMAGE_EXTENSIONS
+
+# First two bytes of the TIFF and PNM (.ppm) files tf.io.decode_image cannot read
+PIL_ONLY_HEADERS = (b'II', b'MM', b'P1', b'P2', b'P3', b'P4', b'P5', b'P6')
+
+
+def list_image_files(directory):
+    """
+    Lists the images of a class-per-folder dataset the same way flow_from_directory does.
+
+    Classes are the sorted subdirectory names and their index is their position
+    in that order. Images are collected recursively within each class folder.
+
+    Args:
+        directory (str): Dataset root containing one folder per class.
+
+    Returns:
+        tuple: (list of file paths, list of class indices, dict of class name to index)
+    """
+    class_names = sorted(
+        name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))
+    )
+    class_indices = {name: index for index, name in enumerate(class_names)}
+
+    file_paths = []
+    labels = []
+    for class_name in class_names:
+        class_dir = os.path.join(directory, class_name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    file_paths.append(os.path.join(root, filename))
+                    labels.append(class_indices[class_name])
+    return file_paths, labels, class_indices
+
+
+def list_zip_images(zip_file):
+    """
+    Lists the images of a zipped class-per-folder dataset from the zip's central directory.
+
+    Like the extraction /train used to do, a single top-level folder is treated
+    as the dataset root. Classes and indices follow flow_from_directory: every
+    folder in the root is a class, including folders without images, which
+    zips only record as directory entries.
+
+    Args:
+        zip_file (zipfile.ZipFile): Open zip archive.
+
+    Returns:
+        tuple: (list of member names, list of class indices, dict of class name to index)
+    """
+    infos = [info for info in zip_file.infolist() if not info.filename.startswith('__MACOSX/')]
+    names = [info.filename for info in infos if not info.is_dir()]
+
+    # Folders, whether stored as entries of their own or only implied by the paths of their files
+    directories = {info.filename.rstrip('/') for info in infos if info.is_dir()}
+    for name in names:
+        parts = name.split('/')[:-1]
+        directories.update('/'.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+
+    top_level = {name.split('/', 1)[0] for name in names} | {name.split('/', 1)[0] for name in directories}
+    prefix = ''
+    if len(top_level) == 1 and next(iter(top_level)) in directories:
+        prefix = f"{next(iter(top_level))}/"
+
+    class_names = sorted(
+        name[len(prefix):] for name in directories
+        if name.startswith(prefix) and name[len(prefix):] and '/' not in name[len(prefix):]
+    )
+    class_indices = {name: index for index, name in enumerate(class_names)}
+
+    files_by_class = {}
+    for name in names:
+        relative = name[len(prefix):]
+        if '/' not in relative or not relative.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        files_by_class.setdefault(relative.split('/', 1)[0], []).append(name)
+
+    member_names = []
+    labels = []
+    for class_name, index in class_indices.items():
+        for name in sorted(files_by_class.get(class_name, [])):
+            member_names.append(name)
+            labels.append(index)
+    return member_names, labels, class_indices
+
+
+def decode_with_pil(encoded, channels):
+    """Decodes an image with PIL like load_img does, for the formats TensorFlow has no decoder for."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(encoded)) as image:
+        image = image.convert('RGB' if channels == 3 else 'L')
+        array = np.asarray(image, dtype=np.uint8)
+    return array.reshape(array.shape[0], array.shape[1], channels)
+
+
+def decode_image(encoded, channels, target_size):
+    """Decodes an encoded image into a uint8 tensor of the target size."""
+    header = tf.strings.substr(encoded, 0, 2)
+    needs_pil = tf.reduce_any(tf.equal(header, tf.constant(PIL_ONLY_HEADERS)))
+    image = tf.cond(
+        needs_pil,
+        lambda: tf.py_function(lambda data: decode_with_pil(data.numpy(), channels), [encoded], tf.uint8),
+        lambda: tf.io.decode_image(encoded, channels=channels, expand_animations=False)
+    )
+    image.set_shape([None, None, channels])
+    # flow_from_directory resizes with nearest neighbour interpolation by default,
+    # which also keeps the uint8 dtype
+    return tf.image.resize(image, target_size, method='nearest')
+
+
+def zip_member_dataset(zip_path, member_names, labels, shuffle=False, seed=None):
+    """
+    Returns a dataset of (encoded image, class index) pairs read on demand from a zip.
+
+    With shuffle the member order is reshuffled every epoch.
+    """
+    rng = random.Random(seed)
+
+    def read_members():
+        order = list(range(len(member_names)))
+        if shuffle:
+            rng.shuffle(order)
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            for index in order:
+                yield zip_file.read(member_names[index]), labels[index]
+
+    return tf.data.Dataset.from_generator(
+        read_members,
+        output_signature=(tf.TensorSpec(shape=(), dtype=tf.string), tf.TensorSpec(shape=(), dtype=tf.int32))
+    )
+
+
+def decode_and_batch(dataset, num_samples, num_classes, target_size, color_mode, batch_size, shuffle,
+                     cache, num_parallel_calls, seed):
+    """
+    Decodes a dataset of (encoded image, class index) pairs in parallel and batches it.
+
+    Images are resized, scaled to [0, 1] and one-hot labelled, matching what
+    ImageDataGenerator(rescale=1./255).flow_from_directory(class_mode='categorical') yields.
+    Without caching the input is expected to be shuffled already, so the shuffle
+    buffer never holds decoded images.
+    """
+    channels = 3 if color_mode == 'rgb' else 1
+    parallel_calls = num_parallel_calls or tf.data.AUTOTUNE
+
+    def decode(encoded, label):
+        image = decode_image(encoded, channels, target_size)
+        image = tf.cast(image, tf.float32) / 255.0
+        return image, tf.one_hot(label, num_classes)
+
+    dataset = dataset.map(decode, num_parallel_calls=parallel_calls, deterministic=not shuffle)
+    if cache:
+        dataset = dataset.cache()
+        if shuffle:
+            dataset = dataset.shuffle(num_samples, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def build_dataset(directory, target_size, color_mode, batch_size=32, shuffle=True, cache=False,
+                  num_parallel_calls=None, seed=None):
+    """
+    Builds a parallel tf.data pipeline over a class-per-folder image dataset.
+
+    Args:
+        directory (str): Dataset root containing one folder per class.
+        target_size (tuple): (height, width) to resize images to.
+        color_mode (str): 'rgb' or 'grayscale'.
+        batch_size (int): Number of images per batch.
+        shuffle (bool): Reshuffle the images every epoch.
+        cache (bool): Keep decoded images in memory after the first epoch.
+        num_parallel_calls (int): Parallel decode calls, None lets tf.data tune it.
+        seed (int): Shuffle seed.
+
+    Returns:
+        tuple: (tf.data.Dataset, dict with 'samples' and 'class_indices')
+    """
+    file_paths, labels, class_indices = list_image_files(directory)
+    if not file_paths:
+        raise ValueError(f"No images found in {directory}.")
+
+    dataset = tf.data.Dataset.from_tensor_slices((file_paths, labels))
+    if shuffle and not cache:
+        dataset = dataset.shuffle(len(file_paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(lambda path, label: (tf.io.read_file(path), label),
+                          num_parallel_calls=num_parallel_calls or tf.data.AUTOTUNE, deterministic=not shuffle)
+    dataset = decode_and_batch(dataset, len(file_paths), len(class_indices), target_size, color_mode,
+                               batch_size, shuffle, cache, num_parallel_calls, seed)
+
+    return dataset, {'samples': len(file_paths), 'class_indices': class_indices}
+
+
+def build_zip_dataset(zip_path, target_size, color_mode, batch_size=32, shuffle=True, cache=False,
+                      num_parallel_calls=None, seed=None):
+    """
+    Builds a tf.data pipeline that reads images straight out of a zipped dataset.
+
+    Nothing is extracted to disk: members are read from the archive on demand
+    and decoded in parallel by tf.data.
+
+    Args:
+        zip_path (str): Path to the dataset zip.
+        target_size (tuple): (height, width) to resize images to.
+        color_mode (str): 'rgb' or 'grayscale'.
+        batch_size (int): Number of images per batch.
+        shuffle (bool): Reshuffle the images every epoch.
+        cache (bool): Keep decoded images in memory after the first epoch.
+        num_parallel_calls (int): Parallel decode calls, None lets tf.data tune it.
+        seed (int): Shuffle seed.
+
+    Returns:
+        tuple: (tf.data.Dataset, dict with 'samples' and 'class_indices')
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        member_names, labels, class_indices = list_zip_images(zip_file)
+    if not member_names:
+        raise ValueError(f"No images found in {zip_path}.")
+
+    dataset = zip_member_dataset(zip_path, member_names, labels, shuffle=shuffle and not cache, seed=seed)
+    dataset = decode_and_batch(dataset, len(member_names), len(class_indices), target_size, color_mode,
+                               batch_size, shuffle, cache, num_parallel_calls, seed)
+
+    return dataset, {'samples': len(member_names), 'class_indices': class_indices}
+
+
+def build_generator(directory, target_size, color_mode, batch_size=32, shuffle=True):
+    """Builds the ImageDataGenerator loader the client used before, for comparison."""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    datagen = ImageDataGenerator(rescale=1./255)
+    generator = datagen.flow_from_directory(
+        directory,
+        target_size=target_size,
+        batch_size=batch_size,
+        class_mode='categorical',
+        color_mode=color_mode,
+        shuffle=shuffle
+    )
+    return generator, {'samples': generator.samples, 'class_indices': generator.class_indices}
+
+
+def measure_throughput(batches, num_batches):
+    """Returns images/sec over num_batches batches of an iterable loader."""
+    images = 0
+    start = time.perf_counter()
+    for index, (x, _) in enumerate(batches):
+        if index >= num_batches:
+            break
+        images += int(x.shape[0])
+    elapsed = time.perf_counter() - start
+    return images / elapsed if elapsed > 0 else 0.0
+
+
+def compare_loaders(directory, target_size, color_mode, batch_size=32, epochs=2):
+    """
+    Measures images/sec of the ImageDataGenerator loader and of tf.data with and without caching.
+
+    Args:
+        directory (str): Dataset root containing one folder per class.
+        target_size (tuple): (height, width) to resize images to.
+        color_mode (str): 'rgb' or 'grayscale'.
+        batch_size (int): Number of images per batch.
+        epochs (int): Passes over the dataset per loader, so caching shows up.
+
+    Returns:
+        dict: Loader name to images/sec.
+    """
+    results = {}
+
+    generator, info = build_generator(directory, target_size, color_mode, batch_size)
+    num_batches = len(generator) * epochs
+    results['generator'] = measure_throughput(generator, num_batches)
+
+    for name, cache in (('tfdata', False), ('tfdata_cache', True)):
+        dataset, dataset_info = build_dataset(directory, target_size, color_mode, batch_size, cache=cache)
+        if dataset_info['class_indices'] != info['class_indices']:
+            raise ValueError("tf.data class indices differ from flow_from_directory.")
+        results[name] = measure_throughput(dataset.repeat(epochs), num_batches)
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the throughput of the training data loaders")
+    parser.add_argument("directory", type=str, help="Dataset root containing one folder per class")
+    parser.add_argument("--height", type=int, default=28, help="Target image height")
+    parser.add_argument("--width", type=int, default=28, help="Target image width")
+    parser.add_argument("--color-mode", type=str, default="grayscale", choices=["grayscale", "rgb"], help="Color mode")
+    parser.add_argument("--batch-size", type=int, default=32, help="Batch size")
+    parser.add_argument("--epochs", type=int, default=2, help="Passes over the dataset per loader")
+
+    args = parser.parse_args()
+    results = compare_loaders(args.directory, (args.height, args.width), args.color_mode, args.batch_size, args.epochs)
+    for name, images_per_second in results.items():
+        print(f"{name}: {images_per_second:.1f} images/sec")
@@ -0,0 +1,260 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+import numpy as np
+import tensorflow as tf
+
+from data_pipeline import decode_image, list_zip_images, zip_member_dataset
+
+CACHE_DIRNAME = "dataset_cache"
+SHARD_SIZE = 4096
+
+# Entries that training jobs of this process are reading, by absolute path, with a
+# lock per entry so concurrent jobs never build the same entry twice. Jobs only
+# read their shards lazily during fit, so eviction skips pinned entries
+_pins = {}
+_entry_locks = {}
+_registry_lock = threading.Lock()
+
+
+def save_and_hash(file, path):
+    """
+    Saves an uploaded file and returns the SHA1 of its content, in a single pass.
+
+    Args:
+        file: File-like object, such as the uploaded werkzeug FileStorage.
+        path (str): Where to save it.
+
+    Returns:
+        str: SHA1 hex digest of the content.
+    """
+    sha1 = hashlib.sha1()
+    stream = getattr(file, 'stream', file)
+    with open(path, 'wb') as out:
+        while True:
+            chunk = stream.read(1024 * 1024)
+            if not chunk:
+                break
+            sha1.update(chunk)
+            out.write(chunk)
+    return sha1.hexdigest()
+
+
+class DatasetCache:
+    """
+    Per-project cache of datasets converted to resized uint8 shards.
+
+    Each entry lives in projects/<project>/dataset_cache/<sha1>_<h>x<w>x<c>/ and
+    holds shard_*.npy image arrays, labels.npy and an index.json with the class
+    indices and the last time it was used. The total size of all entries of all
+    projects is kept under limit_bytes by evicting the least recently used ones
+    that no running job has pinned.
+    """
+
+    def __init__(self, projects_dir="projects", limit_bytes=2 * 1024 ** 3):
+        self.projects_dir = projects_dir
+        self.limit_bytes = limit_bytes
+
+    def entry_dir(self, project_dir, dataset_hash, target_size, channels):
+        key = f"{dataset_hash}_{target_size[0]}x{target_size[1]}x{channels}"
+        return os.path.join(project_dir, CACHE_DIRNAME, key)
+
+    def read_index(self, entry_dir):
+        index_path = os.path.join(entry_dir, "index.json")
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, 'r') as f:
+            return json.load(f)
+
+    def write_index(self, entry_dir, index):
+        temp_path = os.path.join(entry_dir, "index.json.tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_path, os.path.join(entry_dir, "index.json"))
+
+    def lookup(self, entry_dir):
+        """Returns the index of a complete cache entry and marks it as used, or None on a miss."""
+        index = self.read_index(entry_dir)
+        if index is None:
+            return None
+        index['last_used'] = time.time()
+        self.write_index(entry_dir, index)
+        return index
+
+    def build(self, entry_dir, zip_path, target_size, channels, num_parallel_calls=None):
+        """
+        Decodes and resizes every image of a zipped dataset once and stores them as uint8 shards.
+
+        The index is written last, so an interrupted build is never mistaken for an entry.
+
+        Returns:
+            dict: The index of the new entry.
+        """
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            member_names, labels, class_indices = list_zip_images(zip_file)
+        if not member_names:
+            raise ValueError(f"No images found in {zip_path}.")
+
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+        os.makedirs(entry_dir)
+
+        dataset = zip_member_dataset(zip_path, member_names, labels)
+        dataset = dataset.map(
+            lambda encoded, label: decode_image(encoded, channels, target_size),
+            num_parallel_calls=num_parallel_calls or tf.data.AUTOTUNE
+        )
+        shards = []
+        size_bytes = 0
+        for shard_index, images in enumerate(dataset.batch(SHARD_SIZE).prefetch(1)):
+            filename = f"shard_{shard_index:05d}.npy"
+            array = images.numpy().astype(np.uint8, copy=False)
+            np.save(os.path.join(entry_dir, filename), array)
+            shards.append({'file': filename, 'count': int(array.shape[0])})
+            size_bytes += array.nbytes
+
+        label_array = np.asarray(labels, dtype=np.int32)
+        np.save(os.path.join(entry_dir, "labels.npy"), label_array)
+        size_bytes += label_array.nbytes
+
+        now = time.time()
+        index = {
+            'samples': len(member_names),
+            'class_indices': class_indices,
+            'shape': [target_size[0], target_size[1], channels],
+            'shards': shards,
+            'size_bytes': size_bytes,
+            'created': now,
+            'last_used': now,
+        }
+        self.write_index(entry_dir, index)
+        return index
+
+    def pin(self, entry_dir):
+        """
+        Protects an entry from eviction until release is called for it.
+
+        Returns:
+            threading.Lock: The entry's build lock.
+        """
+        key = os.path.abspath(entry_dir)
+        with _registry_lock:
+            _pins[key] = _pins.get(key, 0) + 1
+            return _entry_locks.setdefault(key, threading.Lock())
+
+    def release(self, entry_dir):
+        """Unpins an entry once the job reading it has finished training."""
+        key = os.path.abspath(entry_dir)
+        with _registry_lock:
+            _pins[key] -= 1
+            if not _pins[key]:
+                del _pins[key]
+                del _entry_locks[key]
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits its size limit.
+
+        Entries pinned by a running job are skipped. The registry lock is held
+        throughout, so no job can pin an entry while it is being deleted.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        with _registry_lock:
+            entries = []
+            for index_path in glob.glob(os.path.join(self.projects_dir, "*", CACHE_DIRNAME, "*", "index.json")):
+                entry_dir = os.path.dirname(index_path)
+                index = self.read_index(entry_dir)
+                entries.append((index['last_used'], index['size_bytes'], entry_dir))
+
+            total = sum(size for _, size, _ in entries)
+            freed = 0
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.limit_bytes:
+                    break
+                if os.path.abspath(entry_dir) in _pins:
+                    continue
+                shutil.rmtree(entry_dir)
+                total -= size
+                freed += size
+                print(f"Evicted dataset cache entry {entry_dir}.")
+        return freed
+
+    def load_dataset(self, entry_dir, index, batch_size=32, shuffle=True, seed=None):
+        """
+        Returns a training dataset of scaled images and one-hot labels read from the shards.
+
+        Shards are memory-mapped, so only the batches in flight are held in memory.
+        """
+        num_classes = len(index['class_indices'])
+        labels = np.load(os.path.join(entry_dir, "labels.npy"))
+        offsets = np.cumsum([0] + [shard['count'] for shard in index['shards']])
+        rng = np.random.default_rng(seed)
+
+        def read_batches():
+            shard_order = np.arange(len(index['shards']))
+            if shuffle:
+                rng.shuffle(shard_order)
+            for shard_index in shard_order:
+                images = np.load(os.path.join(entry_dir, index['shards'][shard_index]['file']), mmap_mode='r')
+                shard_labels = labels[offsets[shard_index]:offsets[shard_index + 1]]
+                order = rng.permutation(len(images)) if shuffle else np.arange(len(images))
+                for start in range(0, len(order), batch_size):
+                    # Sorted indices keep the reads from the memory map sequential
+                    batch = np.sort(order[start:start + batch_size])
+                    yield images[batch], shard_labels[batch]
+
+        height, width, channels = index['shape']
+        dataset = tf.data.Dataset.from_generator(
+            read_batches,
+            output_signature=(
+                tf.TensorSpec(shape=(None, height, width, channels), dtype=tf.uint8),
+                tf.TensorSpec(shape=(None,), dtype=tf.int32)
+            )
+        )
+        dataset = dataset.map(
+            lambda images, batch_labels: (tf.cast(images, tf.float32) / 255.0, tf.one_hot(batch_labels, num_classes)),
+            num_parallel_calls=tf.data.AUTOTUNE
+        )
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def get_or_build(self, project_dir, dataset_hash, zip_path, target_size, channels, batch_size=32,
+                     num_parallel_calls=None):
+        """
+        Returns the training dataset of a cached entry, converting the zip first on a miss.
+
+        The entry stays pinned, so the shards are not evicted while the dataset
+        reads them. Call release with the returned 'entry_dir' once training is done.
+
+        Returns:
+            tuple: (tf.data.Dataset, dict with 'samples', 'class_indices', 'cache_hit' and 'entry_dir')
+        """
+        entry_dir = self.entry_dir(project_dir, dataset_hash, target_size, channels)
+        entry_lock = self.pin(entry_dir)
+        try:
+            with entry_lock:
+                index = self.lookup(entry_dir)
+                cache_hit = index is not None
+                if cache_hit:
+                    print(f"Dataset cache hit: {entry_dir}")
+                else:
+                    print(f"Dataset cache miss. Converting {zip_path} into shards at {entry_dir}")
+                    index = self.build(entry_dir, zip_path, target_size, channels, num_parallel_calls)
+            self.evict()
+            dataset = self.load_dataset(entry_dir, index, batch_size)
+        except Exception:
+            self.release(entry_dir)
+            raise
+        return dataset, {
+            'samples': index['samples'],
+            'class_indices': index['class_indices'],
+            'cache_hit': cache_hit,
+            'entry_dir': entry_dir,
+        }
@@ -0,0 +1,28 @@
+# Same formats flow_from_directory picks up
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')
+
+
+def get_image_settings(input_shape):
+    """
+    Returns the target size, color mode and channel count for a model input shape.
+
+    Args:
+        input_shape (tuple): Model input shape without the batch dimension.
+
+    Raises:
+        ValueError: If the shape has another rank, or a channel count other than 1 or 3.
+
+    Returns:
+        tuple: ((height, width), color_mode, channels)
+    """
+    if len(input_shape) == 2:
+        img_height, img_width = input_shape
+        return (img_height, img_width), 'grayscale', 1
+    if len(input_shape) == 3:
+        img_height, img_width, channels = input_shape
+        if channels == 1:
+            return (img_height, img_width), 'grayscale', 1
+        if channels == 3:
+            return (img_height, img_width), 'rgb', 3
+        raise ValueError(f"Unsupported number of channels: {channels}")
+    raise ValueError(f"Invalid input shape: {input_shape}")
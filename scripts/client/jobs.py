@@ -0,0 +1,167 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import tensorflow as tf
+
+MAX_FINISHED_JOBS = 100
+
+
+class Job:
+    """
+    State and event log of one training job.
+
+    Every change is recorded as an event with an increasing sequence number, so
+    status endpoints can stream the events that happened since the last one a
+    reader has seen.
+    """
+
+    def __init__(self, project_name):
+        self.id = uuid.uuid4().hex
+        self.project_name = project_name
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.epochs = []
+        self.upload = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    def emit(self, event_type, **data):
+        with self.condition:
+            self.events.append(dict(data, seq=len(self.events), type=event_type, time=time.time()))
+            self.condition.notify_all()
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self.emit('stage', stage=stage)
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                'id': self.id,
+                'project': self.project_name,
+                'status': self.status,
+                'stage': self.stage,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+                'epochs': list(self.epochs),
+                'upload': self.upload,
+                'result': self.result,
+                'error': self.error,
+            }
+
+    def is_done(self):
+        return self.status in ('succeeded', 'failed')
+
+    def wait_for_events(self, after, timeout=15.0):
+        """Returns the events with a sequence number >= after, waiting up to timeout for new ones."""
+        with self.condition:
+            if len(self.events) <= after and not self.is_done():
+                self.condition.wait(timeout)
+            return self.events[after:]
+
+
+class ProgressCallback(tf.keras.callbacks.Callback):
+    """Reports per-epoch metrics and timing, and batch progress, to a job."""
+
+    def __init__(self, job, batch_interval=1.0):
+        super().__init__()
+        self.job = job
+        self.batch_interval = batch_interval
+        self.epoch_started = None
+        self.last_batch_event = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_started = time.perf_counter()
+        self.job.emit('epoch_begin', epoch=epoch + 1, epochs=self.params.get('epochs'))
+
+    def on_train_batch_end(self, batch, logs=None):
+        now = time.perf_counter()
+        if now - self.last_batch_event >= self.batch_interval:
+            self.last_batch_event = now
+            self.job.emit('batch', batch=batch + 1, steps=self.params.get('steps'))
+
+    def on_epoch_end(self, epoch, logs=None):
+        epoch_stats = {key: float(value) for key, value in (logs or {}).items()}
+        epoch_stats['epoch'] = epoch + 1
+        epoch_stats['seconds'] = time.perf_counter() - self.epoch_started
+        self.job.epochs.append(epoch_stats)
+        self.job.emit('epoch_end', **epoch_stats)
+
+
+class JobManager:
+    """
+    Runs training jobs on a bounded pool sized from the available CPU slots.
+
+    Each job is given threads_per_job CPU slots, so cpu_slots // threads_per_job
+    jobs run at once and the rest wait in the queue. TensorFlow's thread pools
+    are process-wide, so they are sized once to threads_per_job before the first
+    op runs. Jobs for the same project are serialized, since they share its
+    directory.
+    """
+
+    def __init__(self, cpu_slots, threads_per_job):
+        self.cpu_slots = cpu_slots
+        self.threads_per_job = threads_per_job
+        self.max_workers = max(cpu_slots // threads_per_job, 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.jobs = {}
+        self.project_locks = {}
+        self.lock = threading.Lock()
+
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads_per_job)
+            tf.config.threading.set_inter_op_parallelism_threads(threads_per_job)
+        except RuntimeError as e:
+            # TensorFlow was already initialized, its thread pools can no longer be resized
+            print(f"Could not limit TensorFlow threads: {e}")
+
+    def submit(self, project_name, fn, *args):
+        """
+        Queues fn(job, *args) and returns the job right away.
+
+        fn returns the job result, or raises to fail the job.
+        """
+        job = Job(project_name)
+        with self.lock:
+            self.jobs[job.id] = job
+            project_lock = self.project_locks.setdefault(project_name, threading.Lock())
+            self._forget_finished_jobs()
+        job.emit('queued')
+        self.executor.submit(self._run, job, project_lock, fn, args)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.snapshot() for job in self.jobs.values()]
+
+    def _run(self, job, project_lock, fn, args):
+        with project_lock:
+            job.status = 'running'
+            job.started = time.time()
+            job.emit('started')
+            try:
+                job.result = fn(job, *args)
+                job.status = 'succeeded'
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = 'failed'
+            job.finished = time.time()
+            job.emit(job.status, result=job.result, error=job.error)
+
+    def _forget_finished_jobs(self):
+        finished = [job for job in self.jobs.values() if job.is_done()]
+        for job in sorted(finished, key=lambda job: job.finished)[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job.id]
@@ -0,0 +1,140 @@
+import threading
+
+# Seconds. Training takes minutes, uploads and single phases seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    """A monotonically increasing value per label combination."""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, format_labels(self.label_names, key), value) for key, value in sorted(self.values.items())]
+
+
+class Gauge(Counter):
+    """A value per label combination that can go up and down."""
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram:
+    """Counts observations into cumulative buckets per label combination."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self.lock:
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = format_labels(self.label_names + ("le",), key + (repr(float(bound)),))
+                    samples.append((f"{self.name}_bucket", labels, bucket_count))
+                labels = format_labels(self.label_names + ("le",), key + ("+Inf",))
+                samples.append((f"{self.name}_bucket", labels, count))
+                plain_labels = format_labels(self.label_names, key)
+                samples.append((f"{self.name}_sum", plain_labels, total))
+                samples.append((f"{self.name}_count", plain_labels, count))
+        return samples
+
+
+class Registry:
+    """Holds the client's metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+jobs_total = registry.register(Counter(
+    "fedlearn_client_jobs_total", "Training jobs by final status.", ["status"]
+))
+jobs_in_progress = registry.register(Gauge(
+    "fedlearn_client_jobs_in_progress", "Training jobs queued or running."
+))
+training_seconds = registry.register(Histogram(
+    "fedlearn_client_training_seconds", "Wall time of model.fit per job.", ["project"]
+))
+upload_seconds = registry.register(Histogram(
+    "fedlearn_client_upload_seconds", "Wall time of uploading the trained weights.", ["project", "method"]
+))
+upload_bytes_total = registry.register(Counter(
+    "fedlearn_client_upload_bytes_total", "Bytes of weights or updates uploaded.", ["project"]
+))
+phase_seconds = registry.register(Histogram(
+    "fedlearn_client_phase_seconds", "Wall time of each timed phase.", ["phase"]
+))
+
+
+def observe_span(record):
+    """timing listener: records every span in the phase histogram, and training and upload spans in their own."""
+    if record.get("status") != "ok":
+        return
+    seconds = record["duration_ms"] / 1000.0
+    phase_seconds.observe(seconds, phase=record["phase"])
+    if record["phase"] == "fit":
+        training_seconds.observe(seconds, project=record.get("project", ""))
+    elif record["phase"] == "upload":
+        upload_seconds.observe(seconds, project=record.get("project", ""), method=record.get("method", ""))
+        upload_bytes_total.inc(record.get("bytes", 0), project=record.get("project", ""))
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import tensorflow as tf
+
+
+def build_model(model_json):
+    """Builds and compiles the project's model from its JSON configuration."""
+    model = tf.keras.models.model_from_json(model_json)
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    return model
+
+
+class ModelCache:
+    """
+    Keeps compiled models warm in memory between training rounds.
+
+    A cached model keeps its optimizer state (Adam's moment estimates) and its
+    traced training function. New global weights are swapped in with
+    load_weights instead of rebuilding the model. An entry is rebuilt when the
+    project's model_config.json changes, and the least recently used projects
+    are dropped beyond max_projects.
+    """
+
+    def __init__(self, max_projects=4):
+        self.max_projects = max_projects
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, project_dir, model_config_path, model_weights_path):
+        """
+        Returns the compiled model of a project with its current global weights loaded.
+
+        If there are no global weights on disk the model keeps the weights it
+        already has, random ones for a new model.
+
+        Returns:
+            tuple: (tf.keras.Model, True if the model came from the cache)
+        """
+        with open(model_config_path, 'r') as json_file:
+            model_json = json_file.read()
+        config_hash = hashlib.sha1(model_json.encode()).hexdigest()
+
+        with self.lock:
+            entry = self.entries.pop(project_dir, None)
+            if entry is not None and entry['config_hash'] != config_hash:
+                print(f"Model configuration of {project_dir} changed. Rebuilding the cached model.")
+                entry = None
+            cache_hit = entry is not None
+            if entry is None:
+                entry = {'model': build_model(model_json), 'config_hash': config_hash}
+
+            # Re-inserting keeps the entries ordered from least to most recently used
+            self.entries[project_dir] = entry
+            while len(self.entries) > self.max_projects:
+                evicted, _ = self.entries.popitem(last=False)
+                print(f"Evicted the cached model of {evicted}.")
+
+        model = entry['model']
+        if os.path.exists(model_weights_path):
+            model.load_weights(model_weights_path)
+        return model, cache_hit
+
+    def invalidate(self, project_dir):
+        with self.lock:
+            self.entries.pop(project_dir, None)
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROUTE = re.compile(r'^/(?P<project>[^/]+)/uploads(?:/(?P<upload_id>[^/]+)(?:/(?P<action>chunks|complete)(?:/(?P<index>\d+))?)?)?$')
+
+
+class UploadReceiver:
+    """
+    Offline stand-in for the server side of the chunked upload protocol.
+
+    Stores sessions as <root>/<project>/uploads/<id>.part with a .json sidecar
+    and moves completed files to <root>/<project>/contrib/, like the Express
+    server does. The response of a completed upload is kept in <id>.result.json,
+    so completing it again returns the same result. fail_rate makes it drop
+    that fraction of chunk requests, half before storing the chunk and half
+    after, to simulate a flaky link.
+    """
+
+    def __init__(self, root, fail_rate=0.0):
+        self.root = root
+        self.fail_rate = fail_rate
+        self.completed = 0
+        self.complete_delay = 0.0
+        self.lock = threading.Lock()
+
+    def session_paths(self, project, upload_id):
+        uploads_dir = os.path.join(self.root, project, "uploads")
+        return os.path.join(uploads_dir, f"{upload_id}.part"), os.path.join(uploads_dir, f"{upload_id}.json")
+
+    def result_path(self, project, upload_id):
+        return os.path.join(self.root, project, "uploads", f"{upload_id}.result.json")
+
+    def read_result(self, project, upload_id):
+        path = self.result_path(project, upload_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def read_session(self, project, upload_id):
+        part_path, meta_path = self.session_paths(project, upload_id)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        meta['received'] = os.path.getsize(part_path)
+        return meta
+
+    def start(self, project, body):
+        upload_id = body['sha1'] if body.get('encoding') != 'update' else f"{body['sha1']}-update"
+        part_path, meta_path = self.session_paths(project, upload_id)
+        with self.lock:
+            result = self.read_result(project, upload_id)
+            if result is not None and result['size'] == body['size']:
+                # Already completed, the client only has to ask for the result
+                return 200, {'upload_id': upload_id, 'received': body['size']}
+            meta = self.read_session(project, upload_id)
+            if meta is None or meta['size'] != body['size']:
+                if result is not None:
+                    os.remove(self.result_path(project, upload_id))
+                os.makedirs(os.path.dirname(part_path), exist_ok=True)
+                open(part_path, 'wb').close()
+                with open(meta_path, 'w') as f:
+                    json.dump(body, f)
+                meta = self.read_session(project, upload_id)
+        return 200, {'upload_id': upload_id, 'received': meta['received']}
+
+    def put_chunk(self, project, upload_id, offset, checksum, data):
+        with self.lock:
+            meta = self.read_session(project, upload_id)
+            if meta is None:
+                return 404, {'error': 'Upload not found'}
+            if hashlib.sha1(data).hexdigest() != checksum:
+                return 400, {'error': 'Chunk checksum mismatch', 'received': meta['received']}
+            if offset != meta['received'] or offset + len(data) > meta['size']:
+                return 409, {'received': meta['received']}
+            part_path, _ = self.session_paths(project, upload_id)
+            with open(part_path, 'ab') as f:
+                f.write(data)
+            return 200, {'received': offset + len(data)}
+
+    def complete(self, project, upload_id):
+        with self.lock:
+            result = self.read_result(project, upload_id)
+            if result is not None:
+                return result['status'], result['body']
+            meta = self.read_session(project, upload_id)
+            if meta is None:
+                return 404, {'error': 'Upload not found'}
+            if meta['received'] != meta['size']:
+                return 409, {'error': 'Upload is incomplete', 'received': meta['received']}
+
+            part_path, meta_path = self.session_paths(project, upload_id)
+            is_update = meta.get('encoding') == 'update'
+            if not is_update:
+                sha1 = hashlib.sha1()
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        sha1.update(block)
+                if sha1.hexdigest() != meta['sha1']:
+                    return 400, {'error': 'Uploaded file does not match its SHA1 hash'}
+
+            contrib_dir = os.path.join(self.root, project, "contrib")
+            os.makedirs(contrib_dir, exist_ok=True)
+            suffix = '.update.h5' if is_update else '.weights.h5'
+            shutil.move(part_path, os.path.join(contrib_dir, f"{meta['sha1']}{suffix}"))
+            body = {'message': 'Contribution processed successfully', 'hash': meta['sha1']}
+            with open(self.result_path(project, upload_id), 'w') as f:
+                json.dump({'size': meta['size'], 'status': 200, 'body': body}, f)
+            os.remove(meta_path)
+            self.completed += 1
+            return 200, body
+
+
+class ReceiverHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def route(self):
+        match = ROUTE.match(self.path.split('?', 1)[0])
+        if match is None:
+            self.send_json(404, {'error': 'Not found'})
+        return match
+
+    def do_GET(self):
+        match = self.route()
+        if match is None:
+            return
+        meta = self.server.receiver.read_session(match['project'], match['upload_id'] or '')
+        if meta is None:
+            return self.send_json(404, {'error': 'Upload not found'})
+        self.send_json(200, {'received': meta['received']})
+
+    def do_POST(self):
+        match = self.route()
+        if match is None:
+            return
+        receiver = self.server.receiver
+        if match['upload_id'] is None:
+            self.send_json(*receiver.start(match['project'], json.loads(self.read_body() or b'{}')))
+        elif match['action'] == 'complete':
+            status, body = receiver.complete(match['project'], match['upload_id'])
+            # Stands in for the time the server spends aggregating the contribution
+            time.sleep(receiver.complete_delay)
+            self.send_json(status, body)
+        else:
+            self.send_json(404, {'error': 'Not found'})
+
+    def do_PUT(self):
+        match = self.route()
+        if match is None:
+            return
+        data = self.read_body()
+        receiver = self.server.receiver
+
+        failure = random.random() < receiver.fail_rate
+        if failure and random.random() < 0.5:
+            return self.send_json(503, {'error': 'Simulated failure before storing the chunk'})
+
+        status, body = receiver.put_chunk(
+            match['project'],
+            match['upload_id'],
+            int(self.headers.get('X-Chunk-Offset', -1)),
+            self.headers.get('X-Chunk-SHA1', ''),
+            data
+        )
+        if failure:
+            # The chunk was stored but the acknowledgement is lost
+            return self.send_json(503, {'error': 'Simulated failure after storing the chunk'})
+        self.send_json(status, body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(root, host='127.0.0.1', port=0, fail_rate=0.0):
+    """Returns a ThreadingHTTPServer serving the receiver. Port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), ReceiverHandler)
+    server.receiver = UploadReceiver(root, fail_rate)
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in receiver for chunked weight uploads")
+    parser.add_argument("--root", type=str, default="receiver", help="Directory to store uploads in")
+    parser.add_argument("--port", type=int, default=5001, help="Port to listen on")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of chunk requests to fail")
+
+    args = parser.parse_args()
+    server = make_server(args.root, port=args.port, fail_rate=args.fail_rate)
+    print(f"Upload receiver listening on http://127.0.0.1:{args.port}/<project>/uploads, storing in {args.root}")
+    server.serve_forever()
@@ -0,0 +1,123 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from testset_cache import batch_metrics
+
+
+def stratified_order(labels, seed=None):
+    """
+    Returns a random order of the test set in which every prefix is stratified by class.
+
+    Each class is shuffled on its own and its k-th image gets a sort key in
+    [k / class size, (k + 1) / class size). Sorting by the keys interleaves
+    the classes, so the first n images of the order hold every class in
+    proportion to its share of the test set, give or take one image.
+
+    Args:
+        labels (np.ndarray): Class index of every image.
+        seed (int): Seed of the random order, None for a different one every time.
+
+    Returns:
+        np.ndarray: Indices into the test set.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    keys = np.empty(len(labels))
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        keys[members] = (rng.permutation(len(members)) + rng.random(len(members))) / len(members)
+    return np.argsort(keys, kind="stable")
+
+
+def wilson_interval(correct, samples, total, confidence=0.95):
+    """
+    Wilson score interval of an accuracy measured on samples of total test images.
+
+    The images are drawn without replacement, so the interval is narrowed by
+    the finite population correction and shrinks to the exact accuracy once
+    the whole test set has been evaluated.
+
+    Returns:
+        tuple: (lower, upper) bounds of the accuracy.
+    """
+    accuracy = correct / samples
+    if samples >= total:
+        return accuracy, accuracy
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    effective_samples = samples * (total - 1) / (total - samples)
+    z2n = z * z / effective_samples
+    center = (accuracy + z2n / 2) / (1 + z2n)
+    half_width = z * math.sqrt(accuracy * (1 - accuracy) / effective_samples + z2n / (4 * effective_samples)) / (1 + z2n)
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+
+def estimate_accuracy(model, images, labels, ci_width=0.02, confidence=0.95, initial_samples=512, batch_size=256,
+                      seed=None):
+    """
+    Estimates a model's test accuracy from a stratified random sample that grows until the estimate is precise enough.
+
+    Images are evaluated in the order of stratified_order. After the first
+    initial_samples images and after every further round, which doubles the
+    sample, the confidence interval of the accuracy is computed; evaluation
+    stops as soon as it is at most ci_width wide. In the worst case the
+    whole test set is evaluated and the result is exact.
+
+    Args:
+        model (tf.keras.Model): The model to evaluate.
+        images (np.ndarray): uint8 test images, typically a memory map.
+        labels (np.ndarray): Class index of every image.
+        ci_width (float): Largest accepted width of the interval, e.g. 0.02 for +-1 point.
+        confidence (float): Confidence level of the interval.
+        initial_samples (int): Size of the first sample.
+        batch_size (int): Number of images per inference batch.
+        seed (int): Seed of the sample order.
+
+    Returns:
+        dict: 'accuracy' estimate, its 'lower' and 'upper' bounds and 'width',
+            the mean 'loss' on the sample, the number of 'samples' used out of
+            'total', and whether the result is 'exact'.
+    """
+    if not 0 < confidence < 1:
+        raise ValueError(f"The confidence level must be between 0 and 1, got {confidence}.")
+    total = len(labels)
+    if total == 0:
+        raise ValueError("The test set is empty.")
+
+    order = stratified_order(labels, seed)
+    samples = 0
+    correct = 0
+    loss_sum = 0.0
+    target = min(max(initial_samples, 1), total)
+    while True:
+        # Read the round's images in file order, which is much faster on a memory map
+        chunk = np.sort(order[samples:target])
+        for start in range(0, len(chunk), batch_size):
+            indices = chunk[start:start + batch_size]
+            batch_images = np.asarray(images[indices], dtype=np.float32)
+            batch_images /= 255.0
+            batch_loss, batch_correct = batch_metrics(model.predict_on_batch(batch_images), labels[indices])
+            loss_sum += batch_loss
+            correct += batch_correct
+        samples = target
+
+        lower, upper = wilson_interval(correct, samples, total, confidence)
+        print(f"Accuracy on {samples} of {total} test images: {correct / samples * 100:.2f}% "
+              f"({lower * 100:.2f}% to {upper * 100:.2f}% at {confidence * 100:g}% confidence)")
+        if upper - lower <= ci_width or samples == total:
+            break
+        target = min(samples * 2, total)
+
+    return {
+        'accuracy': correct / samples,
+        'lower': lower,
+        'upper': upper,
+        'width': upper - lower,
+        'confidence': confidence,
+        'ci_width': ci_width,
+        'loss': loss_sum / samples,
+        'samples': samples,
+        'total': total,
+        'exact': samples == total,
+    }
@@ -0,0 +1,260 @@
+import argparse
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+
+from contribution import (
+    ContributionRejected,
+    FullUploadRequired,
+    buffer_contribution,
+    buffer_is_due,
+    commit_weights,
+    flush_buffer,
+    get_project_paths,
+    initialize_missing_weights,
+    is_buffered,
+    latest_weights,
+    project_lock,
+    read_buffer,
+    read_project_config,
+    record_aggregation,
+    register_contribution,
+    staging_weights_path,
+)
+from weights_h5 import fold_weight_file, read_weight_file, write_weight_file
+
+DEFAULT_SOCKET_PATH = "aggregator.sock"
+
+
+class ProjectState:
+    """
+    Keeps a project's architecture and current global weights resident in memory.
+
+    The architecture is the tensor layout of the global weights file, and the
+    weights are float32 arrays. Contributions are read straight from their
+    .weights.h5 files, so no Keras model is built per job.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.config_mtime = os.path.getmtime(paths["model_config_path"])
+        self.version = None
+        self.reload_weights()
+
+    def reload_weights(self):
+        model_weights_path = self.paths["model_weights_path"]
+        if not os.path.exists(model_weights_path):
+            print(f"No existing weights found at {model_weights_path}. Initializing with random weights.")
+            initialize_missing_weights(self.paths["model_config_path"], model_weights_path)
+        self.version, weights_path = latest_weights(self.paths)
+        self.weights = read_weight_file(weights_path)
+        print(f"Loaded version {self.version} of the model weights from {weights_path}.")
+
+    def is_stale(self):
+        """Returns True if another process committed a new global model version."""
+        return latest_weights(self.paths)[0] != self.version
+
+    def contribute(self, hash_value, num_samples=None, base_version=None, contributor=None):
+        config_values = read_project_config(self.paths["config_path"])
+        with project_lock(self.paths):
+            contribution_path = register_contribution(self.paths, hash_value, contributor, num_samples, base_version)
+            if contribution_path is None:
+                return {"duplicate": True}
+
+            if is_buffered(config_values):
+                # Buffered rounds are aggregated from disk in one pass, the resident
+                # weights are reloaded the next time they are needed
+                aggregated = buffer_contribution(self.paths, config_values, hash_value, num_samples, base_version)
+                return {"buffered": True, "aggregated": aggregated}
+
+            # Another process may have committed since the job was picked up
+            if self.is_stale():
+                self.reload_weights()
+
+            # Fold into a copy, so a failed write or commit leaves the resident weights at their version
+            base_weights_path = latest_weights(self.paths)[1]
+            weights = {name: array.copy() for name, array in self.weights.items()}
+            fold_weight_file(weights, contribution_path, 0.5)
+            staged_path = staging_weights_path(self.paths)
+            try:
+                write_weight_file(weights, staged_path, template_path=base_weights_path)
+                # Holding the lock, the compare-and-swap cannot fail
+                version = commit_weights(self.paths, config_values, staged_path, self.version)
+            finally:
+                # A committed staging file has been renamed to its version
+                if os.path.exists(staged_path):
+                    os.remove(staged_path)
+            self.weights = weights
+            self.version = version
+            record_aggregation(self.paths, config_values, [hash_value], version)
+            return {"aggregated": 1, "version": version}
+
+    def flush_if_due(self):
+        """Aggregates the buffer once its time window has passed, even if no new job arrives."""
+        config_values = read_project_config(self.paths["config_path"])
+        if not is_buffered(config_values):
+            return
+        with project_lock(self.paths):
+            if buffer_is_due(read_buffer(self.paths), config_values):
+                flush_buffer(self.paths, config_values)
+
+
+class Aggregator:
+    """
+    Serializes contribution jobs through a single worker thread.
+
+    Jobs for all projects go through one queue, so two contributions to the same
+    project are never combined concurrently.
+    """
+
+    def __init__(self, max_projects=16, flush_interval=5.0):
+        self.max_projects = max_projects
+        self.flush_interval = flush_interval
+        self.projects = {}
+        self.jobs = queue.Queue()
+        self.stats = {"jobs": 0, "failed": 0, "total_ms": 0.0}
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, username, projectname, hash_value, num_samples=None, base_version=None, contributor=None):
+        """Queues a job and blocks until it has been processed. Returns the job result."""
+        done = threading.Event()
+        job = {
+            "username": username,
+            "projectname": projectname,
+            "hash": hash_value,
+            "num_samples": num_samples,
+            "base_version": base_version,
+            "contributor": contributor,
+            "submitted": time.perf_counter(),
+            "done": done,
+        }
+        self.jobs.put(job)
+        done.wait()
+        return job["result"]
+
+    def get_project(self, username, projectname):
+        key = (username, projectname)
+        paths = get_project_paths(username, projectname)
+        state = self.projects.pop(key, None)
+        if state is not None and os.path.getmtime(paths["model_config_path"]) != state.config_mtime:
+            print(f"Model configuration of {username}/{projectname} changed. Rebuilding.")
+            state = None
+        if state is None:
+            state = ProjectState(paths)
+        elif state.is_stale():
+            print(f"Global weights of {username}/{projectname} changed on disk. Reloading.")
+            state.reload_weights()
+
+        # Re-inserting keeps self.projects ordered from least to most recently used
+        self.projects[key] = state
+        while len(self.projects) > self.max_projects:
+            evicted = next(iter(self.projects))
+            del self.projects[evicted]
+            print(f"Evicted {evicted[0]}/{evicted[1]} from the project cache.")
+        return state
+
+    def _run(self):
+        while True:
+            try:
+                job = self.jobs.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_due_buffers()
+                continue
+            started = time.perf_counter()
+            try:
+                if not os.path.exists(get_project_paths(job["username"], job["projectname"])["model_config_path"]):
+                    raise FileNotFoundError(f"Model configuration of {job['username']}/{job['projectname']} not found.")
+                state = self.get_project(job["username"], job["projectname"])
+                result = state.contribute(job["hash"], job["num_samples"], job["base_version"], job["contributor"])
+                result["status"] = "ok"
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                self.stats["failed"] += 1
+                result = {"status": "error", "error": str(e)}
+                if isinstance(e, FullUploadRequired):
+                    result["full_upload_required"] = True
+                if isinstance(e, ContributionRejected):
+                    result["rejected"] = True
+
+            finished = time.perf_counter()
+            result["queue_ms"] = round((started - job["submitted"]) * 1000, 3)
+            result["latency_ms"] = round((finished - started) * 1000, 3)
+            self.stats["jobs"] += 1
+            self.stats["total_ms"] += result["latency_ms"]
+            print(f"Job {job['username']}/{job['projectname']}/{job['hash']}: {result['status']} "
+                  f"in {result['latency_ms']} ms (queued {result['queue_ms']} ms).")
+
+            job["result"] = result
+            job["done"].set()
+
+
+    def _flush_due_buffers(self):
+        for (username, projectname), state in list(self.projects.items()):
+            try:
+                state.flush_if_due()
+            except Exception as e:
+                print(f"An error occurred while flushing {username}/{projectname}: {e}")
+
+
+class AggregatorHandler(socketserver.StreamRequestHandler):
+    """
+    Handles newline-delimited JSON requests on the aggregator socket.
+
+    A job request looks like {"username": ..., "projectname": ..., "hash": ...},
+    optionally with "num_samples", "base_version" and "contributor", and {"op": "stats"} returns the counters of the daemon.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if request.get("op") == "stats":
+                    response = dict(self.server.aggregator.stats, projects=len(self.server.aggregator.projects))
+                else:
+                    response = self.server.aggregator.submit(
+                        request["username"], request["projectname"], request["hash"],
+                        request.get("num_samples"), request.get("base_version"), request.get("contributor"),
+                    )
+            except (ValueError, KeyError) as e:
+                response = {"status": "error", "error": f"Invalid request: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class AggregatorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, aggregator):
+        self.aggregator = aggregator
+        super().__init__(socket_path, AggregatorHandler)
+
+
+def main(socket_path, max_projects, flush_interval):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = AggregatorServer(socket_path, Aggregator(max_projects=max_projects, flush_interval=flush_interval))
+    print(f"Aggregator listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down aggregator.")
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived aggregation daemon for model contributions.")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Path of the Unix socket to listen on")
+    parser.add_argument("--max-projects", type=int, default=16, help="Number of projects kept resident in memory")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Seconds between checks for buffers whose window has passed")
+
+    args = parser.parse_args()
+    main(args.socket, args.max_projects, args.flush_interval)
@@ -0,0 +1,261 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import h5py
+import numpy as np
+
+from contrib_store import ContributionStore
+from aggregators import resolve_method
+from contribution import (
+    buffered_coefficients, combine_contributions, commit_weights, get_project_paths, initialize_missing_weights,
+    is_buffered, latest_weights, project_lock, read_project_config, record_aggregation, register_contribution,
+    staging_weights_path, write_buffer
+)
+from weights_h5 import is_aggregatable, list_weight_datasets, write_weight_file
+
+
+def tensor_layout(template_path):
+    """
+    Lays the floating point tensors of a weights file out in one flat float32 vector.
+
+    Returns:
+        tuple: (list of (name, shape, offset, size) tuples, total number of elements)
+    """
+    layout = []
+    offset = 0
+    for name, shape, dtype in list_weight_datasets(template_path):
+        if is_aggregatable(dtype):
+            size = int(np.prod(shape))
+            layout.append((name, shape, offset, size))
+            offset += size
+    return layout, offset
+
+
+def create_block(total_size):
+    """Allocates a zeroed shared memory block holding one flat float32 copy of the model."""
+    block = shared_memory.SharedMemory(create=True, size=max(total_size, 1) * 4)
+    np.ndarray((total_size,), dtype=np.float32, buffer=block.buf).fill(0.0)
+    return block
+
+
+def attach_block(block_name):
+    """
+    Attaches to a shared memory block owned by the parent process.
+
+    The block is unregistered from this process' resource tracker, otherwise
+    the tracker would unlink it when the worker exits, while the parent still
+    uses it.
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def partial_sum(block_name, total_size, layout, inputs):
+    """
+    Pool task: accumulates sum(coefficient * weights) of some files into a shared memory block.
+
+    Args:
+        block_name (str): Name of the zeroed shared memory block to accumulate into.
+        total_size (int): Number of float32 elements in the block.
+        layout (list): Output of tensor_layout.
+        inputs (list): (weights path, coefficient) tuples.
+
+    Returns:
+        str: block_name, once the sum is complete.
+    """
+    block = attach_block(block_name)
+    try:
+        accumulator = np.ndarray((total_size,), dtype=np.float32, buffer=block.buf)
+        scratch_flat = np.empty(max((size for _, _, _, size in layout), default=0), dtype=np.float32)
+        for path, coefficient in inputs:
+            with h5py.File(path, "r") as f:
+                for name, shape, offset, size in layout:
+                    scratch = scratch_flat[:size].reshape(shape)
+                    f[name].read_direct(scratch)
+                    scratch *= coefficient
+                    accumulator[offset:offset + size] += scratch_flat[:size]
+        del accumulator
+    finally:
+        block.close()
+    return block_name
+
+
+def add_blocks(target_name, source_name, total_size):
+    """Pool task: adds one shared memory block into another in place."""
+    target = attach_block(target_name)
+    source = attach_block(source_name)
+    try:
+        target_array = np.ndarray((total_size,), dtype=np.float32, buffer=target.buf)
+        target_array += np.ndarray((total_size,), dtype=np.float32, buffer=source.buf)
+        del target_array
+    finally:
+        target.close()
+        source.close()
+    return target_name
+
+
+def tree_reduce(inputs, layout, total_size, pool, num_leaves):
+    """
+    Computes sum(coefficient * weights) over many files with a pool of processes.
+
+    The inputs are split into num_leaves contiguous groups that are summed in
+    parallel, each into its own shared memory block. The partial sums are then
+    added pairwise, halving the number of blocks at every level, so only block
+    names ever pass between processes.
+
+    Returns:
+        np.ndarray: The flat float32 sum.
+    """
+    num_leaves = max(min(num_leaves, len(inputs)), 1)
+    groups = [list(group) for group in np.array_split(np.arange(len(inputs)), num_leaves)]
+    blocks = {}
+    try:
+        tasks = []
+        for group in groups:
+            block = create_block(total_size)
+            blocks[block.name] = block
+            tasks.append((block.name, total_size, layout, [inputs[i] for i in group]))
+        level = pool.starmap(partial_sum, tasks)
+
+        while len(level) > 1:
+            pairs = [(level[i], level[i + 1], total_size) for i in range(0, len(level) - 1, 2)]
+            reduced = pool.starmap(add_blocks, pairs)
+            for _, source_name, _ in pairs:
+                # Unlinking only removes the name, the mapping stays until it is closed
+                block = blocks.pop(source_name)
+                block.close()
+                block.unlink()
+            level = reduced + level[len(pairs) * 2:]
+
+        return np.ndarray((total_size,), dtype=np.float32, buffer=blocks[level[0]].buf).copy()
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def collect_backlog(paths):
+    """
+    Registers uploaded but unregistered contributions and returns every one not aggregated yet.
+
+    A file that cannot be registered, because it is corrupt or does not match
+    the model, is rejected and deleted, so it does not block the rest of the
+    backlog on every retry.
+
+    Must be called while holding the project lock.
+
+    Returns:
+        list: Index entries with their 'hash', in the order they were received.
+    """
+    store = ContributionStore(paths["contrib_dir"])
+    for filename in sorted(os.listdir(paths["contrib_dir"])):
+        for suffix in (".weights.h5", ".update.h5"):
+            hash_value = filename[:-len(suffix)]
+            if filename.endswith(suffix) and store.get(hash_value) is None:
+                try:
+                    register_contribution(paths, hash_value)
+                except Exception as e:
+                    print(f"Rejected contribution {filename}: {e}")
+                    store = ContributionStore(paths["contrib_dir"])
+                    store.reject(hash_value, str(e))
+                    store.save()
+                store = ContributionStore(paths["contrib_dir"])
+
+    backlog = [
+        dict(entry, hash=hash_value)
+        for hash_value, entry in store.entries.items()
+        if not entry["aggregated"] and not entry["collected"] and not entry.get("rejected")
+    ]
+    return sorted(backlog, key=lambda entry: (entry["received"], entry["hash"]))
+
+
+def sequential_coefficients(count):
+    """
+    Coefficients that reproduce folding contributions in one at a time as (existing + new) / 2.
+
+    After n folds the global model is 0.5 ** n * global + sum(0.5 ** (n - i + 1) * c_i)
+    for the contributions c_1..c_n in order.
+
+    The powers of two are exact until they underflow to 0.0 past 0.5 ** 1074.
+    That loses nothing: the weights are summed in float32, where a contribution
+    folded in 150 times earlier would already have been scaled to zero. Inputs
+    with a coefficient of 0.0 can be left out of the sum.
+
+    Returns:
+        tuple: (coefficient of the global model, list of contribution coefficients)
+    """
+    return 0.5 ** count, [0.5 ** (count - i + 1) for i in range(1, count + 1)]
+
+
+def main(username, projectname, workers=None, leaves=None):
+    try:
+        paths = get_project_paths(username, projectname)
+        model_weights_path = paths["model_weights_path"]
+
+        if not os.path.exists(paths["model_config_path"]):
+            print(f"Error: Model configuration file not found at {paths['model_config_path']}.")
+            return
+        if not os.path.exists(model_weights_path):
+            print(f"No existing weights found at {model_weights_path}. Initializing with random weights.")
+            initialize_missing_weights(paths["model_config_path"], model_weights_path)
+
+        config_values = read_project_config(paths["config_path"])
+        workers = workers or os.cpu_count() or 1
+        with project_lock(paths):
+            backlog = collect_backlog(paths)
+            if not backlog:
+                print("No contributions waiting to be aggregated.")
+                return
+
+            # Same result as aggregating the backlog the way contribution.py would
+            base_version, base_weights_path = latest_weights(paths)
+            robust = resolve_method(config_values["combining_method"]) != "mean"
+            if is_buffered(config_values) or robust:
+                global_coefficient, coefficients = buffered_coefficients(backlog, base_version, config_values)
+            else:
+                global_coefficient, coefficients = sequential_coefficients(len(backlog))
+            contribution_paths = [
+                os.path.join(paths["contrib_dir"], f"{entry['hash']}.weights.h5") for entry in backlog
+            ]
+
+            start = time.perf_counter()
+            staged_path = staging_weights_path(paths)
+            if robust:
+                # Robust aggregators are not sums, so they cannot be split into partial sums
+                combine_contributions(paths, config_values, base_weights_path, contribution_paths, global_coefficient,
+                                      coefficients, staged_path)
+            else:
+                layout, total_size = tensor_layout(base_weights_path)
+                inputs = [(base_weights_path, global_coefficient)] + list(zip(contribution_paths, coefficients))
+                # Skip the files whose coefficient underflowed, they add nothing
+                inputs = [(path, coefficient) for path, coefficient in inputs if coefficient != 0.0]
+                with Pool(processes=workers) as pool:
+                    flat = tree_reduce(inputs, layout, total_size, pool, leaves or workers)
+                write_weight_file(
+                    {name: flat[offset:offset + size].reshape(shape) for name, shape, offset, size in layout},
+                    staged_path,
+                    base_weights_path,
+                )
+            elapsed = time.perf_counter() - start
+
+            version = commit_weights(paths, config_values, staged_path, base_version)
+            write_buffer(paths, [])
+            record_aggregation(paths, config_values, [entry["hash"] for entry in backlog], version)
+
+        print(f"Aggregated {len(backlog)} contributions into version {version} with {workers} processes "
+              f"in {elapsed:.2f}s ({len(backlog) / elapsed:.1f} contributions/sec).")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate a project's whole contribution backlog in parallel.")
+    parser.add_argument("username", type=str, help="Username directory")
+    parser.add_argument("projectname", type=str, help="Project directory")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes, defaults to the number of CPUs")
+    parser.add_argument("--leaves", type=int, default=None, help="Number of partial sums to reduce, defaults to --workers")
+
+    args = parser.parse_args()
+    main(args.username, args.projectname, args.workers, args.leaves)
@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from precision import file_precision
+
+INDEX_FILENAME = "index.json"
+BLOB_SUFFIXES = (".weights.h5", ".update.h5")
+
+
+def sha1_of_file(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class ContributionStore:
+    """
+    Content-addressed index of a project's contributions.
+
+    Blobs stay in the contrib directory as <sha1>.weights.h5 (or .update.h5 for
+    compressed uploads). contrib/index.json maps each hash to its metadata, so
+    duplicates are detected without touching the blobs, and aggregated blobs can
+    be garbage-collected while their hash is remembered.
+    """
+
+    def __init__(self, contrib_dir):
+        self.contrib_dir = contrib_dir
+        self.index_path = os.path.join(contrib_dir, INDEX_FILENAME)
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+
+    def blob_paths(self, hash_value):
+        return [os.path.join(self.contrib_dir, f"{hash_value}{suffix}") for suffix in BLOB_SUFFIXES]
+
+    def get(self, hash_value):
+        return self.entries.get(hash_value)
+
+    def add(self, hash_value, contributor=None, base_version=None, num_samples=None):
+        """
+        Records a newly uploaded contribution.
+
+        Full weight uploads are checked against their hash, so the store only
+        ever holds blobs whose name is their content hash.
+
+        Returns:
+            dict: The new index entry.
+        """
+        weights_path, update_path = self.blob_paths(hash_value)
+        if os.path.exists(update_path):
+            # The hash of a compressed upload is that of the weights the client trained
+            blob_path, encoding = update_path, "update"
+        else:
+            if sha1_of_file(weights_path) != hash_value:
+                raise ValueError(f"Contribution {hash_value} does not match its SHA1 hash.")
+            blob_path, encoding = weights_path, "weights"
+        precision = file_precision(blob_path) if encoding == "weights" else None
+
+        entry = {
+            "size": os.path.getsize(blob_path),
+            "encoding": encoding,
+            "precision": precision,
+            "contributor": contributor,
+            "base_version": base_version,
+            "num_samples": num_samples,
+            "received": time.time(),
+            "aggregated": False,
+            "aggregated_version": None,
+            "collected": False,
+            "rejected": False,
+        }
+        self.entries[hash_value] = entry
+        return entry
+
+    def reject(self, hash_value, reason):
+        """
+        Records a contribution that cannot be aggregated, such as a corrupt file, and deletes its blobs.
+
+        The hash stays in the index, so the same content is skipped as a
+        duplicate instead of failing again.
+
+        Returns:
+            dict: The new index entry.
+        """
+        size = 0
+        for path in self.blob_paths(hash_value):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+                os.remove(path)
+        entry = {
+            "size": size,
+            "encoding": None,
+            "precision": None,
+            "contributor": None,
+            "base_version": None,
+            "num_samples": None,
+            "received": time.time(),
+            "aggregated": False,
+            "aggregated_version": None,
+            "collected": True,
+            "rejected": True,
+            "reason": reason,
+        }
+        self.entries[hash_value] = entry
+        return entry
+
+    def mark_aggregated(self, hashes, version):
+        for hash_value in hashes:
+            if hash_value in self.entries:
+                self.entries[hash_value]["aggregated"] = True
+                self.entries[hash_value]["aggregated_version"] = version
+
+    def collect_garbage(self, keep_count=0, keep_seconds=0, now=None):
+        """
+        Deletes the blobs of aggregated contributions outside the retention policy.
+
+        The newest keep_count aggregated blobs, and any received within the last
+        keep_seconds, are kept. Index entries are never dropped, so a collected
+        hash is still recognized as a duplicate.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        now = time.time() if now is None else now
+        aggregated = sorted(
+            (entry["received"], hash_value)
+            for hash_value, entry in self.entries.items()
+            if entry["aggregated"] and not entry["collected"]
+        )
+        expendable = aggregated[:max(len(aggregated) - keep_count, 0)]
+
+        freed = 0
+        for received, hash_value in expendable:
+            if keep_seconds and now - received < keep_seconds:
+                continue
+            for path in self.blob_paths(hash_value):
+                if os.path.exists(path):
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+            self.entries[hash_value]["collected"] = True
+        return freed
+
+
+def main(username, projectname, keep_count, keep_days):
+    try:
+        contrib_dir = os.path.join("users", username, projectname, "contrib")
+        if not os.path.exists(contrib_dir):
+            print(f"Error: Contrib directory not found at {contrib_dir}.")
+            return
+
+        # Imported here because contribution.py itself depends on this module
+        from contribution import get_project_paths, project_lock
+
+        with project_lock(get_project_paths(username, projectname)):
+            store = ContributionStore(contrib_dir)
+            freed = store.collect_garbage(keep_count=keep_count, keep_seconds=keep_days * 86400)
+            store.save()
+        print(f"Freed {freed} bytes from {contrib_dir}.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Garbage-collect aggregated contributions of a project.")
+    parser.add_argument("username", type=str, help="Username directory")
+    parser.add_argument("projectname", type=str, help="Project directory")
+    parser.add_argument("--keep-count", type=int, default=0, help="Number of most recent aggregated contributions to keep")
+    parser.add_argument("--keep-days", type=float, default=0, help="Keep aggregated contributions newer than this many days")
+
+    args = parser.parse_args()
+    main(args.username, args.projectname, args.keep_count, args.keep_days)
@@ -1,29 +1,27 @@
 import os
 import argparse
 import json
-import tensorflow as tf
 
-class YourNetworkClass(tf.keras.Model):
-    def __init__(self, input_shape, activation_function, dropout_rate, num_layers, units_per_layer, num_classes):
-        super(YourNetworkClass, self).__init__()
-        self.model = tf.keras.Sequential()
-        self.model.add(tf.keras.layers.InputLayer(input_shape=input_shape))
-        self.model.add(tf.keras.layers.Flatten())
-        for _ in range(num_layers):
-            self.model.add(tf.keras.layers.Dense(units_per_layer, activation=activation_function))
-            self.model.add(tf.keras.layers.Dropout(dropout_rate))
-        self.model.add(tf.keras.layers.Dense(num_classes, activation='softmax'))
+from contribution import get_project_paths, publish_weights, read_project_config, version_weights_path
+from model_artifacts import build_model_config, write_initial_weights, write_model_config
+from model_bundle import build_bundle
+from precision import check_precision
+from timing import span
+from weights_sync import build_weights_manifest
 
-    def call(self, inputs):
-        return self.model(inputs)
+def save_weights_with_keras(model_config, model_weights_path):
+    """
+    Builds the model with Keras and saves its randomly initialized weights.
 
-    def initialize_weights(self):
-        # Initialize weights by running a forward pass with dummy data
-        input_shape_with_batch = [1] + list(self.model.input_shape[1:])
-        dummy_input = tf.random.normal(input_shape_with_batch)
-        self.call(dummy_input)
+    Only used with --keras, to compare against the NumPy initializer.
+    """
+    import tensorflow as tf
 
-def main(username, projectname):
+    model = tf.keras.models.model_from_json(json.dumps(model_config))
+    model.save_weights(model_weights_path)
+    return model.count_params()
+
+def main(username, projectname, use_keras=False, seed=None):
     project_dir = os.path.join("users", username, projectname)
     contrib_dir = os.path.join(project_dir, "contrib")
 
@@ -43,30 +41,57 @@ def main(username, projectname):
     num_layers = int(config_values.get("num_layers", "3"))
     units_per_layer = int(config_values.get("units_per_layer", "128"))
     num_classes = int(config_values.get("num_classes", "10"))
+    weights_precision = check_precision(config_values.get("weights_precision", "float32"))
 
     # Adjust input_shape to include channels dimension if missing
     if len(input_shape) == 2:
         input_shape += (1,)  # Add channel dimension for grayscale images
 
-    # Initialize the required network with random weights
-    model = YourNetworkClass(
-        input_shape, activation_function, dropout_rate,
-        num_layers, units_per_layer, num_classes
-    )
-    model.initialize_weights()
+    # Build the network configuration and its random initial weights with NumPy, TensorFlow is not needed
+    model_weights_path = os.path.join(project_dir, "model.weights.h5")
+    with span("build_model", project=projectname, num_layers=num_layers, units_per_layer=units_per_layer):
+        model_config = build_model_config(
+            input_shape, activation_function, dropout_rate,
+            num_layers, units_per_layer, num_classes
+        )
+    with span("save_weights", project=projectname) as info:
+        if use_keras:
+            parameters = save_weights_with_keras(model_config, model_weights_path)
+        else:
+            parameters = write_initial_weights(model_config, model_weights_path, seed)
+        info["bytes"] = os.path.getsize(model_weights_path)
+        info["parameters"] = parameters
+
+    # The float32 weights become the master copy of version 0, which compressed updates are decoded against.
+    # Reduced precision is only for distribution
+    paths = get_project_paths(username, projectname)
+    os.makedirs(paths["versions_dir"], exist_ok=True)
+    master_weights_path = version_weights_path(paths, 0)
+    os.replace(model_weights_path, master_weights_path)
+    publish_weights(paths, {"weights_precision": weights_precision}, master_weights_path)
+    if weights_precision != "float32":
+        print(f"Stored the distributed weights in {weights_precision}.")
 
-    # Store the weights from the Sequential model
-    model.model.save_weights(os.path.join(project_dir, "model.weights.h5"))
+    # Keep a copy of the configuration with the project, later scripts read it from there
+    with open(os.path.join(project_dir, "config.txt"), "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in config_values.items())
+    # Reading it back warns about options that will not take effect
+    read_project_config(paths["config_path"])
 
     # Save the model configuration in JSON format
-    model_config = model.model.to_json()
-    with open(os.path.join(project_dir, "model_config.json"), "w") as json_file:
-        json_file.write(model_config)
+    write_model_config(model_config, os.path.join(project_dir, "model_config.json"))
+    with span("bundle", project=projectname) as info:
+        info["bytes"] = build_bundle(project_dir, 0)["bundle_bytes"]
+    with span("manifest", project=projectname):
+        build_weights_manifest(project_dir, 0)
+    print(f"Initialized project {projectname} with {parameters} parameters.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Initialize project with configuration")
     parser.add_argument("username", type=str, help="Username directory")
     parser.add_argument("projectname", type=str, help="Project directory")
+    parser.add_argument("--keras", action="store_true", help="Initialize the weights with TensorFlow instead of NumPy")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the initial weights")
 
     args = parser.parse_args()
-    main(args.username, args.projectname)
\ No newline at end of file
+    main(args.username, args.projectname, args.keras, args.seed)
\ No newline at end of file
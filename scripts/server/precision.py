@@ -0,0 +1,109 @@
+import os
+
+import h5py
+import numpy as np
+
+# Storage precisions of weight files. Tensors are always computed on in float32
+PRECISIONS = ("float32", "float16", "bfloat16")
+
+
+def check_precision(precision):
+    """Raises ValueError for anything but float32, float16 or bfloat16."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported weights precision '{precision}'. Use one of {', '.join(PRECISIONS)}.")
+    return precision
+
+
+def bfloat16_type():
+    """
+    The HDF5 float type of bfloat16: 1 sign bit, 8 exponent bits and 7 mantissa bits.
+
+    HDF5 converts it to and from float32 itself, so h5py and Keras read such
+    datasets as float32 without knowing about bfloat16.
+    """
+    hdf5_type = h5py.h5t.IEEE_F32LE.copy()
+    hdf5_type.set_fields(15, 7, 8, 0, 7)
+    hdf5_type.set_size(2)
+    hdf5_type.set_ebias(127)
+    return hdf5_type
+
+
+def storage_type(precision):
+    if precision == "bfloat16":
+        return bfloat16_type()
+    if precision == "float16":
+        return h5py.h5t.IEEE_F16LE.copy()
+    return h5py.h5t.IEEE_F32LE.copy()
+
+
+def tensor_precision(dataset):
+    """Returns the storage precision of a dataset, or None if it does not hold floats."""
+    hdf5_type = dataset.id.get_type()
+    if hdf5_type.get_class() != h5py.h5t.FLOAT:
+        return None
+    if hdf5_type.get_size() == 2:
+        return "bfloat16" if hdf5_type.get_ebias() == 127 else "float16"
+    return "float64" if hdf5_type.get_size() == 8 else "float32"
+
+
+def file_precision(weights_path):
+    """Returns the storage precision of the first floating point tensor of a weights file."""
+    found = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and tensor_precision(obj) is not None:
+            found.append(tensor_precision(obj))
+            return True
+
+    with h5py.File(weights_path, "r") as f:
+        f.visititems(visit)
+    return found[0] if found else "float32"
+
+
+def convert_weight_file(input_path, output_path, precision):
+    """
+    Writes a copy of a weights file with every floating point tensor stored in the given precision.
+
+    Groups, attributes and other datasets are copied as they are, so the copy
+    loads with load_weights like the original. Values are rounded to the
+    nearest representable number by HDF5. The output is written next to
+    output_path and renamed into place.
+
+    Args:
+        input_path (str): Weights file to convert.
+        output_path (str): Path of the converted file. May be input_path.
+        precision (str): One of PRECISIONS.
+
+    Returns:
+        int: Size of the converted file in bytes.
+    """
+    target_type = storage_type(check_precision(precision))
+    temp_path = f"{output_path}.{os.getpid()}.convert.tmp"
+    try:
+        with h5py.File(input_path, "r") as source, h5py.File(temp_path, "w") as out:
+            out.attrs.update(source.attrs)
+
+            def copy(name, obj):
+                if isinstance(obj, h5py.Group):
+                    out.require_group(name).attrs.update(obj.attrs)
+                    return
+                if tensor_precision(obj) is None:
+                    dataset = out.create_dataset(name, data=obj[()])
+                else:
+                    values = np.empty(obj.shape, dtype=np.float32)
+                    if values.size:
+                        obj.read_direct(values)
+                    parent = out.require_group(os.path.dirname(name) or "/")
+                    space = h5py.h5s.create_simple(obj.shape) if obj.shape else h5py.h5s.create(h5py.h5s.SCALAR)
+                    dataset_id = h5py.h5d.create(parent.id, os.path.basename(name).encode(), target_type, space)
+                    dataset = h5py.Dataset(dataset_id)
+                    if values.size:
+                        dataset.write_direct(values)
+                dataset.attrs.update(obj.attrs)
+
+            source.visititems(copy)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return os.path.getsize(output_path)
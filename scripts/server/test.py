@@ -1,10 +1,171 @@
 import argparse
 import os
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import json
 
-def main(username, projectname):
+from accuracy_estimate import estimate_accuracy
+from contribution import get_project_paths, latest_weights
+from image_settings import get_image_settings
+from precision import file_precision
+from testset_cache import batch_metrics, iterate_batches, load_test_set
+from timing import span
+
+def evaluate_models(models, images, labels, batch_size=256):
+    """
+    Evaluates several models in a single pass over the test set.
+
+    Every batch is read and scaled once and then run through all models
+    before moving on to the next one, so the cost of reading the test set is
+    paid once instead of once per model.
+
+    Args:
+        models (list): Models with the same input shape.
+        images (np.ndarray): uint8 test images, typically a memory map.
+        labels (np.ndarray): Class index of every image.
+        batch_size (int): Number of images per inference batch.
+
+    Returns:
+        list: A dict with 'loss' and 'accuracy' per model, in the same order.
+    """
+    loss_sums = [0.0] * len(models)
+    correct = [0] * len(models)
+    for batch_images, batch_labels in iterate_batches(images, labels, batch_size):
+        for i, model in enumerate(models):
+            batch_loss, batch_correct = batch_metrics(model.predict_on_batch(batch_images), batch_labels)
+            loss_sums[i] += batch_loss
+            correct[i] += batch_correct
+    return [
+        {'loss': loss_sum / len(labels), 'accuracy': hits / len(labels)}
+        for loss_sum, hits in zip(loss_sums, correct)
+    ]
+
+def pending_contributions(contrib_dir):
+    """
+    Lists the contributed weight files that have not been aggregated yet.
+
+    Returns:
+        list: (hash, path) tuples sorted by hash.
+    """
+    from contrib_store import ContributionStore
+
+    if not os.path.exists(contrib_dir):
+        return []
+
+    store = ContributionStore(contrib_dir)
+    pending = []
+    for filename in sorted(os.listdir(contrib_dir)):
+        if not filename.endswith(".weights.h5"):
+            continue
+        hash_value = filename[:-len(".weights.h5")]
+        entry = store.get(hash_value)
+        if entry is None or not entry["aggregated"]:
+            pending.append((hash_value, os.path.join(contrib_dir, filename)))
+    return pending
+
+def evaluate_contributions(model_json, global_model, contributions, images, labels, batch_size, merge_weight, project_dir):
+    """
+    Scores contributions against the global model in one pass over the test set.
+
+    For every contribution, both its own weights and the global model after
+    averaging them in with merge_weight are evaluated, next to the current
+    global model. The report is written to contrib_eval.json.
+
+    Args:
+        model_json (str): The project's model configuration.
+        global_model (tf.keras.Model): Model holding the current global weights.
+        contributions (list): (name, weights path) tuples.
+        merge_weight (float): Weight of the contribution when merged into the global model.
+
+    Returns:
+        dict: The report, with the global model's metrics and per-contribution results.
+    """
+    global_weights = global_model.get_weights()
+    models = [global_model]
+    for name, weights_path in contributions:
+        contrib_model = tf.keras.models.model_from_json(model_json)
+        contrib_model.load_weights(weights_path)
+        merged_model = tf.keras.models.model_from_json(model_json)
+        merged_model.set_weights([
+            (1 - merge_weight) * existing + merge_weight * new
+            for existing, new in zip(global_weights, contrib_model.get_weights())
+        ])
+        models.extend([contrib_model, merged_model])
+    print(f"Evaluating the global model and {len(contributions)} contributions in one pass.")
+
+    results = evaluate_models(models, images, labels, batch_size)
+    baseline = results[0]
+    report = {'global': baseline, 'merge_weight': merge_weight, 'contributions': {}}
+    for i, (name, _) in enumerate(contributions):
+        own, merged = results[1 + 2 * i], results[2 + 2 * i]
+        report['contributions'][name] = {
+            'loss': own['loss'],
+            'accuracy': own['accuracy'],
+            'merged_loss': merged['loss'],
+            'merged_accuracy': merged['accuracy'],
+            'accuracy_delta': merged['accuracy'] - baseline['accuracy'],
+            'loss_delta': merged['loss'] - baseline['loss'],
+        }
+        print(
+            f"{name}: accuracy {own['accuracy'] * 100:.2f}%, loss {own['loss']:.4f}; "
+            f"merged accuracy {merged['accuracy'] * 100:.2f}% "
+            f"({(merged['accuracy'] - baseline['accuracy']) * 100:+.2f} points)"
+        )
+
+    report_path = os.path.join(project_dir, "contrib_eval.json")
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    print(f"Saved contribution evaluation to {report_path}.")
+    return report
+
+def write_precision_report(project_dir, precision, version, result, master_result, weights_path, master_weights_path):
+    """
+    Reports how much accuracy the reduced-precision distributed weights lose against the float32 master.
+
+    The report is written to precision_drift.json.
+
+    Returns:
+        dict: The report.
+    """
+    report = {
+        'precision': precision,
+        'version': version,
+        'accuracy': result['accuracy'],
+        'loss': result['loss'],
+        'master_accuracy': master_result['accuracy'],
+        'master_loss': master_result['loss'],
+        'accuracy_drift': result['accuracy'] - master_result['accuracy'],
+        'loss_drift': result['loss'] - master_result['loss'],
+        'bytes': os.path.getsize(weights_path),
+        'master_bytes': os.path.getsize(master_weights_path),
+    }
+    print(
+        f"{precision} weights: accuracy {result['accuracy'] * 100:.2f}% vs {master_result['accuracy'] * 100:.2f}% "
+        f"in float32 ({report['accuracy_drift'] * 100:+.2f} points), "
+        f"{report['bytes']} instead of {report['master_bytes']} bytes"
+    )
+
+    report_path = os.path.join(project_dir, "precision_drift.json")
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    print(f"Saved precision drift to {report_path}.")
+    return report
+
+def write_accuracy_estimate(project_dir, version, estimate):
+    """
+    Saves a sampled accuracy estimate to accuracy_estimate.json, next to the exact accuracy.txt.
+
+    Returns:
+        dict: The report.
+    """
+    report = dict(estimate, version=version)
+    report_path = os.path.join(project_dir, "accuracy_estimate.json")
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    print(f"Saved accuracy estimate to {report_path}.")
+    return report
+
+def main(username, projectname, batch_size=256, contributions=None, merge_weight=0.5, fast=False, ci_width=0.02,
+         confidence=0.95, seed=None):
     try:
         # Define paths
         project_dir = os.path.join("users", username, projectname)
@@ -19,6 +180,10 @@ def main(username, projectname):
         print(f"Model weights path: {model_weights_path}")
         print(f"Accuracy file path: {accuracy_file_path}")
 
+        if fast and contributions is not None:
+            print("Error: Contributions can only be scored on the full test set.")
+            return
+
         # Validate paths
         if not os.path.exists(model_config_path):
             print(f"Error: Model configuration file not found at {model_config_path}.")
@@ -33,64 +198,80 @@ def main(username, projectname):
             return
 
         # Load model configuration
-        with open(model_config_path, 'r') as json_file:
-            model_json = json_file.read()
-        model = tf.keras.models.model_from_json(model_json)
+        with span("load_config", project=projectname):
+            with open(model_config_path, 'r') as json_file:
+                model_json = json_file.read()
+            model = tf.keras.models.model_from_json(model_json)
         print("Loaded model configuration from JSON.")
 
         # Load model weights
-        model.load_weights(model_weights_path)
+        with span("load_weights", project=projectname, bytes=os.path.getsize(model_weights_path)):
+            model.load_weights(model_weights_path)
         print(f"Loaded model weights from {model_weights_path}.")
 
+        # With a reduced weights_precision, clients get a rounded copy of the float32 master weights
+        version, master_weights_path = latest_weights(get_project_paths(username, projectname))
+        precision = file_precision(model_weights_path)
+        master_model = None
+        if not fast and master_weights_path != model_weights_path and precision != file_precision(master_weights_path):
+            master_model = tf.keras.models.model_from_json(model_json)
+            master_model.load_weights(master_weights_path)
+            print(f"Loaded float32 master weights from {master_weights_path} to measure the {precision} drift.")
+
         # Prepare test data
         input_shape = model.input_shape[1:]  # Exclude batch dimension
         print(f"Model input shape: {input_shape}")
 
         # Determine color mode based on input shape
-        if len(input_shape) == 2:
-            img_height, img_width = input_shape
-            color_mode = 'grayscale'
-        elif len(input_shape) == 3:
-            img_height, img_width, channels = input_shape
-            if channels == 1:
-                color_mode = 'grayscale'
-            elif channels == 3:
-                color_mode = 'rgb'
-            else:
-                raise ValueError(f"Unsupported number of channels: {channels}")
-        else:
-            raise ValueError(f"Invalid input shape: {input_shape}")
+        (img_height, img_width), color_mode, _ = get_image_settings(input_shape)
 
         print(f"Using color mode: {color_mode}")
         print(f"Image target size: ({img_height}, {img_width})")
 
-        # Create ImageDataGenerator for loading test images
-        datagen = ImageDataGenerator(rescale=1./255)
-
-        test_generator = datagen.flow_from_directory(
-            test_set_dir,
-            target_size=(img_height, img_width),
-            batch_size=32,
-            class_mode='categorical',
-            color_mode=color_mode,
-            shuffle=False
-        )
-        print("Initialized ImageDataGenerator and test generator.")
+        # Load the preprocessed test set, decoding the images only when it changed
+        with span("load_test_set", project=projectname) as info:
+            images, labels, index = load_test_set(project_dir, test_set_dir, (img_height, img_width), color_mode)
+            info.update(samples=index['samples'], cache_hit=index['cache_hit'], bytes=images.nbytes)
+        print(f"Loaded {index['samples']} test images in {len(index['class_indices'])} classes.")
 
-        # Compile the model
-        model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-        print("Compiled the model.")
+        # A quick check stops on a stratified sample once the accuracy is known to within ci_width
+        if fast:
+            print(f"Estimating the accuracy to within {ci_width * 100:g} points...")
+            with span("estimate", project=projectname, total=len(labels)) as info:
+                estimate = estimate_accuracy(model, images, labels, ci_width, confidence, batch_size=batch_size, seed=seed)
+                info.update(samples=estimate['samples'], width=estimate['width'])
+            print(
+                f"Estimated accuracy: {estimate['accuracy'] * 100:.2f}% "
+                f"[{estimate['lower'] * 100:.2f}%, {estimate['upper'] * 100:.2f}%] "
+                f"from {estimate['samples']} of {estimate['total']} test images"
+            )
+            write_accuracy_estimate(project_dir, version, estimate)
+            return
 
-        # Evaluate the model
+        # Evaluate the model with batched inference straight from the memory map
         print("Starting evaluation on the test set...")
-        loss, accuracy = model.evaluate(test_generator)
-        print(f"Evaluation completed. Accuracy: {accuracy * 100:.2f}%")
+        master_result = None
+        with span("evaluate", project=projectname, samples=len(labels), models=1 + 2 * len(contributions or [])):
+            if contributions is not None:
+                result = evaluate_contributions(model_json, model, contributions, images, labels, batch_size, merge_weight, project_dir)['global']
+                if master_model is not None:
+                    master_result = evaluate_models([master_model], images, labels, batch_size)[0]
+            else:
+                results = evaluate_models([model] + ([master_model] if master_model else []), images, labels, batch_size)
+                result = results[0]
+                master_result = results[1] if master_model else None
+        loss = result['loss']
+        accuracy = result['accuracy']
+        print(f"Evaluation completed. Loss: {loss:.4f}, Accuracy: {accuracy * 100:.2f}%")
 
         # Write accuracy to accuracy.txt
         with open(accuracy_file_path, 'w') as acc_file:
             acc_file.write(f"{accuracy * 100:.2f}%\n")
         print(f"Saved accuracy to {accuracy_file_path}.")
 
+        if master_result is not None:
+            write_precision_report(project_dir, precision, version, result, master_result, model_weights_path, master_weights_path)
+
     except Exception as e:
         print(f"An error occurred: {e}")
 
@@ -98,6 +279,20 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Test the model and save accuracy")
     parser.add_argument("username", type=str, help="Username directory")
     parser.add_argument("projectname", type=str, help="Project directory")
+    parser.add_argument("--batch-size", type=int, default=256, help="Number of test images per inference batch")
+    parser.add_argument("--contributions", action="store_true", help="Also score the pending contributions in contrib/")
+    parser.add_argument("--weights", type=str, nargs="+", help="Score these weight files instead of the pending contributions")
+    parser.add_argument("--merge-weight", type=float, default=0.5, help="Weight of a contribution when merged into the global model")
+    parser.add_argument("--fast", action="store_true", help="Estimate the accuracy from a growing stratified sample instead of the full test set")
+    parser.add_argument("--ci-width", type=float, default=0.02, help="Stop sampling once the confidence interval is at most this wide")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the interval")
+    parser.add_argument("--seed", type=int, help="Seed of the random sample")
 
     args = parser.parse_args()
-    main(args.username, args.projectname)
\ No newline at end of file
+    contributions = None
+    if args.weights:
+        contributions = [(os.path.basename(path), path) for path in args.weights]
+    elif args.contributions:
+        contributions = pending_contributions(os.path.join("users", args.username, args.projectname, "contrib"))
+    main(args.username, args.projectname, args.batch_size, contributions, args.merge_weight, args.fast, args.ci_width,
+         args.confidence, args.seed)
\ No newline at end of file
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from image_settings import IMAGE_EXTENSIONS
+
+CACHE_DIRNAME = "test_cache"
+
+
+def list_test_images(test_set_dir):
+    """
+    Lists the images of a class-per-folder test set.
+
+    Classes are the sorted subdirectory names, indexed like flow_from_directory does.
+
+    Returns:
+        tuple: (list of image paths, list of class indices, dict mapping class names to indices)
+    """
+    classes = sorted(
+        name for name in os.listdir(test_set_dir)
+        if os.path.isdir(os.path.join(test_set_dir, name))
+    )
+    class_indices = {name: index for index, name in enumerate(classes)}
+
+    paths = []
+    labels = []
+    for name in classes:
+        for root, dirs, files in os.walk(os.path.join(test_set_dir, name)):
+            dirs.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, filename))
+                    labels.append(class_indices[name])
+    return paths, labels, class_indices
+
+
+def fingerprint_test_set(paths, test_set_dir):
+    """
+    Hashes the relative path, size and modification time of every test image.
+
+    Adding, removing, renaming or rewriting an image changes the fingerprint,
+    without reading any image data.
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        sha1.update(f"{os.path.relpath(path, test_set_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return sha1.hexdigest()
+
+
+def read_index(cache_dir):
+    index_path = os.path.join(cache_dir, "index.json")
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def index_matches(index, fingerprint, shape, color_mode):
+    """Whether a cache index was built from the same images for the same input shape."""
+    return (
+        index is not None
+        and index['fingerprint'] == fingerprint
+        and index['shape'] == list(shape)
+        and index['color_mode'] == color_mode
+    )
+
+
+def install_cache(build_dir, cache_dir):
+    """
+    Moves a finished cache from build_dir to cache_dir with an atomic rename.
+
+    A stale cache is moved aside and deleted first. If another process installs
+    its cache between the two steps, the rename fails; when that cache was built
+    from the same images it is used and build_dir is deleted, otherwise it is
+    replaced.
+
+    Returns:
+        dict: The index of the installed cache.
+    """
+    index = read_index(build_dir)
+    for _ in range(3):
+        current = read_index(cache_dir)
+        if index_matches(current, index['fingerprint'], index['shape'], index['color_mode']):
+            # Another process built the same cache first
+            shutil.rmtree(build_dir)
+            return current
+        if os.path.exists(cache_dir):
+            stale_dir = f"{build_dir}.stale"
+            try:
+                os.rename(cache_dir, stale_dir)
+            except FileNotFoundError:
+                pass
+            else:
+                shutil.rmtree(stale_dir)
+        try:
+            os.rename(build_dir, cache_dir)
+            return index
+        except OSError:
+            if not os.path.exists(cache_dir):
+                raise
+    raise OSError(f"Could not install the test set cache in {cache_dir}.")
+
+
+def build_test_cache(cache_dir, paths, labels, class_indices, fingerprint, target_size, color_mode):
+    """
+    Decodes and resizes every test image once into a uint8 images.npy with a labels.npy.
+
+    Images are decoded the way ImageDataGenerator does (nearest-neighbour
+    resize) and written straight into the memory-mapped output, so memory use
+    does not grow with the size of the test set. The cache is built in its own
+    temporary directory next to cache_dir and renamed into place last, so an
+    interrupted build is never used and concurrent builds do not collide.
+
+    Returns:
+        dict: The index of the new cache.
+    """
+    from tensorflow.keras.utils import img_to_array, load_img
+
+    channels = 1 if color_mode == 'grayscale' else 3
+    shape = (len(paths), target_size[0], target_size[1], channels)
+
+    build_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(cache_dir)}.", suffix=".tmp",
+                                 dir=os.path.dirname(cache_dir))
+    try:
+        images = np.lib.format.open_memmap(os.path.join(build_dir, "images.npy"), mode='w+', dtype=np.uint8,
+                                           shape=shape)
+        for i, path in enumerate(paths):
+            image = load_img(path, color_mode=color_mode, target_size=target_size, interpolation='nearest')
+            images[i] = img_to_array(image, dtype='uint8')
+        images.flush()
+        del images
+
+        np.save(os.path.join(build_dir, "labels.npy"), np.asarray(labels, dtype=np.int32))
+        index = {
+            'fingerprint': fingerprint,
+            'samples': len(paths),
+            'shape': list(shape[1:]),
+            'color_mode': color_mode,
+            'class_indices': class_indices,
+        }
+        with open(os.path.join(build_dir, "index.json"), 'w') as f:
+            json.dump(index, f)
+
+        return install_cache(build_dir, cache_dir)
+    finally:
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir)
+
+
+def load_test_set(project_dir, test_set_dir, target_size, color_mode):
+    """
+    Returns the preprocessed test set, building the cache when it is missing or stale.
+
+    The cache lives in <project_dir>/test_cache and is rebuilt when the test
+    images or the model's input shape change.
+
+    Returns:
+        tuple: (uint8 images memory map of shape (n, height, width, channels),
+                int32 labels, dict index with 'class_indices' and 'cache_hit')
+    """
+    cache_dir = os.path.join(project_dir, CACHE_DIRNAME)
+    paths, labels, class_indices = list_test_images(test_set_dir)
+    if not paths:
+        raise ValueError(f"No images found in {test_set_dir}.")
+    fingerprint = fingerprint_test_set(paths, test_set_dir)
+
+    index = read_index(cache_dir)
+    channels = 1 if color_mode == 'grayscale' else 3
+    cache_hit = index_matches(index, fingerprint, (target_size[0], target_size[1], channels), color_mode)
+    if cache_hit:
+        print(f"Test set cache hit: {cache_dir}")
+    else:
+        print(f"Test set cache miss. Decoding {len(paths)} images into {cache_dir}")
+        index = build_test_cache(cache_dir, paths, labels, class_indices, fingerprint, target_size, color_mode)
+
+    images = np.load(os.path.join(cache_dir, "images.npy"), mmap_mode='r')
+    labels = np.load(os.path.join(cache_dir, "labels.npy"))
+    return images, labels, dict(index, cache_hit=cache_hit)
+
+
+def iterate_batches(images, labels, batch_size=256):
+    """Yields (float32 images scaled to [0, 1], int labels) batches read from the memory map in order."""
+    for start in range(0, len(images), batch_size):
+        batch = np.asarray(images[start:start + batch_size], dtype=np.float32)
+        batch /= 255.0
+        yield batch, labels[start:start + batch_size]
+
+
+def batch_metrics(probabilities, labels):
+    """
+    Returns the summed categorical crossentropy and number of correct predictions of a batch.
+
+    Matches Keras' categorical_crossentropy on probabilities, which clips them to [1e-7, 1 - 1e-7].
+    """
+    probabilities = np.asarray(probabilities)
+    true_probabilities = np.clip(probabilities[np.arange(len(labels)), labels], 1e-7, 1 - 1e-7)
+    loss_sum = float(-np.log(true_probabilities).sum())
+    correct = int((probabilities.argmax(axis=1) == labels).sum())
+    return loss_sum, correct
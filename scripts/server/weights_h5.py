@@ -0,0 +1,167 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+
+
+def list_weight_datasets(weights_path):
+    """
+    Lists the weight tensors stored in a .weights.h5 file.
+
+    Args:
+        weights_path (str): Path to the weights file.
+
+    Returns:
+        list: (name, shape, dtype) tuples sorted by dataset name.
+    """
+    datasets = []
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset):
+            datasets.append((name, obj.shape, obj.dtype))
+
+    with h5py.File(weights_path, "r") as f:
+        f.visititems(visit)
+    return sorted(datasets)
+
+
+def is_aggregatable(dtype):
+    """Only floating point tensors are averaged, anything else is copied from the template."""
+    return np.issubdtype(dtype, np.floating)
+
+
+def check_compatible(reference_datasets, weights_path):
+    """
+    Raises ValueError if a weights file does not have the same tensors as the reference.
+
+    Args:
+        reference_datasets (list): Output of list_weight_datasets for the reference file.
+        weights_path (str): Path to the weights file to check.
+    """
+    datasets = list_weight_datasets(weights_path)
+    if [(name, shape) for name, shape, _ in datasets] != [(name, shape) for name, shape, _ in reference_datasets]:
+        raise ValueError(f"The weights in {weights_path} do not match the model architecture.")
+
+
+def read_weight_file(weights_path):
+    """
+    Reads every floating point tensor of a .weights.h5 file into memory.
+
+    Args:
+        weights_path (str): Path to the weights file.
+
+    Returns:
+        dict: Dataset name to float32 array.
+    """
+    weights = {}
+    with h5py.File(weights_path, "r") as f:
+        for name, shape, dtype in list_weight_datasets(weights_path):
+            if is_aggregatable(dtype):
+                weights[name] = f[name][()].astype(np.float32)
+    return weights
+
+
+def write_weight_file(weights, output_path, template_path):
+    """
+    Writes tensors into a copy of a template weights file and atomically replaces the output.
+
+    Copying the template keeps the group layout and attributes Keras expects, so
+    the result loads with load_weights exactly like the template does.
+
+    Args:
+        weights (dict): Dataset name to array. Missing datasets keep the template values.
+        output_path (str): Path of the weights file to write.
+        template_path (str): Weights file with the same architecture.
+    """
+    temp_path = f"{output_path}.tmp"
+    shutil.copyfile(template_path, temp_path)
+    try:
+        with h5py.File(temp_path, "r+") as f:
+            for name, array in weights.items():
+                dataset = f[name]
+                dataset[...] = array.astype(dataset.dtype, copy=False)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def fold_weight_file(weights, weights_path, coefficient):
+    """
+    Folds a weights file into resident tensors in place: weights = (1 - c) * weights + c * file.
+
+    Args:
+        weights (dict): Dataset name to float32 array, updated in place.
+        weights_path (str): Path to the weights file to fold in.
+        coefficient (float): Weight of the file.
+    """
+    scratch_size = max((array.size for array in weights.values()), default=0)
+    scratch_flat = np.empty(scratch_size, dtype=np.float32)
+
+    with h5py.File(weights_path, "r") as f:
+        for name, array in weights.items():
+            dataset = f[name]
+            if dataset.shape != array.shape:
+                raise ValueError(f"Tensor {name} has shape {dataset.shape}, expected {array.shape}.")
+            scratch = scratch_flat[:array.size].reshape(array.shape)
+            dataset.read_direct(scratch)
+            array *= 1.0 - coefficient
+            scratch *= coefficient
+            array += scratch
+
+
+def weighted_sum_files(input_paths, coefficients, output_path, template_path=None):
+    """
+    Writes the weighted sum of several weights files, one tensor at a time.
+
+    Peak memory is two buffers the size of the largest tensor, no matter how many
+    files are combined. Tensors are accumulated in float32 and cast back to the
+    dtype of the template on write.
+
+    Args:
+        input_paths (list): Paths of the weights files to combine.
+        coefficients (list): Weight of each input file.
+        output_path (str): Path of the weights file to write. May be one of the inputs.
+        template_path (str): File whose layout is copied. Defaults to the first input.
+    """
+    if len(input_paths) != len(coefficients):
+        raise ValueError("Each input weights file needs exactly one coefficient.")
+    if not input_paths:
+        raise ValueError("No weights files to combine.")
+
+    template_path = template_path or input_paths[0]
+    datasets = list_weight_datasets(template_path)
+    for path in input_paths:
+        check_compatible(datasets, path)
+
+    max_size = max((int(np.prod(shape)) for _, shape, _ in datasets), default=0)
+    accumulator_flat = np.empty(max_size, dtype=np.float32)
+    scratch_flat = np.empty(max_size, dtype=np.float32)
+
+    temp_path = f"{output_path}.tmp"
+    shutil.copyfile(template_path, temp_path)
+    sources = [h5py.File(path, "r") for path in input_paths]
+    try:
+        with h5py.File(temp_path, "r+") as out:
+            for name, shape, dtype in datasets:
+                if not is_aggregatable(dtype):
+                    continue
+                size = int(np.prod(shape))
+                accumulator = accumulator_flat[:size].reshape(shape)
+                scratch = scratch_flat[:size].reshape(shape)
+                accumulator.fill(0.0)
+                for source, coefficient in zip(sources, coefficients):
+                    source[name].read_direct(scratch)
+                    scratch *= coefficient
+                    accumulator += scratch
+                out[name][...] = accumulator.astype(dtype, copy=False)
+        for source in sources:
+            source.close()
+        sources = []
+        os.replace(temp_path, output_path)
+    finally:
+        for source in sources:
+            source.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
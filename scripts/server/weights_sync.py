@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import shutil
+import zlib
+
+import h5py
+import numpy as np
+
+WEIGHTS_MANIFEST = "weights_manifest.json"
+
+
+def read_raw(dataset):
+    """Returns the stored bytes of a dataset without any type conversion, as a flat uint8 array."""
+    hdf5_type = dataset.id.get_type()
+    raw = np.empty(dataset.shape + (hdf5_type.get_size(),), dtype=np.uint8)
+    if raw.size:
+        dataset.id.read(h5py.h5s.ALL, h5py.h5s.ALL, raw, mtype=hdf5_type)
+    return raw.reshape(-1)
+
+
+def write_raw(dataset, raw):
+    """Overwrites a dataset with bytes in its own storage type, the inverse of read_raw."""
+    hdf5_type = dataset.id.get_type()
+    raw = np.ascontiguousarray(raw, dtype=np.uint8).reshape(dataset.shape + (hdf5_type.get_size(),))
+    if raw.size:
+        dataset.id.write(h5py.h5s.ALL, h5py.h5s.ALL, raw, mtype=hdf5_type)
+
+
+def tensor_hash(raw):
+    return hashlib.sha256(raw.tobytes()).hexdigest()
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def encode_tensor(raw, itemsize, base_raw=None):
+    """
+    Compresses a tensor's bytes, or its difference from base_raw as a binary patch.
+
+    The patch is the XOR of the old and new bytes. Sign and exponent bits of
+    weights rarely change between rounds, so after splitting the bytes into
+    planes (all first bytes of every value, then all second bytes, ...) the
+    XOR compresses far better than the values themselves.
+
+    Returns:
+        bytes: The zlib-compressed planes.
+    """
+    data = raw if base_raw is None else np.bitwise_xor(raw, base_raw)
+    planes = data.reshape(-1, itemsize).T
+    return zlib.compress(np.ascontiguousarray(planes).tobytes(), 6)
+
+
+def decode_tensor(encoded, itemsize, base_raw=None):
+    """Reverses encode_tensor. Patches need the same base_raw they were made from."""
+    planes = np.frombuffer(zlib.decompress(encoded), dtype=np.uint8).reshape(itemsize, -1)
+    data = np.ascontiguousarray(planes.T).reshape(-1)
+    return data if base_raw is None else np.bitwise_xor(data, base_raw)
+
+
+def list_tensors(f):
+    """Returns the names of every dataset of an open weights file, sorted."""
+    names = []
+    f.visititems(lambda name, obj: names.append(name) if isinstance(obj, h5py.Dataset) else None)
+    return sorted(names)
+
+
+def tensor_manifest(weights_path):
+    """
+    Hashes every tensor of a weights file.
+
+    Returns:
+        dict: Tensor name to its 'sha256', 'shape', 'itemsize' and 'bytes'.
+    """
+    tensors = {}
+    with h5py.File(weights_path, "r") as f:
+        for name in list_tensors(f):
+            dataset = f[name]
+            raw = read_raw(dataset)
+            tensors[name] = {
+                "sha256": tensor_hash(raw),
+                "shape": list(dataset.shape),
+                "itemsize": dataset.id.get_type().get_size(),
+                "bytes": int(raw.size),
+            }
+    return tensors
+
+
+def write_blob(path, encode):
+    """Writes a content-addressed blob unless it exists already."""
+    if os.path.exists(path):
+        return
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(encode())
+    os.replace(temp_path, path)
+
+
+def build_weights_manifest(project_dir, version):
+    """
+    Publishes the per-tensor hashes of the distributed weights and the blobs to sync them.
+
+    Every tensor is stored compressed under tensors/<sha256>.gz. A tensor that
+    changed since the previous manifest also gets a binary patch from its old
+    content under patches/<old sha256>-<new sha256>.gz. weights_manifest.json
+    lists both and is replaced atomically. Blobs that neither the new nor the
+    previous manifest refer to are deleted, so clients one version behind can
+    still patch while the blobs are being replaced.
+
+    Must be called while holding the project lock, right after a version is committed.
+
+    Returns:
+        dict: The manifest.
+    """
+    manifest_path = os.path.join(project_dir, WEIGHTS_MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)
+    previous_tensors = previous.get("tensors", {})
+    previous_weights_path = os.path.join(project_dir, "tensors", ".previous.weights.h5")
+
+    for directory in ("tensors", "patches"):
+        os.makedirs(os.path.join(project_dir, directory), exist_ok=True)
+
+    tensors = {}
+    weights_path = os.path.join(project_dir, "model.weights.h5")
+    with h5py.File(weights_path, "r") as f:
+        previous_file = h5py.File(previous_weights_path, "r") if os.path.exists(previous_weights_path) else None
+        try:
+            for name in list_tensors(f):
+                dataset = f[name]
+                raw = read_raw(dataset)
+                itemsize = dataset.id.get_type().get_size()
+                hash_value = tensor_hash(raw)
+                entry = {
+                    "sha256": hash_value,
+                    "shape": list(dataset.shape),
+                    "itemsize": itemsize,
+                    "bytes": int(raw.size),
+                    "blob": f"tensors/{hash_value}.gz",
+                    "patches": {},
+                }
+                write_blob(os.path.join(project_dir, entry["blob"]), lambda: encode_tensor(raw, itemsize))
+
+                old = previous_tensors.get(name)
+                if (old and old["sha256"] != hash_value and previous_file is not None and name in previous_file
+                        and old["shape"] == entry["shape"] and old["itemsize"] == itemsize):
+                    base_raw = read_raw(previous_file[name])
+                    if tensor_hash(base_raw) == old["sha256"]:
+                        patch = f"patches/{old['sha256']}-{hash_value}.gz"
+                        write_blob(os.path.join(project_dir, patch), lambda: encode_tensor(raw, itemsize, base_raw))
+                        entry["patches"][old["sha256"]] = patch
+                tensors[name] = entry
+        finally:
+            if previous_file is not None:
+                previous_file.close()
+
+    manifest = {
+        "version": version,
+        "config_sha256": file_sha256(os.path.join(project_dir, "model_config.json")),
+        "tensors": tensors,
+    }
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, manifest_path)
+
+    # The next manifest patches from this version
+    shutil.copyfile(weights_path, f"{previous_weights_path}.tmp")
+    os.replace(f"{previous_weights_path}.tmp", previous_weights_path)
+
+    referenced = set()
+    for entries in (tensors, previous_tensors):
+        for entry in entries.values():
+            referenced.add(entry["blob"])
+            referenced.update(entry.get("patches", {}).values())
+    for directory in ("tensors", "patches"):
+        for filename in os.listdir(os.path.join(project_dir, directory)):
+            relative_path = f"{directory}/{filename}"
+            if filename.endswith(".gz") and relative_path not in referenced:
+                os.remove(os.path.join(project_dir, directory, filename))
+    return manifest
+
+
+def apply_manifest(weights_path, manifest, fetch):
+    """
+    Brings a local weights file up to date with a manifest, fetching only the tensors that differ.
+
+    A tensor whose local hash has a patch in the manifest is patched,
+    otherwise its full blob is fetched. The result is written to a copy that
+    replaces weights_path only once every tensor matches its hash.
+
+    Args:
+        weights_path (str): Local weights file with the same tensors as the manifest.
+        manifest (dict): The server's weights_manifest.json.
+        fetch (callable): Takes a blob path from the manifest and returns its bytes.
+
+    Raises:
+        ValueError: If the local file has other tensors than the manifest, or
+            if the assembled file does not match it. The local file is kept then.
+
+    Returns:
+        dict: Numbers of 'changed', 'patched' and total 'tensors', and 'fetched_bytes'.
+    """
+    stats = {"tensors": len(manifest["tensors"]), "changed": 0, "patched": 0, "fetched_bytes": 0}
+    temp_path = f"{weights_path}.sync.tmp"
+    shutil.copyfile(weights_path, temp_path)
+    try:
+        with h5py.File(temp_path, "r+") as f:
+            if list_tensors(f) != sorted(manifest["tensors"]):
+                raise ValueError("The local weights have other tensors than the global model.")
+            for name, entry in sorted(manifest["tensors"].items()):
+                dataset = f[name]
+                if list(dataset.shape) != entry["shape"] or dataset.id.get_type().get_size() != entry["itemsize"]:
+                    raise ValueError(f"Tensor {name} has another shape or precision than the global model.")
+                raw = read_raw(dataset)
+                local_hash = tensor_hash(raw)
+                if local_hash == entry["sha256"]:
+                    continue
+                patch = entry.get("patches", {}).get(local_hash)
+                encoded = fetch(patch or entry["blob"])
+                stats["fetched_bytes"] += len(encoded)
+                new_raw = decode_tensor(encoded, entry["itemsize"], raw if patch else None)
+                if tensor_hash(new_raw) != entry["sha256"]:
+                    raise ValueError(f"Tensor {name} does not match its hash after syncing.")
+                write_raw(dataset, new_raw)
+                stats["changed"] += 1
+                stats["patched"] += 1 if patch else 0
+
+        # Verify the assembled file as a whole before it replaces the old weights
+        local = tensor_manifest(temp_path)
+        if any(local[name]["sha256"] != entry["sha256"] for name, entry in manifest["tensors"].items()):
+            raise ValueError("The synced weights do not match the manifest.")
+        os.replace(temp_path, weights_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return stats
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts are run from their own directory and import each other by module name
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("server", "client"):
+    sys.path.insert(0, os.path.join(SCRIPTS_DIR, directory))
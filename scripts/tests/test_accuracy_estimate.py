@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from accuracy_estimate import estimate_accuracy, stratified_order, wilson_interval
+
+
+class LookupModel:
+    """Stands in for a Keras model: predicts the class stored in each image's first pixel."""
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.evaluated = 0
+
+    def predict_on_batch(self, images):
+        predictions = np.rint(images.reshape(len(images), -1)[:, 0] * 255).astype(int)
+        self.evaluated += len(images)
+        return np.eye(self.num_classes, dtype=np.float32)[predictions] * 0.9 + 0.1 / self.num_classes
+
+
+def make_test_set(total, accuracy, num_classes=4, seed=0):
+    """Labels and images whose stored prediction is right for a given share of them."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, num_classes, total)
+    predictions = labels.copy()
+    wrong = rng.permutation(total)[:round(total * (1 - accuracy))]
+    predictions[wrong] = (labels[wrong] + 1) % num_classes
+    images = np.zeros((total, 2, 2), dtype=np.uint8)
+    images[:, 0, 0] = predictions
+    return images, labels
+
+
+def test_wilson_interval_with_finite_population_correction():
+    # 80 of 100 sampled out of 1000: the effective sample size is 100 * 999 / 900 = 111, so with z = 1.95996
+    # the center is (0.8 + z^2 / 222) / (1 + z^2 / 111) = 0.789965 and the half width
+    # z * sqrt(0.16 / 111 + z^2 / (4 * 111^2)) / (1 + z^2 / 111) = 0.073843
+    lower, upper = wilson_interval(80, 100, 1000)
+    assert lower == pytest.approx(0.716122, abs=1e-6)
+    assert upper == pytest.approx(0.863807, abs=1e-6)
+
+
+def test_wilson_interval_without_correction_on_a_large_population():
+    # The textbook Wilson interval of 80 out of 100 at 95%
+    lower, upper = wilson_interval(80, 100, 10 ** 12)
+    assert lower == pytest.approx(0.711171, abs=1e-6)
+    assert upper == pytest.approx(0.866633, abs=1e-6)
+    # The correction only ever narrows the interval
+    corrected_lower, corrected_upper = wilson_interval(80, 100, 1000)
+    assert lower < corrected_lower < 0.8 < corrected_upper < upper
+
+
+def test_wilson_interval_at_the_bounds():
+    lower, upper = wilson_interval(0, 50, 200)
+    assert lower == 0.0 and 0.0 < upper < 0.06
+    lower, upper = wilson_interval(50, 50, 200)
+    assert upper == 1.0 and 0.94 < lower < 1.0
+    # A higher confidence gives a wider interval
+    widths = [upper - lower for lower, upper in (wilson_interval(30, 50, 200, level) for level in (0.9, 0.95, 0.99))]
+    assert widths == sorted(widths)
+
+
+def test_wilson_interval_on_the_whole_population_is_exact():
+    assert wilson_interval(7, 10, 10) == (0.7, 0.7)
+
+
+def test_stratified_order_keeps_class_proportions_in_every_prefix():
+    rng = np.random.default_rng(1)
+    labels = rng.choice(4, 1000, p=[0.5, 0.3, 0.15, 0.05])
+    order = stratified_order(labels, seed=2)
+
+    assert sorted(order) == list(range(len(labels)))
+    shares = np.bincount(labels, minlength=4) / len(labels)
+    for size in (20, 64, 100, 333, 1000):
+        counts = np.bincount(labels[order[:size]], minlength=4)
+        assert np.all(np.abs(counts - shares * size) <= 1)
+
+
+def test_stratified_order_is_seeded():
+    labels = np.arange(100) % 3
+    np.testing.assert_array_equal(stratified_order(labels, 5), stratified_order(labels, 5))
+    assert not np.array_equal(stratified_order(labels, 5), stratified_order(labels, 6))
+
+
+def test_estimate_stops_once_the_interval_is_narrow_enough():
+    images, labels = make_test_set(20000, 0.9)
+    model = LookupModel(4)
+
+    result = estimate_accuracy(model, images, labels, ci_width=0.05, initial_samples=256, batch_size=100, seed=0)
+
+    # 256, 512, 1024 samples: the interval of 1024 is the first narrower than 5 points
+    assert result["samples"] == 1024
+    assert model.evaluated == 1024
+    assert not result["exact"]
+    assert result["width"] == pytest.approx(result["upper"] - result["lower"])
+    assert result["width"] <= 0.05
+    assert result["lower"] <= 0.9 <= result["upper"]
+    assert (result["lower"], result["upper"]) == wilson_interval(round(result["accuracy"] * 1024), 1024, 20000)
+
+
+def test_estimate_with_zero_width_evaluates_everything():
+    images, labels = make_test_set(1000, 0.75)
+    model = LookupModel(4)
+
+    result = estimate_accuracy(model, images, labels, ci_width=0.0, initial_samples=100, batch_size=64, seed=0)
+
+    assert result["exact"] and result["samples"] == result["total"] == 1000
+    assert model.evaluated == 1000
+    assert result["accuracy"] == result["lower"] == result["upper"] == 0.75
+    # Every image's true class gets probability 0.925 if predicted and 0.025 otherwise
+    assert result["loss"] == pytest.approx(-(0.75 * np.log(0.925) + 0.25 * np.log(0.025)), rel=1e-6)
+
+
+def test_estimate_with_more_initial_samples_than_images():
+    images, labels = make_test_set(50, 0.5)
+    result = estimate_accuracy(LookupModel(4), images, labels, initial_samples=512)
+    assert result["exact"] and result["samples"] == 50 and result["accuracy"] == 0.5
+
+
+@pytest.mark.parametrize("confidence", [0, 1, 1.5, -0.2])
+def test_estimate_rejects_bad_confidence(confidence):
+    images, labels = make_test_set(10, 1.0)
+    with pytest.raises(ValueError, match="confidence"):
+        estimate_accuracy(LookupModel(4), images, labels, confidence=confidence)
+
+
+def test_estimate_rejects_an_empty_test_set():
+    with pytest.raises(ValueError, match="empty"):
+        estimate_accuracy(LookupModel(4), np.zeros((0, 2, 2), dtype=np.uint8), np.zeros(0, dtype=int))
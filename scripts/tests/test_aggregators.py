@@ -0,0 +1,178 @@
+import h5py
+import numpy as np
+import pytest
+
+from aggregators import (
+    coordinate_median, krum_scores, krum_select, pairwise_squared_distances, resolve_method, robust_combine_files,
+    trimmed_mean
+)
+from contribution import read_project_config
+
+
+def reference_trimmed_mean(stacked, trim):
+    """Sorts every column and averages the values between the trim smallest and trim largest."""
+    ordered = np.sort(stacked, axis=0)
+    return ordered[trim:stacked.shape[0] - trim].mean(axis=0)
+
+
+def reference_krum_scores(points, num_byzantine):
+    """Sum of the squared distances to the n - f - 2 nearest other points, one point at a time."""
+    n = len(points)
+    neighbours = min(max(n - num_byzantine - 2, 1), n - 1)
+    scores = []
+    for i in range(n):
+        distances = sorted(float(((points[i] - points[j]) ** 2).sum()) for j in range(n) if j != i)
+        scores.append(sum(distances[:neighbours]))
+    return np.array(scores)
+
+
+def squared_distances_of(points):
+    points = points.astype(np.float64)
+    gram = points @ points.T
+    return pairwise_squared_distances(gram, np.diag(gram).copy())
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 4, 7, 8])
+def test_coordinate_median_matches_numpy(n):
+    stacked = np.random.default_rng(n).standard_normal((n, 50)).astype(np.float32)
+    np.testing.assert_allclose(coordinate_median(stacked), np.median(stacked, axis=0), rtol=1e-6)
+
+
+def test_coordinate_median_with_ties():
+    stacked = np.array([[1, 5, 2], [1, 5, 2], [3, 5, 2], [1, 0, 7]], dtype=np.float32)
+    np.testing.assert_array_equal(coordinate_median(stacked), np.median(stacked, axis=0))
+    np.testing.assert_array_equal(coordinate_median(stacked[:3]), [1, 5, 2])
+
+
+@pytest.mark.parametrize("n, trim_ratio", [(5, 0.0), (5, 0.2), (10, 0.1), (10, 0.25), (9, 0.34)])
+def test_trimmed_mean_matches_sorted_reference(n, trim_ratio):
+    stacked = np.random.default_rng(n).standard_normal((n, 40)).astype(np.float32)
+    trim = int(trim_ratio * n)
+    np.testing.assert_allclose(trimmed_mean(stacked, trim_ratio), reference_trimmed_mean(stacked, trim),
+                               rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("n", [4, 5])
+def test_trimmed_mean_at_its_limit_keeps_the_middle(n):
+    # A ratio of 0.5 or more trims all but the middle one (odd n) or two (even n) values: the median
+    stacked = np.random.default_rng(n).standard_normal((n, 30)).astype(np.float32)
+    for trim_ratio in (0.5, 0.9):
+        np.testing.assert_allclose(trimmed_mean(stacked, trim_ratio), np.median(stacked, axis=0), rtol=1e-6)
+
+
+def test_trimmed_mean_with_ties():
+    stacked = np.array([[1, 2], [1, 2], [1, 9], [7, 2], [1, -4]], dtype=np.float32)
+    np.testing.assert_array_equal(trimmed_mean(stacked, 0.2), reference_trimmed_mean(stacked, 1))
+    np.testing.assert_array_equal(trimmed_mean(stacked, 0.2), [1, 2])
+
+
+@pytest.mark.parametrize("n, num_byzantine", [(5, 1), (7, 2), (9, 3), (6, 0), (3, 2), (2, 0)])
+def test_krum_scores_match_reference(n, num_byzantine):
+    points = np.random.default_rng(n * 10 + num_byzantine).standard_normal((n, 6))
+    np.testing.assert_allclose(
+        krum_scores(squared_distances_of(points), num_byzantine),
+        reference_krum_scores(points, num_byzantine),
+        rtol=1e-9,
+        atol=1e-9,
+    )
+
+
+@pytest.mark.parametrize("n", [5, 7, 9, 11])
+def test_krum_rejects_byzantine_contributions_with_f_at_its_limit(n):
+    # Krum tolerates f Byzantine contributions as long as n > 2f + 2
+    num_byzantine = (n - 3) // 2
+    rng = np.random.default_rng(n)
+    honest = rng.normal(0.0, 0.1, (n - num_byzantine, 8))
+    byzantine = rng.normal(50.0, 1.0, (num_byzantine, 8))
+    points = np.concatenate([byzantine, honest])
+    squared_distances = squared_distances_of(points)
+
+    selected = krum_select(squared_distances, num_byzantine)
+    assert len(selected) == 1 and selected[0] >= num_byzantine
+
+    scores = reference_krum_scores(points, num_byzantine)
+    assert selected[0] == np.argmin(scores)
+
+    multi = krum_select(squared_distances, num_byzantine, n - num_byzantine)
+    np.testing.assert_array_equal(multi, np.arange(num_byzantine, n))
+
+
+def test_krum_with_tied_scores_selects_among_the_lowest():
+    # Three identical contributions tie with score 0, the outlier never wins
+    points = np.array([[1.0, 1.0], [1.0, 1.0], [1.0, 1.0], [9.0, -9.0]])
+    squared_distances = squared_distances_of(points)
+    scores = krum_scores(squared_distances, 1)
+    np.testing.assert_array_equal(scores, reference_krum_scores(points, 1))
+
+    assert krum_select(squared_distances, 1)[0] in (0, 1, 2)
+    np.testing.assert_array_equal(krum_select(squared_distances, 1, 3), [0, 1, 2])
+    # More selected than there are contributions is capped
+    np.testing.assert_array_equal(krum_select(squared_distances, 1, 10), [0, 1, 2, 3])
+
+
+def test_resolve_method_aliases():
+    assert resolve_method("Average") == "mean"
+    assert resolve_method("trimmed-mean") == "trimmed_mean"
+    assert resolve_method("Multi Krum") == "multi_krum"
+    assert resolve_method(None) == "mean"
+    assert resolve_method("something else") == "mean"
+
+
+def write_weights(path, kernel, bias):
+    with h5py.File(path, "w") as f:
+        f["layers/dense/vars/0"] = kernel.astype(np.float32)
+        f["layers/dense/vars/1"] = bias.astype(np.float32)
+        f["optimizer/iterations"] = np.int64(7)
+
+
+@pytest.mark.parametrize("method", ["median", "trimmed_mean", "krum", "multi_krum"])
+def test_robust_combine_files_matches_reference(tmp_path, method):
+    rng = np.random.default_rng(3)
+    kernels = rng.standard_normal((5, 3, 2))
+    biases = rng.standard_normal((5, 2))
+    kernels[0] += 100.0
+    biases[0] -= 100.0
+    write_weights(tmp_path / "global.h5", np.zeros((3, 2)), np.zeros(2))
+    paths = []
+    for i in range(5):
+        write_weights(tmp_path / f"{i}.h5", kernels[i], biases[i])
+        paths.append(str(tmp_path / f"{i}.h5"))
+
+    output = tmp_path / "out.h5"
+    selected = robust_combine_files(str(tmp_path / "global.h5"), paths, 0.25, [1.0] * 5, method, str(output),
+                                    trim_ratio=0.2, num_byzantine=1)
+
+    flat = np.concatenate([kernels.reshape(5, -1), biases], axis=1)
+    if method == "median":
+        expected = np.median(flat, axis=0)
+    elif method == "trimmed_mean":
+        expected = reference_trimmed_mean(flat, 1)
+    else:
+        scores = reference_krum_scores(flat, 1)
+        chosen = [int(np.argmin(scores))] if method == "krum" else sorted(np.argsort(scores)[:4].tolist())
+        assert selected == chosen
+        assert 0 not in selected
+        expected = flat[chosen].mean(axis=0)
+
+    with h5py.File(output, "r") as f:
+        np.testing.assert_allclose(f["layers/dense/vars/0"][()], 0.75 * expected[:6].reshape(3, 2), rtol=1e-5)
+        np.testing.assert_allclose(f["layers/dense/vars/1"][()], 0.75 * expected[6:], rtol=1e-5)
+        assert f["optimizer/iterations"][()] == 7
+
+
+@pytest.mark.parametrize("method, buffer_size, window, warned", [
+    ("median", "1", "0", True),
+    ("krum", "1", "0", True),
+    ("median", "8", "0", False),
+    ("trimmed_mean", "1", "60", False),
+    ("average", "1", "0", False),
+])
+def test_robust_method_without_a_buffer_warns(tmp_path, capsys, method, buffer_size, window, warned):
+    config_path = tmp_path / "config.txt"
+    config_path.write_text(f"combining_method={method}\naggregation_buffer_size={buffer_size}\n"
+                           f"aggregation_window={window}\n")
+
+    config_values = read_project_config(str(config_path))
+
+    assert config_values["combining_method"] == method
+    assert ("is ignored for contributions aggregated one at a time" in capsys.readouterr().out) == warned
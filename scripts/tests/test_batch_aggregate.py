@@ -0,0 +1,68 @@
+from multiprocessing import Pool, shared_memory
+
+import h5py
+import numpy as np
+import pytest
+
+import batch_aggregate
+from batch_aggregate import sequential_coefficients, tensor_layout, tree_reduce
+
+
+@pytest.mark.parametrize("count", [1, 2, 5, 30])
+def test_sequential_coefficients_match_folding_one_at_a_time(count):
+    values = np.random.default_rng(count).standard_normal(count + 1)
+    folded = values[0]
+    for value in values[1:]:
+        folded = (folded + value) / 2
+
+    global_coefficient, coefficients = sequential_coefficients(count)
+
+    assert global_coefficient + sum(coefficients) == 1.0
+    assert global_coefficient * values[0] + np.dot(coefficients, values[1:]) == pytest.approx(folded, rel=1e-12)
+
+
+def test_sequential_coefficients_of_a_long_backlog_underflow_to_zero():
+    global_coefficient, coefficients = sequential_coefficients(2000)
+
+    assert global_coefficient == 0.0
+    assert coefficients[0] == 0.0 and coefficients[-1] == 0.5
+    assert all(a <= b for a, b in zip(coefficients, coefficients[1:]))
+    assert sum(coefficients) == pytest.approx(1.0, rel=1e-15)
+
+
+def test_tree_reduce_sums_and_releases_its_blocks(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    inputs = []
+    for i in range(7):
+        path = str(tmp_path / f"{i}.weights.h5")
+        with h5py.File(path, "w") as f:
+            f["layers/dense/vars/0"] = rng.standard_normal((6, 4)).astype(np.float32)
+            f["layers/dense/vars/1"] = rng.standard_normal(4).astype(np.float32)
+            f["optimizer/iterations"] = np.int64(i)
+        inputs.append((path, float(i + 1) / 10))
+    layout, total_size = tensor_layout(inputs[0][0])
+
+    created = []
+
+    def recording_create_block(size):
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1) * 4)
+        np.ndarray((size,), dtype=np.float32, buffer=block.buf).fill(0.0)
+        created.append(block)
+        return block
+
+    monkeypatch.setattr(batch_aggregate, "create_block", recording_create_block)
+    with Pool(processes=2) as pool:
+        flat = tree_reduce(inputs, layout, total_size, pool, num_leaves=5)
+
+    expected = np.zeros(total_size, dtype=np.float32)
+    for path, coefficient in inputs:
+        with h5py.File(path, "r") as f:
+            expected += np.concatenate([f[name][()].ravel() for name, _, _, _ in layout]) * np.float32(coefficient)
+    np.testing.assert_allclose(flat, expected, rtol=1e-5, atol=1e-6)
+
+    # Every block is closed in this process and its name removed
+    assert len(created) == 5
+    for block in created:
+        assert block.buf is None
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from budget import TrainingBudget, count_steps_per_epoch  # noqa: E402
+
+SAMPLES = 64
+BATCH_SIZE = 8
+
+
+class BatchCounter(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batches += 1
+
+
+def fit_with_budget(epochs=10, **budget_options):
+    """Trains a tiny model on random data with a TrainingBudget and returns (budget, batches run, history)."""
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((SAMPLES, 4)).astype(np.float32)
+    y = np.eye(2, dtype=np.float32)[rng.integers(0, 2, SAMPLES)]
+    model = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2, activation="softmax")])
+    model.compile(optimizer="sgd", loss="categorical_crossentropy")
+
+    budget = TrainingBudget(SAMPLES, **budget_options)
+    counter = BatchCounter()
+    history = model.fit(x, y, batch_size=BATCH_SIZE, epochs=epochs, callbacks=[budget, counter], verbose=0)
+    return budget, counter.batches, history
+
+
+def test_training_stops_on_the_step_budget():
+    budget, batches, history = fit_with_budget(step_budget=13)
+
+    # 8 steps per epoch: one full epoch and 5 steps of the second
+    assert batches == budget.steps == 13
+    assert len(history.history["loss"]) == 2
+    summary = budget.summary()
+    assert summary["stopped_by"] == "steps"
+    assert summary["epochs_trained"] == pytest.approx(1 + 5 / 8)
+    assert summary["samples_trained"] == 104
+    assert summary["planned_steps"] == 13
+
+
+def test_step_budget_beyond_the_epochs_is_not_reached():
+    budget, batches, _ = fit_with_budget(epochs=2, step_budget=100)
+
+    assert batches == 16
+    assert budget.summary()["stopped_by"] == "epochs"
+    assert budget.summary()["planned_steps"] == 16
+    assert budget.samples_trained == 2 * SAMPLES
+
+
+def test_an_expired_time_budget_stops_after_the_first_step():
+    budget, batches, _ = fit_with_budget(time_budget=0.0, step_budget=50)
+
+    assert batches == 1
+    assert budget.summary()["stopped_by"] == "time"
+    assert budget.epochs_trained == pytest.approx(1 / 8)
+
+
+def test_count_steps_per_epoch():
+    assert count_steps_per_epoch([0] * 7, 1000) == 7
+    assert count_steps_per_epoch(iter([]), 65, batch_size=32) == 3
@@ -0,0 +1,114 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+import contribution
+import init
+from contrib_store import sha1_of_file
+from contribution import AGGREGATION_DEFAULTS, buffered_coefficients
+from weights_h5 import read_weight_file
+
+CONFIG = {
+    "input_shape": "4,4",
+    "num_layers": "1",
+    "units_per_layer": "8",
+    "num_classes": "3",
+    "aggregation_buffer_size": "2",
+}
+
+
+def config(**overrides):
+    return dict(AGGREGATION_DEFAULTS, **{key: str(value) for key, value in overrides.items()})
+
+
+def test_fresh_contributions_replace_the_global_model_with_their_sample_weighted_mean():
+    buffer = [{"num_samples": 100, "base_version": 4}, {"num_samples": 300, "base_version": 4}]
+
+    global_coefficient, coefficients = buffered_coefficients(buffer, 4, config())
+
+    assert global_coefficient == pytest.approx(0.0, abs=1e-12)
+    assert coefficients == pytest.approx([0.25, 0.75])
+
+
+@pytest.mark.parametrize("alpha", [0.0, 0.5, 1.0])
+def test_stale_contributions_are_discounted(alpha):
+    # Stale by 0, 3 and 8 versions, the last without a sample count
+    buffer = [
+        {"num_samples": 100, "base_version": 10},
+        {"num_samples": 300, "base_version": 7},
+        {"num_samples": None, "base_version": 2},
+    ]
+
+    global_coefficient, coefficients = buffered_coefficients(buffer, 10, config(staleness_exponent=alpha))
+
+    expected = [100 / 401, 300 * 4.0 ** -alpha / 401, 1 * 9.0 ** -alpha / 401]
+    assert coefficients == pytest.approx(expected)
+    assert global_coefficient == pytest.approx(1.0 - sum(expected))
+    if alpha > 0:
+        assert coefficients[1] / coefficients[0] < 3
+
+
+def test_unknown_or_future_base_versions_count_as_fresh():
+    buffer = [{"num_samples": 10, "base_version": None}, {"num_samples": 10, "base_version": 12}]
+    assert buffered_coefficients(buffer, 10, config())[1] == pytest.approx([0.5, 0.5])
+
+
+def test_server_learning_rate_scales_the_step():
+    buffer = [{"num_samples": 50, "base_version": 1}, {"num_samples": 50, "base_version": 0}]
+
+    global_coefficient, coefficients = buffered_coefficients(buffer, 1, config(server_learning_rate=0.5))
+
+    assert coefficients == pytest.approx([0.25, 0.25 * 2 ** -0.5])
+    assert global_coefficient == pytest.approx(1.0 - sum(coefficients))
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """Initializes a small project that aggregates contributions two at a time."""
+    monkeypatch.chdir(tmp_path)
+    with open("config.txt", "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in CONFIG.items())
+    init.main("alice", "demo", seed=0)
+    return contribution.get_project_paths("alice", "demo")
+
+
+def scaled_initial_weights(paths, output_path, factor):
+    shutil.copyfile(contribution.version_weights_path(paths, 0), output_path)
+    with h5py.File(output_path, "r+") as f:
+        f["layers/dense/vars/0"][...] = f["layers/dense/vars/0"][()] * factor
+    return output_path
+
+
+def upload(paths, factor):
+    temp_path = scaled_initial_weights(paths, os.path.join(paths["contrib_dir"], "upload.tmp"), factor)
+    hash_value = sha1_of_file(temp_path)
+    os.replace(temp_path, os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5"))
+    return hash_value
+
+
+def test_buffer_is_flushed_with_staleness_weights(paths):
+    config_values = contribution.read_project_config(paths["config_path"])
+    for version in range(2):
+        staged = scaled_initial_weights(paths, contribution.staging_weights_path(paths), 1.0)
+        assert contribution.commit_weights(paths, config_values, staged, version) == version + 1
+    initial_kernel = read_weight_file(contribution.version_weights_path(paths, 0))["layers/dense/vars/0"]
+
+    # One contribution trained on the current version 2, one on version 0
+    fresh = upload(paths, 2.0)
+    stale = upload(paths, 3.0)
+    assert contribution.main("alice", "demo", fresh, num_samples=100, base_version=2) is None
+    assert contribution.get_model_version(paths) == 2
+    assert len(contribution.read_buffer(paths)) == 1
+    assert contribution.main("alice", "demo", stale, num_samples=300, base_version=0) is None
+
+    assert contribution.get_model_version(paths) == 3
+    assert contribution.read_buffer(paths) == []
+    fresh_coefficient, stale_coefficient = 0.25, 0.75 * 3 ** -0.5
+    global_coefficient = 1.0 - fresh_coefficient - stale_coefficient
+    expected = (global_coefficient + 2.0 * fresh_coefficient + 3.0 * stale_coefficient) * initial_kernel
+    weights = read_weight_file(paths["model_weights_path"])
+    np.testing.assert_allclose(weights["layers/dense/vars/0"], expected, rtol=1e-5)
+    assert not np.any(weights["layers/dense/vars/1"])
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import random
+import threading
+
+import pytest
+
+from chunked_upload import UploadError, upload_file
+from upload_receiver import make_server
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    """Starts a flaky upload receiver on a free port and yields (server, storage root)."""
+    root = tmp_path / "receiver"
+    server = make_server(str(root), fail_rate=0.3)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, root
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def write_random_file(path, size, seed):
+    path.write_bytes(random.Random(seed).randbytes(size))
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def test_upload_through_flaky_receiver(receiver, tmp_path):
+    server, root = receiver
+    random.seed(0)
+    path = tmp_path / "model.weights.h5"
+    sha1 = write_random_file(path, 200_000 + 123, seed=1)
+    progress = []
+
+    response = upload_file(
+        f"http://127.0.0.1:{server.server_port}/project",
+        {},
+        str(path),
+        sha1,
+        fields={'num_samples': '10'},
+        chunk_size=16 * 1024,
+        max_retries=20,
+        base_delay=0.001,
+        max_delay=0.01,
+        progress=lambda received, total: progress.append((received, total)),
+    )
+
+    assert response.status_code == 200
+    stored = root / "project" / "contrib" / f"{sha1}.weights.h5"
+    assert hashlib.sha1(stored.read_bytes()).hexdigest() == sha1
+    # Only the stored result of the completed upload is left
+    assert os.listdir(root / "project" / "uploads") == [f"{sha1}.result.json"]
+    assert progress[-1] == (path.stat().st_size, path.stat().st_size)
+    assert [received for received, _ in progress] == sorted(received for received, _ in progress)
+
+
+def test_upload_resumes_a_partial_session(receiver, tmp_path):
+    server, root = receiver
+    server.receiver.fail_rate = 0.0
+    path = tmp_path / "model.weights.h5"
+    sha1 = write_random_file(path, 50_000, seed=2)
+
+    # A previous attempt delivered the first 20000 bytes
+    receiver_state = server.receiver
+    receiver_state.start("project", {'sha1': sha1, 'size': 50_000, 'chunk_size': 10_000})
+    data = path.read_bytes()[:20_000]
+    assert receiver_state.put_chunk("project", sha1, 0, hashlib.sha1(data).hexdigest(), data)[0] == 200
+
+    progress = []
+    response = upload_file(
+        f"http://127.0.0.1:{server.server_port}/project",
+        {},
+        str(path),
+        sha1,
+        chunk_size=10_000,
+        progress=lambda received, total: progress.append(received),
+    )
+
+    assert response.status_code == 200
+    assert progress[0] == 20_000
+    stored = root / "project" / "contrib" / f"{sha1}.weights.h5"
+    assert hashlib.sha1(stored.read_bytes()).hexdigest() == sha1
+
+
+def test_complete_is_idempotent(receiver, tmp_path):
+    server, root = receiver
+    server.receiver.fail_rate = 0.0
+    path = tmp_path / "model.weights.h5"
+    sha1 = write_random_file(path, 30_000, seed=3)
+    url = f"http://127.0.0.1:{server.server_port}/project"
+
+    first = upload_file(url, {}, str(path), sha1, chunk_size=10_000)
+    assert first.status_code == 200
+    assert server.receiver.complete("project", sha1) == (200, first.json())
+
+    # Uploading again sends no chunks and gets the stored result
+    progress = []
+    again = upload_file(url, {}, str(path), sha1, chunk_size=10_000,
+                        progress=lambda received, total: progress.append(received))
+    assert again.status_code == 200 and again.json() == first.json()
+    assert progress == [30_000]
+    assert server.receiver.completed == 1
+
+
+def test_complete_is_not_retried_after_a_read_timeout(receiver, tmp_path):
+    server, root = receiver
+    server.receiver.fail_rate = 0.0
+    server.receiver.complete_delay = 0.5
+    path = tmp_path / "model.weights.h5"
+    sha1 = write_random_file(path, 30_000, seed=4)
+    url = f"http://127.0.0.1:{server.server_port}/project"
+
+    with pytest.raises(UploadError) as raised:
+        upload_file(url, {}, str(path), sha1, chunk_size=10_000, base_delay=0.001, complete_timeout=0.1)
+    assert raised.value.status_code == 504
+    assert server.receiver.completed == 1
+
+    # The receiver finished in the meantime, a new attempt picks up its result
+    server.receiver.complete_delay = 0.0
+    response = upload_file(url, {}, str(path), sha1, chunk_size=10_000)
+    assert response.status_code == 200 and response.json()['hash'] == sha1
+    assert server.receiver.completed == 1
+    stored = root / "project" / "contrib" / f"{sha1}.weights.h5"
+    assert hashlib.sha1(stored.read_bytes()).hexdigest() == sha1
@@ -0,0 +1,220 @@
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+import batch_aggregate
+import contribution
+import init
+from contrib_store import ContributionStore, sha1_of_file
+from weights_h5 import read_weight_file
+
+CONFIG = {
+    "input_shape": "4,4",
+    "num_layers": "1",
+    "units_per_layer": "8",
+    "num_classes": "3",
+    "version_retention": "3",
+}
+
+# Copy of the initial weights, which outlives version 0 when it is pruned
+INITIAL_WEIGHTS = "initial.weights.h5"
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """Initializes a small project in a scratch server directory."""
+    monkeypatch.chdir(tmp_path)
+    with open("config.txt", "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in CONFIG.items())
+    init.main("alice", "demo", seed=0)
+    paths = contribution.get_project_paths("alice", "demo")
+    shutil.copyfile(contribution.version_weights_path(paths, 0), INITIAL_WEIGHTS)
+    return paths
+
+
+def scaled_copy(source_path, output_path, factor):
+    """Writes a copy of a weights file with every tensor multiplied by factor."""
+    shutil.copyfile(source_path, output_path)
+    with h5py.File(output_path, "r+") as f:
+        for name, array in read_weight_file(source_path).items():
+            f[name][...] = array * factor
+    return output_path
+
+
+def add_contribution(paths, factor):
+    """Uploads a scaled copy of the initial weights under its SHA1 and returns the hash."""
+    temp_path = scaled_copy(INITIAL_WEIGHTS, os.path.join(paths["contrib_dir"], "upload.tmp"), factor)
+    hash_value = sha1_of_file(temp_path)
+    os.replace(temp_path, os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5"))
+    return hash_value
+
+
+def stage(paths, factor):
+    return scaled_copy(INITIAL_WEIGHTS, contribution.staging_weights_path(paths), factor)
+
+
+def assert_weights_equal(path, expected):
+    actual = read_weight_file(path)
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_allclose(actual[name], expected[name], rtol=1e-6, atol=1e-7)
+
+
+def scaled_weights(factor):
+    return {name: array * factor for name, array in read_weight_file(INITIAL_WEIGHTS).items()}
+
+
+def test_init_creates_version_zero(paths):
+    assert contribution.get_model_version(paths) == 0
+    assert contribution.latest_weights(paths) == (0, contribution.version_weights_path(paths, 0))
+    assert os.path.samefile(paths["model_weights_path"], contribution.version_weights_path(paths, 0))
+
+
+def test_commit_weights_publishes_the_next_version(paths):
+    config_values = contribution.read_project_config(paths["config_path"])
+    staged_path = stage(paths, 2.0)
+
+    with contribution.project_lock(paths):
+        version = contribution.commit_weights(paths, config_values, staged_path, 0)
+
+    assert version == 1
+    assert not os.path.exists(staged_path)
+    assert contribution.get_model_version(paths) == 1
+    with open(paths["version_path"]) as f:
+        assert f.read() == "1\n"
+    version_path = contribution.version_weights_path(paths, 1)
+    assert contribution.latest_weights(paths) == (1, version_path)
+    assert os.path.samefile(paths["model_weights_path"], version_path)
+    assert_weights_equal(version_path, scaled_weights(2.0))
+    # The previous version is kept for compressed updates computed from it
+    assert os.path.exists(contribution.version_weights_path(paths, 0))
+
+
+def test_commit_weights_rejects_a_stale_base_version(paths):
+    config_values = contribution.read_project_config(paths["config_path"])
+    with contribution.project_lock(paths):
+        assert contribution.commit_weights(paths, config_values, stage(paths, 2.0), 0) == 1
+        staged_path = stage(paths, 3.0)
+        assert contribution.commit_weights(paths, config_values, staged_path, 0) is None
+
+    # The loser of the compare-and-swap keeps its staged file and the latest version is untouched
+    assert os.path.exists(staged_path)
+    assert contribution.get_model_version(paths) == 1
+    assert not os.path.exists(contribution.version_weights_path(paths, 2))
+    assert_weights_equal(paths["model_weights_path"], scaled_weights(2.0))
+
+
+def test_commit_weights_prunes_versions_beyond_retention(paths):
+    config_values = contribution.read_project_config(paths["config_path"])
+    with contribution.project_lock(paths):
+        for base_version in range(5):
+            assert contribution.commit_weights(paths, config_values, stage(paths, 1.0), base_version) == base_version + 1
+
+    kept = sorted(name for name in os.listdir(paths["versions_dir"]) if name.endswith(".weights.h5"))
+    assert kept == ["3.weights.h5", "4.weights.h5", "5.weights.h5"]
+
+
+def test_main_folds_a_contribution_into_the_latest_version(paths):
+    hash_value = add_contribution(paths, 3.0)
+
+    assert contribution.main("alice", "demo", hash_value) is None
+
+    assert contribution.get_model_version(paths) == 1
+    assert_weights_equal(paths["model_weights_path"], scaled_weights(2.0))
+    entry = ContributionStore(paths["contrib_dir"]).get(hash_value)
+    assert entry["aggregated"] and entry["aggregated_version"] == 1
+    assert not [name for name in os.listdir(paths["versions_dir"]) if name.startswith("staging-")]
+
+
+@pytest.mark.parametrize("concurrent_commits", [1, contribution.MAX_COMMIT_ATTEMPTS])
+def test_main_retries_when_another_aggregation_commits_first(paths, monkeypatch, concurrent_commits):
+    config_values = contribution.read_project_config(paths["config_path"])
+    hash_value = add_contribution(paths, 3.0)
+    weighted_sum_files = contribution.weighted_sum_files
+    calls = []
+
+    def racing_weighted_sum_files(input_paths, coefficients, output_path):
+        # Another aggregation commits a new version while this one computes the average
+        calls.append(input_paths[0])
+        if len(calls) <= concurrent_commits:
+            with contribution.project_lock(paths):
+                base_version = contribution.get_model_version(paths)
+                contribution.commit_weights(paths, config_values, stage(paths, 5.0), base_version)
+        weighted_sum_files(input_paths, coefficients, output_path)
+
+    monkeypatch.setattr(contribution, "weighted_sum_files", racing_weighted_sum_files)
+    contribution.main("alice", "demo", hash_value)
+
+    # Every attempt starts from the latest version, the last one after all concurrent commits
+    assert len(calls) == concurrent_commits + 1
+    assert calls == [contribution.version_weights_path(paths, version) for version in range(concurrent_commits + 1)]
+    assert contribution.get_model_version(paths) == concurrent_commits + 1
+    assert_weights_equal(paths["model_weights_path"], scaled_weights(4.0))
+    assert ContributionStore(paths["contrib_dir"]).get(hash_value)["aggregated_version"] == concurrent_commits + 1
+    assert not [name for name in os.listdir(paths["versions_dir"]) if name.startswith("staging-")]
+
+
+def test_main_skips_a_contribution_batch_aggregated_meanwhile(paths, monkeypatch):
+    hash_value = add_contribution(paths, 3.0)
+    weighted_sum_files = contribution.weighted_sum_files
+
+    def batch_during_fold(input_paths, coefficients, output_path):
+        # batch_aggregate.py takes the lock between registering the contribution and committing its fold
+        batch_aggregate.main("alice", "demo", workers=1)
+        weighted_sum_files(input_paths, coefficients, output_path)
+
+    monkeypatch.setattr(contribution, "weighted_sum_files", batch_during_fold)
+    contribution.main("alice", "demo", hash_value)
+
+    # Folded in once, by the batch, and not a second time on top of the batch's version
+    assert contribution.get_model_version(paths) == 1
+    assert_weights_equal(paths["model_weights_path"], scaled_weights(2.0))
+    assert ContributionStore(paths["contrib_dir"]).get(hash_value)["aggregated_version"] == 1
+    assert not [name for name in os.listdir(paths["versions_dir"]) if name.startswith("staging-")]
+
+
+@pytest.mark.parametrize("locked", [False, True])
+def test_fold_and_commit_checks_the_index_before_every_attempt(paths, monkeypatch, locked):
+    config_values = contribution.read_project_config(paths["config_path"])
+    hash_value = add_contribution(paths, 3.0)
+    batch_aggregate.main("alice", "demo", workers=1)
+
+    def fail(*args):
+        raise AssertionError("An aggregated contribution was averaged again.")
+
+    monkeypatch.setattr(contribution, "weighted_sum_files", fail)
+    contribution_path = os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5")
+    with contribution.project_lock(paths) if locked else contextlib.nullcontext():
+        assert contribution.fold_and_commit(paths, config_values, hash_value, contribution_path, locked) == 1
+    assert contribution.get_model_version(paths) == 1
+    assert contribution.aggregated_version(paths, hash_value) == 1
+
+
+def test_main_exits_nonzero_when_the_contribution_cannot_be_aggregated(paths):
+    assert contribution.main("alice", "missing", "0" * 40) == contribution.EXIT_FAILURE
+
+    # A missing blob, a file that does not match its hash and a model mismatch reject the upload
+    missing = "0" * 40
+    mismatched = "1" * 40
+    scaled_copy(INITIAL_WEIGHTS, os.path.join(paths["contrib_dir"], f"{mismatched}.weights.h5"), 3.0)
+    incompatible_path = os.path.join(paths["contrib_dir"], "incompatible.tmp")
+    with h5py.File(incompatible_path, "w") as f:
+        f["layers/dense/vars/0"] = np.zeros((2, 2), dtype=np.float32)
+    incompatible = sha1_of_file(incompatible_path)
+    os.replace(incompatible_path, os.path.join(paths["contrib_dir"], f"{incompatible}.weights.h5"))
+
+    for hash_value in (missing, mismatched, incompatible):
+        assert contribution.main("alice", "demo", hash_value) == contribution.EXIT_CONTRIBUTION_REJECTED
+    assert contribution.get_model_version(paths) == 0
+
+    # The exit status reaches the server, which only records contributions that exit with 0
+    script = os.path.join(os.path.dirname(os.path.abspath(contribution.__file__)), "contribution.py")
+    for projectname, status in (("missing", contribution.EXIT_FAILURE), ("demo", contribution.EXIT_CONTRIBUTION_REJECTED)):
+        result = subprocess.run([sys.executable, script, "alice", projectname, missing], capture_output=True, text=True)
+        assert result.returncode == status
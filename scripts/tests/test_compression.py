@@ -0,0 +1,122 @@
+import h5py
+import numpy as np
+import pytest
+
+from compression import UPDATE_FORMAT, encode_update, load_residual
+from contribution import decode_update
+from weights_h5 import read_weight_file
+
+KERNEL = "layers/dense/vars/0"
+BIAS = "layers/dense/vars/1"
+
+
+def write_weights(path, kernel, bias, iterations=0):
+    with h5py.File(path, "w") as f:
+        f[KERNEL] = kernel.astype(np.float32)
+        f[BIAS] = bias.astype(np.float32)
+        f["optimizer/vars/iterations"] = np.int64(iterations)
+    return str(path)
+
+
+@pytest.fixture
+def weights(tmp_path):
+    """Base weights and trained weights that moved away from them."""
+    rng = np.random.default_rng(0)
+    kernel = rng.standard_normal((20, 10))
+    bias = rng.standard_normal(10)
+    base_path = write_weights(tmp_path / "base.weights.h5", kernel, bias, iterations=3)
+    trained_path = write_weights(tmp_path / "trained.weights.h5", kernel + 0.05 * rng.standard_normal(kernel.shape),
+                                 bias + 0.05 * rng.standard_normal(bias.shape), iterations=9)
+    return base_path, trained_path
+
+
+def round_trip(tmp_path, base_path, trained_path, name="decoded", **options):
+    update_path = str(tmp_path / f"{name}.update.h5")
+    stats = encode_update(base_path, trained_path, update_path, **options)
+    decoded_path = str(tmp_path / f"{name}.weights.h5")
+    decode_update(update_path, base_path, decoded_path)
+    return stats, update_path, read_weight_file(decoded_path)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "stochastic"])
+def test_round_trip_is_within_one_quantization_step(tmp_path, weights, quantization):
+    base_path, trained_path = weights
+    residual_path = str(tmp_path / "residual.npz")
+
+    stats, update_path, decoded = round_trip(tmp_path, base_path, trained_path, quantization=quantization,
+                                             residual_path=residual_path, seed=1)
+
+    base, trained, residual = read_weight_file(base_path), read_weight_file(trained_path), load_residual(residual_path)
+    with h5py.File(update_path, "r") as f:
+        assert f.attrs["format"] == UPDATE_FORMAT
+        for name in (KERNEL, BIAS):
+            step = float(f[name].attrs["scale"])
+            limit = step / 2 if quantization == "int8" else step
+            assert np.max(np.abs(decoded[name] - trained[name])) <= limit * 1.001
+            # The residual is exactly what the upload left out
+            np.testing.assert_allclose(decoded[name] - base[name] + residual[name], trained[name] - base[name],
+                                       atol=1e-6)
+    assert 0 < stats["relative_error"] < 0.02
+    assert stats["max_abs_error"] == pytest.approx(max(np.max(np.abs(r)) for r in residual.values()), rel=1e-6)
+
+
+def test_top_k_sends_only_the_largest_entries(tmp_path, weights):
+    base_path, trained_path = weights
+    residual_path = str(tmp_path / "residual.npz")
+
+    stats, update_path, decoded = round_trip(tmp_path, base_path, trained_path, topk_ratio=0.1,
+                                             residual_path=residual_path)
+
+    base, trained = read_weight_file(base_path), read_weight_file(trained_path)
+    delta = (trained[KERNEL] - base[KERNEL]).ravel()
+    with h5py.File(update_path, "r") as f:
+        indices = f[KERNEL]["indices"][()]
+    assert len(indices) == 20
+    assert np.min(np.abs(delta[indices])) >= np.max(np.abs(np.delete(delta, indices)))
+    # Entries that were not sent keep their base value and stay in the residual
+    unsent = np.setdiff1d(np.arange(delta.size), indices)
+    np.testing.assert_array_equal(decoded[KERNEL].ravel()[unsent], base[KERNEL].ravel()[unsent])
+    np.testing.assert_allclose(load_residual(residual_path)[KERNEL].ravel()[unsent], delta[unsent], atol=1e-6)
+
+
+def test_error_feedback_carries_what_was_not_sent_into_the_next_upload(tmp_path, weights):
+    base_path, trained_path = weights
+    base, trained = read_weight_file(base_path), read_weight_file(trained_path)
+    residual_path = str(tmp_path / "residual.npz")
+    rounds = 5
+
+    # The same delta is uploaded every round. Whatever top-k and rounding drop is sent later
+    sent = {name: np.zeros_like(array) for name, array in base.items()}
+    for i in range(rounds):
+        _, _, decoded = round_trip(tmp_path, base_path, trained_path, name=f"round{i}", topk_ratio=0.25,
+                                   residual_path=residual_path)
+        for name in (KERNEL, BIAS):
+            sent[name] += decoded[name] - base[name]
+
+    residual = load_residual(residual_path)
+    for name in (KERNEL, BIAS):
+        delta = trained[name] - base[name]
+        np.testing.assert_allclose(sent[name] + residual[name], rounds * delta, atol=1e-5)
+    # Without feedback the same quarter of the kernel would be sent every round
+    assert np.count_nonzero(sent[KERNEL]) > 0.25 * sent[KERNEL].size
+
+
+def test_decode_keeps_non_float_datasets_of_the_base(tmp_path, weights):
+    base_path, trained_path = weights
+    round_trip(tmp_path, base_path, trained_path)
+    with h5py.File(tmp_path / "decoded.weights.h5", "r") as f:
+        assert f["optimizer/vars/iterations"][()] == 3
+
+
+def test_decode_rejects_a_mismatched_update(tmp_path, weights):
+    base_path, trained_path = weights
+    update_path = str(tmp_path / "u.update.h5")
+    encode_update(base_path, trained_path, update_path)
+    other_path = write_weights(tmp_path / "other.weights.h5", np.zeros((4, 10)), np.zeros(10))
+
+    with pytest.raises(ValueError, match="shape"):
+        decode_update(update_path, other_path, str(tmp_path / "out.weights.h5"))
+    with pytest.raises(ValueError, match="not a compressed model update"):
+        decode_update(base_path, base_path, str(tmp_path / "out.weights.h5"))
+    with pytest.raises(ValueError, match="Unsupported quantization"):
+        encode_update(base_path, trained_path, update_path, quantization="int4")
@@ -0,0 +1,159 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+import contribution
+import init
+from contrib_store import ContributionStore, sha1_of_file
+
+CONFIG = {
+    "input_shape": "4,4",
+    "num_layers": "1",
+    "units_per_layer": "8",
+    "num_classes": "3",
+}
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    """Initializes a small project in a scratch server directory."""
+    monkeypatch.chdir(tmp_path)
+    with open("config.txt", "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in CONFIG.items())
+    init.main("alice", "demo", seed=0)
+    return contribution.get_project_paths("alice", "demo")
+
+
+def upload(paths, factor):
+    """Writes a scaled copy of the initial weights to the contrib directory under its SHA1."""
+    temp_path = os.path.join(paths["contrib_dir"], "upload.tmp")
+    shutil.copyfile(contribution.version_weights_path(paths, 0), temp_path)
+    with h5py.File(temp_path, "r+") as f:
+        f["layers/dense/vars/0"][...] = f["layers/dense/vars/0"][()] * factor
+    hash_value = sha1_of_file(temp_path)
+    os.replace(temp_path, os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5"))
+    return hash_value
+
+
+def blob_path(paths, hash_value):
+    return os.path.join(paths["contrib_dir"], f"{hash_value}.weights.h5")
+
+
+def test_register_records_the_upload(paths):
+    hash_value = upload(paths, 2.0)
+
+    with contribution.project_lock(paths):
+        weights_path = contribution.register_contribution(paths, hash_value, "bob", 128, 0)
+
+    assert weights_path == blob_path(paths, hash_value)
+    entry = ContributionStore(paths["contrib_dir"]).get(hash_value)
+    assert entry["size"] == os.path.getsize(weights_path)
+    assert (entry["encoding"], entry["precision"]) == ("weights", "float32")
+    assert (entry["contributor"], entry["num_samples"], entry["base_version"]) == ("bob", 128, 0)
+    assert not entry["aggregated"] and not entry["collected"] and not entry["rejected"]
+
+
+def test_duplicate_hash_is_skipped(paths):
+    hash_value = upload(paths, 2.0)
+    assert contribution.main("alice", "demo", hash_value) is None
+    assert contribution.get_model_version(paths) == 1
+
+    # The same content again is not aggregated a second time, its blob is still retained
+    assert contribution.main("alice", "demo", hash_value) is None
+    assert contribution.get_model_version(paths) == 1
+    assert os.path.exists(blob_path(paths, hash_value))
+
+    # Once collected, a re-uploaded blob is deleted right away
+    store = ContributionStore(paths["contrib_dir"])
+    assert store.collect_garbage(keep_count=0) > 0
+    store.save()
+    assert not os.path.exists(blob_path(paths, hash_value))
+    assert upload(paths, 2.0) == hash_value
+    with contribution.project_lock(paths):
+        assert contribution.register_contribution(paths, hash_value) is None
+    assert not os.path.exists(blob_path(paths, hash_value))
+    assert contribution.get_model_version(paths) == 1
+
+
+@pytest.mark.parametrize("problem", ["mismatched", "corrupt", "incompatible"])
+def test_bad_uploads_are_rejected_and_deleted(paths, problem):
+    if problem == "mismatched":
+        hash_value = "1" * 40
+        shutil.copyfile(paths["model_weights_path"], blob_path(paths, hash_value))
+    else:
+        temp_path = os.path.join(paths["contrib_dir"], "upload.tmp")
+        if problem == "corrupt":
+            with open(temp_path, "wb") as f:
+                f.write(b"not an hdf5 file")
+        else:
+            with h5py.File(temp_path, "w") as f:
+                f["layers/dense/vars/0"] = np.zeros((2, 2), dtype=np.float32)
+        hash_value = sha1_of_file(temp_path)
+        os.replace(temp_path, blob_path(paths, hash_value))
+
+    with contribution.project_lock(paths):
+        with pytest.raises(contribution.ContributionRejected):
+            contribution.register_contribution(paths, hash_value)
+
+    # Not in the index, so the right content can still be uploaded under the hash
+    assert ContributionStore(paths["contrib_dir"]).get(hash_value) is None
+    assert not os.path.exists(blob_path(paths, hash_value))
+    assert contribution.main("alice", "demo", hash_value) == contribution.EXIT_CONTRIBUTION_REJECTED
+
+
+def add_aggregated(store, hash_value, received, size=100):
+    for path in store.blob_paths(hash_value)[:1]:
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+    store.entries[hash_value] = {
+        "size": size, "received": received, "aggregated": True, "aggregated_version": 1, "collected": False,
+    }
+
+
+def test_collect_garbage_keeps_the_newest_count(tmp_path):
+    store = ContributionStore(str(tmp_path))
+    for i in range(5):
+        add_aggregated(store, f"{i:040x}", received=1000 + i)
+    store.entries["f" * 40] = {"size": 0, "received": 0, "aggregated": False, "collected": False}
+
+    assert store.collect_garbage(keep_count=2, now=2000) == 300
+
+    collected = {hash_value for hash_value, entry in store.entries.items() if entry["collected"]}
+    assert collected == {f"{i:040x}" for i in range(3)}
+    for i in range(5):
+        assert os.path.exists(store.blob_paths(f"{i:040x}")[0]) == (i >= 3)
+    # Entries are kept to recognize duplicates, and unaggregated ones are never collected
+    assert len(store.entries) == 6 and not store.entries["f" * 40]["collected"]
+
+    assert store.collect_garbage(keep_count=2, now=2000) == 0
+    assert store.collect_garbage(keep_count=0, now=2000) == 200
+
+
+def test_collect_garbage_keeps_recent_contributions(tmp_path):
+    store = ContributionStore(str(tmp_path))
+    for i in range(4):
+        add_aggregated(store, f"{i:040x}", received=1000 + i * 100)
+
+    # Older than 150 seconds at 1300: received at 1000 and 1100
+    assert store.collect_garbage(keep_seconds=150, now=1300) == 200
+    assert [entry["collected"] for _, entry in sorted(store.entries.items())] == [True, True, False, False]
+
+    # Both limits apply: the newest is kept by count, the one before it by age
+    assert store.collect_garbage(keep_count=1, keep_seconds=250, now=1400) == 0
+    assert store.collect_garbage(keep_count=1, keep_seconds=50, now=1400) == 100
+    assert [entry["collected"] for _, entry in sorted(store.entries.items())] == [True, True, True, False]
+
+
+def test_index_survives_a_reload(tmp_path):
+    store = ContributionStore(str(tmp_path))
+    add_aggregated(store, "a" * 40, received=5)
+    store.reject("b" * 40, "corrupt")
+    store.save()
+
+    reloaded = ContributionStore(str(tmp_path))
+    assert reloaded.entries == store.entries
+    assert reloaded.get("b" * 40)["rejected"] and reloaded.get("b" * 40)["reason"] == "corrupt"
+    assert reloaded.get("c" * 40) is None
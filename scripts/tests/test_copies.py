@@ -0,0 +1,26 @@
+import filecmp
+import os
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(SCRIPTS_DIR, "server")
+CLIENT_DIR = os.path.join(SCRIPTS_DIR, "client")
+DEPLOYED_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), "Server", "py")
+
+# Modules the client ships its own copy of
+SHARED_WITH_CLIENT = ("image_settings.py", "precision.py", "timing.py", "weights_sync.py")
+
+
+@pytest.mark.parametrize("name", sorted(name for name in os.listdir(DEPLOYED_DIR) if name.endswith(".py")))
+def test_deployed_copy_matches_the_server_script(name):
+    path = os.path.join(DEPLOYED_DIR, name)
+    assert not os.path.islink(path)
+    assert filecmp.cmp(path, os.path.join(SERVER_DIR, name), shallow=False)
+
+
+@pytest.mark.parametrize("name", SHARED_WITH_CLIENT)
+def test_client_copy_matches_the_server_module(name):
+    path = os.path.join(CLIENT_DIR, name)
+    assert not os.path.islink(path)
+    assert filecmp.cmp(path, os.path.join(SERVER_DIR, name), shallow=False)
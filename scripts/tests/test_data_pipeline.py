@@ -0,0 +1,77 @@
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from data_pipeline import list_image_files, list_zip_images  # noqa: E402
+
+# Class folders: one with images, one empty, one without images, one with images in a subfolder
+FILES = {
+    "cat/1.png": b"png",
+    "cat/2.JPG": b"jpg",
+    "cat/notes.txt": b"text",
+    "notes/readme.md": b"text",
+    "zebra/nested/3.png": b"png",
+    "zebra/4.jpeg": b"jpg",
+}
+EMPTY_CLASSES = ("empty",)
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """A class-per-folder dataset on disk, like extract_dataset leaves it."""
+    root = tmp_path / "training_data"
+    for name, data in FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    for name in EMPTY_CLASSES:
+        (root / name).mkdir()
+    return str(root)
+
+
+def write_zip(zip_path, dataset_dir, prefix, directory_entries):
+    """Zips the dataset under prefix, with or without entries for folders that hold files."""
+    with zipfile.ZipFile(zip_path, "w") as zip_file:
+        for root, dirs, files in os.walk(dataset_dir):
+            relative_root = os.path.relpath(root, dataset_dir).replace(os.sep, "/")
+            relative_root = "" if relative_root == "." else f"{relative_root}/"
+            if relative_root and (directory_entries or not files and not dirs):
+                zip_file.writestr(f"{prefix}{relative_root}", b"")
+            for filename in files:
+                zip_file.write(os.path.join(root, filename), f"{prefix}{relative_root}{filename}")
+        zip_file.writestr("__MACOSX/._cat", b"")
+    return str(zip_path)
+
+
+@pytest.mark.parametrize("prefix", ["", "dataset/"])
+@pytest.mark.parametrize("directory_entries", [True, False])
+def test_zip_listing_matches_the_extracted_dataset(tmp_path, dataset_dir, prefix, directory_entries):
+    zip_path = write_zip(tmp_path / "dataset.zip", dataset_dir, prefix, directory_entries)
+
+    with zipfile.ZipFile(zip_path) as zip_file:
+        member_names, labels, class_indices = list_zip_images(zip_file)
+    file_paths, file_labels, file_class_indices = list_image_files(dataset_dir)
+
+    assert class_indices == file_class_indices == {"cat": 0, "empty": 1, "notes": 2, "zebra": 3}
+    assert labels == file_labels
+    assert [name[len(prefix):] for name in member_names] == [
+        os.path.relpath(path, dataset_dir).replace(os.sep, "/") for path in file_paths
+    ]
+
+
+def test_zip_listing_matches_flow_from_directory(tmp_path, dataset_dir):
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    zip_path = write_zip(tmp_path / "dataset.zip", dataset_dir, "dataset/", directory_entries=False)
+    with zipfile.ZipFile(zip_path) as zip_file:
+        member_names, labels, class_indices = list_zip_images(zip_file)
+
+    generator = ImageDataGenerator().flow_from_directory(dataset_dir, shuffle=False)
+
+    assert class_indices == generator.class_indices
+    assert sorted(zip(member_names, labels)) == sorted(
+        (f"dataset/{name}", label) for name, label in zip(generator.filenames, generator.classes)
+    )
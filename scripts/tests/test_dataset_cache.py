@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from dataset_cache import DatasetCache  # noqa: E402
+
+
+def add_entry(cache, project, dataset_hash, last_used, size_bytes=100):
+    """Writes a cache entry's directory and index without building any shards."""
+    entry_dir = cache.entry_dir(os.path.join(cache.projects_dir, project), dataset_hash, (8, 8), 3)
+    os.makedirs(entry_dir)
+    cache.write_index(entry_dir, {'samples': 1, 'class_indices': {}, 'shape': [8, 8, 3], 'shards': [],
+                                  'size_bytes': size_bytes, 'created': last_used, 'last_used': last_used})
+    return entry_dir
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DatasetCache(str(tmp_path / "projects"), limit_bytes=250)
+
+
+def test_evicts_the_least_recently_used_entries_of_all_projects(cache):
+    oldest = add_entry(cache, "a", "1" * 40, last_used=100)
+    middle = add_entry(cache, "b", "2" * 40, last_used=200)
+    newest = add_entry(cache, "a", "3" * 40, last_used=300)
+
+    assert cache.evict() == 100
+    assert not os.path.exists(oldest)
+    assert os.path.exists(middle) and os.path.exists(newest)
+    # Under the limit now, nothing else goes
+    assert cache.evict() == 0
+
+
+def test_lookup_marks_an_entry_as_used(cache):
+    looked_up = add_entry(cache, "a", "1" * 40, last_used=100)
+    unused = add_entry(cache, "a", "2" * 40, last_used=200)
+    add_entry(cache, "a", "3" * 40, last_used=300)
+
+    assert cache.lookup(looked_up)['last_used'] > 300
+    assert cache.lookup(cache.entry_dir("missing", "4" * 40, (8, 8), 3)) is None
+
+    assert cache.evict() == 100
+    assert os.path.exists(looked_up) and not os.path.exists(unused)
+
+
+def test_pinned_entries_are_never_evicted(cache):
+    pinned = add_entry(cache, "a", "1" * 40, last_used=100)
+    second = add_entry(cache, "a", "2" * 40, last_used=200)
+    newest = add_entry(cache, "b", "3" * 40, last_used=300)
+    cache.pin(pinned)
+    cache.pin(pinned)
+    try:
+        # The next least recently used entry goes instead
+        assert cache.evict() == 100
+        assert os.path.exists(pinned) and not os.path.exists(second)
+
+        # Pinned by two jobs, one release is not enough
+        cache.limit_bytes = 0
+        cache.release(pinned)
+        assert cache.evict() == 100
+        assert os.path.exists(pinned) and not os.path.exists(newest)
+    finally:
+        cache.release(pinned)
+
+    assert cache.evict() == 100
+    assert not os.path.exists(pinned)
+
+
+def test_eviction_stops_when_only_pinned_entries_are_left(cache):
+    entries = [add_entry(cache, "a", f"{i}" * 40, last_used=i) for i in range(1, 5)]
+    for entry_dir in entries:
+        cache.pin(entry_dir)
+    try:
+        assert cache.evict() == 0
+        assert all(os.path.exists(entry_dir) for entry_dir in entries)
+    finally:
+        for entry_dir in entries:
+            cache.release(entry_dir)
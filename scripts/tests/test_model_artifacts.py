@@ -0,0 +1,77 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+
+from model_artifacts import build_model_config, write_initial_weights
+from weights_h5 import list_weight_datasets
+
+# Two hidden layers, so the names run past the first of each kind: dense_1, dropout_1, dense_2
+EXPECTED_DATASETS = [
+    ("layers/dense/vars/0", (48, 16), np.float32),
+    ("layers/dense/vars/1", (16,), np.float32),
+    ("layers/dense_1/vars/0", (16, 16), np.float32),
+    ("layers/dense_1/vars/1", (16,), np.float32),
+    ("layers/dense_2/vars/0", (16, 5), np.float32),
+    ("layers/dense_2/vars/1", (5,), np.float32),
+]
+EXPECTED_LAYERS = ["dense", "dense_1", "dense_2", "dropout", "dropout_1", "flatten"]
+
+
+def model_config():
+    return build_model_config((4, 4, 3), "relu", 0.2, 2, 16, 5)
+
+
+def layer_groups(weights_path):
+    """Names under layers/ and the datasets each of their vars groups holds."""
+    with h5py.File(weights_path, "r") as f:
+        return {name: sorted(group["vars"].keys()) for name, group in f["layers"].items()}
+
+
+def test_initial_weights_layout(tmp_path):
+    weights_path = str(tmp_path / "model.weights.h5")
+
+    parameters = write_initial_weights(model_config(), weights_path, seed=0)
+
+    assert list_weight_datasets(weights_path) == EXPECTED_DATASETS
+    assert parameters == sum(int(np.prod(shape)) for _, shape, _ in EXPECTED_DATASETS)
+    # Flatten and Dropout have no variables but still get an empty vars group
+    groups = layer_groups(weights_path)
+    assert sorted(groups) == EXPECTED_LAYERS
+    assert groups["dropout"] == groups["dropout_1"] == groups["flatten"] == []
+    with h5py.File(weights_path, "r") as f:
+        limit = np.sqrt(6.0 / (48 + 16))
+        assert np.all(np.abs(f["layers/dense/vars/0"][()]) <= limit)
+        assert not np.any(f["layers/dense/vars/1"][()])
+
+
+def test_initial_weights_are_seeded(tmp_path):
+    paths = [str(tmp_path / f"{i}.weights.h5") for i in range(3)]
+    for path, seed in zip(paths, (1, 1, 2)):
+        write_initial_weights(model_config(), path, seed=seed)
+    with h5py.File(paths[0], "r") as a, h5py.File(paths[1], "r") as b, h5py.File(paths[2], "r") as c:
+        kernel = "layers/dense/vars/0"
+        np.testing.assert_array_equal(a[kernel][()], b[kernel][()])
+        assert not np.array_equal(a[kernel][()], c[kernel][()])
+
+
+def test_initial_weights_round_trip_through_keras(tmp_path):
+    keras = pytest.importorskip("keras")
+    config = model_config()
+    weights_path = str(tmp_path / "model.weights.h5")
+    write_initial_weights(config, weights_path, seed=0)
+
+    model = keras.models.model_from_json(json.dumps(config))
+    model.load_weights(weights_path)
+
+    with h5py.File(weights_path, "r") as f:
+        expected = [f[name][()] for name, _, _ in EXPECTED_DATASETS]
+    for loaded, written in zip(model.get_weights(), expected):
+        np.testing.assert_array_equal(loaded, written)
+
+    # The file Keras writes itself for the same model has the same layout
+    reference_path = str(tmp_path / "reference.weights.h5")
+    model.save_weights(reference_path)
+    assert list_weight_datasets(reference_path) == list_weight_datasets(weights_path)
+    assert layer_groups(reference_path) == layer_groups(weights_path)
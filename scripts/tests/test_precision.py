@@ -0,0 +1,142 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from precision import check_precision, convert_weight_file, file_precision, tensor_precision
+
+
+def to_bfloat16(values):
+    """Rounds float32 values to the nearest bfloat16, ties to even, and widens them back to float32."""
+    bits = np.asarray(values, dtype=np.float32).view(np.uint32).astype(np.uint64)
+    rounded = (bits + 0x7FFF + ((bits >> 16) & 1)) >> 16 << 16
+    return rounded.astype(np.uint32).view(np.float32)
+
+
+@pytest.fixture
+def weights_path(tmp_path):
+    """A small weights file laid out like the ones Keras writes."""
+    rng = np.random.default_rng(0)
+    path = tmp_path / "model.weights.h5"
+    with h5py.File(path, "w") as f:
+        f.attrs["keras_version"] = "3.0.0"
+        layer = f.create_group("layers/dense/vars")
+        layer.attrs["name"] = "dense"
+        layer["0"] = rng.standard_normal((128, 64)).astype(np.float32) * 3
+        layer["1"] = np.array([0.0, -0.0, 1e-3, 65504.0], dtype=np.float32)
+        f["layers/dense/vars/0"].attrs["trainable"] = True
+        f["layers/empty/vars/0"] = np.zeros((0, 3), dtype=np.float32)
+        f["optimizer/vars/learning_rate"] = np.float32(0.001)
+        f["optimizer/vars/iterations"] = np.int64(42)
+        f.create_group("layers/dropout/vars")
+    return str(path)
+
+
+def read_file(path):
+    """Dataset name to (value as float32 or as stored, precision), plus every attribute."""
+    datasets = {}
+    attributes = {}
+
+    def visit(name, obj):
+        attributes[name] = dict(obj.attrs)
+        if isinstance(obj, h5py.Dataset):
+            precision = tensor_precision(obj)
+            datasets[name] = (obj[()].astype(np.float32) if precision else obj[()], precision)
+
+    with h5py.File(path, "r") as f:
+        attributes["/"] = dict(f.attrs)
+        f.visititems(visit)
+    return datasets, attributes
+
+
+def test_check_precision():
+    for precision in ("float32", "float16", "bfloat16"):
+        assert check_precision(precision) == precision
+    with pytest.raises(ValueError):
+        check_precision("int8")
+
+
+@pytest.mark.parametrize("precision, rounding", [("float16", lambda v: v.astype(np.float16)), ("bfloat16", to_bfloat16)])
+def test_convert_rounds_to_nearest_and_preserves_layout(weights_path, tmp_path, precision, rounding):
+    output_path = str(tmp_path / f"{precision}.weights.h5")
+    size = convert_weight_file(weights_path, output_path, precision)
+
+    assert size == os.path.getsize(output_path)
+    assert size < os.path.getsize(weights_path)
+    assert file_precision(weights_path) == "float32"
+    assert file_precision(output_path) == precision
+
+    original, original_attributes = read_file(weights_path)
+    converted, converted_attributes = read_file(output_path)
+    assert converted.keys() == original.keys()
+    assert converted_attributes == original_attributes
+
+    tolerance = {"float16": 1e-3, "bfloat16": 1e-2}[precision]
+    for name, (values, original_precision) in original.items():
+        converted_values, converted_precision = converted[name]
+        assert converted_values.shape == values.shape
+        if original_precision is None:
+            # Integer tensors are copied as they are
+            assert converted_precision is None
+            assert converted_values == values
+            continue
+        assert converted_precision == precision
+        np.testing.assert_array_equal(converted_values, np.asarray(rounding(values), dtype=np.float32))
+        np.testing.assert_allclose(converted_values, values, rtol=tolerance, atol=1e-6)
+
+    with h5py.File(output_path, "r") as f:
+        # Signed zeros survive the conversion
+        assert np.signbit(f["layers/dense/vars/1"][()][1])
+        assert "layers/dropout/vars" in f
+
+
+@pytest.mark.parametrize("precision", ["float16", "bfloat16"])
+def test_round_trip_back_to_float32(weights_path, tmp_path, precision):
+    reduced_path = str(tmp_path / "reduced.weights.h5")
+    restored_path = str(tmp_path / "restored.weights.h5")
+    convert_weight_file(weights_path, reduced_path, precision)
+    convert_weight_file(reduced_path, restored_path, "float32")
+
+    assert file_precision(restored_path) == "float32"
+    reduced, _ = read_file(reduced_path)
+    restored, restored_attributes = read_file(restored_path)
+    assert restored_attributes == read_file(weights_path)[1]
+    for name, (values, restored_precision) in restored.items():
+        # Widening is exact, the values are those of the reduced file
+        if restored_precision is not None:
+            assert restored_precision == "float32"
+        np.testing.assert_array_equal(values, reduced[name][0])
+
+    # Converting a reduced file again does not round a second time
+    again_path = str(tmp_path / "again.weights.h5")
+    convert_weight_file(restored_path, again_path, precision)
+    for name, (values, _) in read_file(again_path)[0].items():
+        np.testing.assert_array_equal(values, reduced[name][0])
+
+
+def test_convert_in_place(weights_path):
+    original, _ = read_file(weights_path)
+    convert_weight_file(weights_path, weights_path, "float16")
+
+    assert file_precision(weights_path) == "float16"
+    assert not [name for name in os.listdir(os.path.dirname(weights_path)) if name.endswith(".tmp")]
+    converted, _ = read_file(weights_path)
+    np.testing.assert_array_equal(converted["layers/dense/vars/0"][0],
+                                  original["layers/dense/vars/0"][0].astype(np.float16).astype(np.float32))
+
+
+def test_unsupported_precision_leaves_no_output(weights_path, tmp_path):
+    output_path = str(tmp_path / "out.weights.h5")
+    with pytest.raises(ValueError):
+        convert_weight_file(weights_path, output_path, "float8")
+    assert not os.path.exists(output_path)
+
+
+def test_file_precision_of_a_file_without_floats(tmp_path):
+    path = str(tmp_path / "ints.h5")
+    with h5py.File(path, "w") as f:
+        f["iterations"] = np.int64(3)
+    assert file_precision(path) == "float32"
+    with h5py.File(path, "r") as f:
+        assert tensor_precision(f["iterations"]) is None
@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+
+from testset_cache import index_matches, install_cache, read_index
+
+
+def write_build(tmp_path, name, fingerprint, shape=(8, 8, 3), value=0):
+    """A finished cache build directory like build_test_cache leaves before installing it."""
+    build_dir = tmp_path / name
+    build_dir.mkdir()
+    np.save(build_dir / "images.npy", np.full((2,) + shape, value, dtype=np.uint8))
+    np.save(build_dir / "labels.npy", np.zeros(2, dtype=np.int32))
+    index = {'fingerprint': fingerprint, 'samples': 2, 'shape': list(shape), 'color_mode': 'rgb',
+             'class_indices': {'a': 0}}
+    (build_dir / "index.json").write_text(json.dumps(index))
+    return str(build_dir), index
+
+
+def test_index_matches():
+    index = {'fingerprint': 'f', 'shape': [8, 8, 3], 'color_mode': 'rgb'}
+    assert index_matches(index, 'f', (8, 8, 3), 'rgb')
+    assert not index_matches(index, 'g', (8, 8, 3), 'rgb')
+    assert not index_matches(index, 'f', (8, 8, 1), 'rgb')
+    assert not index_matches(index, 'f', (8, 8, 3), 'grayscale')
+    assert not index_matches(None, 'f', (8, 8, 3), 'rgb')
+
+
+def test_install_into_an_empty_project(tmp_path):
+    cache_dir = str(tmp_path / "test_cache")
+    build_dir, index = write_build(tmp_path, "test_cache.a.tmp", "f")
+
+    assert install_cache(build_dir, cache_dir) == index
+    assert read_index(cache_dir) == index
+    assert not os.path.exists(build_dir)
+
+
+def test_losing_the_race_uses_the_winners_cache(tmp_path):
+    cache_dir = str(tmp_path / "test_cache")
+    first_dir, first_index = write_build(tmp_path, "test_cache.a.tmp", "f", value=1)
+    second_dir, _ = write_build(tmp_path, "test_cache.b.tmp", "f", value=2)
+
+    install_cache(first_dir, cache_dir)
+    assert install_cache(second_dir, cache_dir) == first_index
+
+    # The second build is dropped, the installed files are left alone
+    assert not os.path.exists(second_dir)
+    assert np.load(os.path.join(cache_dir, "images.npy"))[0, 0, 0, 0] == 1
+    assert sorted(os.listdir(tmp_path)) == ["test_cache"]
+
+
+def test_a_stale_cache_is_replaced(tmp_path):
+    cache_dir = str(tmp_path / "test_cache")
+    old_dir, _ = write_build(tmp_path, "test_cache.a.tmp", "old", value=1)
+    install_cache(old_dir, cache_dir)
+    new_dir, new_index = write_build(tmp_path, "test_cache.b.tmp", "new", shape=(4, 4, 1), value=2)
+
+    assert install_cache(new_dir, cache_dir) == new_index
+    assert read_index(cache_dir) == new_index
+    assert np.load(os.path.join(cache_dir, "images.npy")).shape == (2, 4, 4, 1)
+    assert sorted(os.listdir(tmp_path)) == ["test_cache"]
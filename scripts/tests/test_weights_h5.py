@@ -0,0 +1,96 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from weights_h5 import check_compatible, is_aggregatable, list_weight_datasets, read_weight_file, weighted_sum_files
+
+FLOAT_TENSORS = ("layers/dense/vars/0", "layers/dense/vars/1", "layers/dense_1/vars/0")
+
+
+def write_weights(path, seed, iterations=0):
+    """A small .weights.h5 file with float tensors, a float64 scalar and an integer counter."""
+    rng = np.random.default_rng(seed)
+    with h5py.File(path, "w") as f:
+        f.attrs["keras_version"] = "3.0.0"
+        f["layers/dense/vars/0"] = rng.standard_normal((5, 3)).astype(np.float32)
+        f["layers/dense/vars/1"] = rng.standard_normal(3).astype(np.float32)
+        f["layers/dense_1/vars/0"] = rng.standard_normal((3, 2)).astype(np.float16)
+        f.create_group("layers/dropout/vars")
+        f["optimizer/vars/learning_rate"] = np.float64(0.01 * (seed + 1))
+        f["optimizer/vars/iterations"] = np.int64(iterations)
+    return str(path)
+
+
+def read_all(path):
+    with h5py.File(path, "r") as f:
+        return {name: f[name][()] for name, _, _ in list_weight_datasets(path)}
+
+
+def test_is_aggregatable():
+    assert is_aggregatable(np.float32) and is_aggregatable(np.float16) and is_aggregatable(np.float64)
+    assert not is_aggregatable(np.int64) and not is_aggregatable(np.uint8) and not is_aggregatable(np.bool_)
+
+
+@pytest.mark.parametrize("coefficients", [[0.5, 0.5], [0.2, 0.3, 0.5], [1.0, -1.0, 0.25]])
+def test_weighted_sum_matches_numpy(tmp_path, coefficients):
+    paths = [write_weights(tmp_path / f"{i}.weights.h5", i, iterations=10 + i) for i in range(len(coefficients))]
+    output_path = str(tmp_path / "out.weights.h5")
+
+    weighted_sum_files(paths, coefficients, output_path)
+
+    inputs = [read_all(path) for path in paths]
+    result = read_all(output_path)
+    assert result.keys() == inputs[0].keys()
+    for name, value in result.items():
+        template = inputs[0][name]
+        assert value.dtype == template.dtype and value.shape == template.shape
+        if not is_aggregatable(template.dtype):
+            # Non-float datasets pass through from the template unchanged
+            assert value == template
+            continue
+        expected = sum(np.float32(c) * weights[name].astype(np.float32) for c, weights in zip(coefficients, inputs))
+        rtol = 1e-3 if value.dtype == np.float16 else 1e-6
+        np.testing.assert_allclose(value, expected.astype(template.dtype), rtol=rtol)
+    assert result["optimizer/vars/iterations"] == 10
+    with h5py.File(output_path, "r") as f:
+        assert f.attrs["keras_version"] == "3.0.0"
+
+
+def test_weighted_sum_with_a_template_and_in_place(tmp_path):
+    paths = [write_weights(tmp_path / f"{i}.weights.h5", i, iterations=i) for i in range(2)]
+    template_path = write_weights(tmp_path / "template.weights.h5", 7, iterations=99)
+    before = [read_all(path) for path in paths]
+
+    weighted_sum_files(paths, [0.5, 0.5], paths[0], template_path=template_path)
+
+    result = read_all(paths[0])
+    assert result["optimizer/vars/iterations"] == 99
+    for name in FLOAT_TENSORS:
+        expected = (before[0][name].astype(np.float32) + before[1][name].astype(np.float32)) / 2
+        np.testing.assert_allclose(result[name], expected.astype(result[name].dtype), rtol=1e-3)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_read_weight_file_skips_non_float_datasets(tmp_path):
+    path = write_weights(tmp_path / "w.weights.h5", 0)
+    weights = read_weight_file(path)
+    assert sorted(weights) == sorted(FLOAT_TENSORS + ("optimizer/vars/learning_rate",))
+    assert all(array.dtype == np.float32 for array in weights.values())
+
+
+def test_incompatible_files_are_rejected(tmp_path):
+    path = write_weights(tmp_path / "a.weights.h5", 0)
+    other_path = str(tmp_path / "b.weights.h5")
+    with h5py.File(other_path, "w") as f:
+        f["layers/dense/vars/0"] = np.zeros((4, 3), dtype=np.float32)
+    output_path = str(tmp_path / "out.weights.h5")
+
+    with pytest.raises(ValueError, match="do not match"):
+        check_compatible(list_weight_datasets(path), other_path)
+    with pytest.raises(ValueError, match="do not match"):
+        weighted_sum_files([path, other_path], [0.5, 0.5], output_path)
+    with pytest.raises(ValueError, match="one coefficient"):
+        weighted_sum_files([path], [0.5, 0.5], output_path)
+    assert not os.path.exists(output_path)
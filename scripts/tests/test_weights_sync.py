@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import zlib
+
+import h5py
+import numpy as np
+import pytest
+
+from precision import convert_weight_file
+from weights_sync import (
+    WEIGHTS_MANIFEST, apply_manifest, build_weights_manifest, decode_tensor, encode_tensor, read_raw, tensor_manifest
+)
+
+TENSORS = ("layers/dense/vars/0", "layers/dense/vars/1", "layers/output/vars/0", "layers/output/vars/1")
+
+
+@pytest.fixture
+def project_dir(tmp_path):
+    """A project directory holding the files build_weights_manifest reads."""
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "model_config.json").write_text("{}")
+    rng = np.random.default_rng(0)
+    with h5py.File(project_dir / "model.weights.h5", "w") as f:
+        f.attrs["keras_version"] = "3.0.0"
+        f["layers/dense/vars/0"] = rng.standard_normal((32, 16)).astype(np.float32)
+        f["layers/dense/vars/1"] = np.zeros(16, dtype=np.float32)
+        f["layers/output/vars/0"] = rng.standard_normal((16, 4)).astype(np.float32)
+        f["layers/output/vars/1"] = np.zeros(4, dtype=np.float32)
+        f["optimizer/vars/iterations"] = np.int64(0)
+    return str(project_dir)
+
+
+def update_global(project_dir, version, names=TENSORS[:2]):
+    """Trains the global model a little: nudges some tensors and publishes the next manifest."""
+    rng = np.random.default_rng(version)
+    with h5py.File(os.path.join(project_dir, "model.weights.h5"), "r+") as f:
+        for name in names:
+            f[name][...] += rng.normal(0.0, 1e-3, f[name].shape).astype(np.float32)
+    return build_weights_manifest(project_dir, version)
+
+
+def fetcher(project_dir, fetched):
+    def fetch(blob):
+        fetched.append(blob)
+        with open(os.path.join(project_dir, blob), "rb") as f:
+            return f.read()
+    return fetch
+
+
+def sha256s(weights_path):
+    return {name: entry["sha256"] for name, entry in tensor_manifest(weights_path).items()}
+
+
+@pytest.mark.parametrize("dtype, itemsize", [(np.float32, 4), (np.float16, 2), (np.int64, 8)])
+def test_encode_decode_round_trip(dtype, itemsize):
+    rng = np.random.default_rng(1)
+    base = (rng.standard_normal(300) * 100).astype(dtype)
+    new = base + np.ones_like(base)
+    raw = new.view(np.uint8)
+    base_raw = base.view(np.uint8)
+
+    np.testing.assert_array_equal(decode_tensor(encode_tensor(raw, itemsize), itemsize), raw)
+    patch = encode_tensor(raw, itemsize, base_raw)
+    np.testing.assert_array_equal(decode_tensor(patch, itemsize, base_raw), raw)
+    # The patch holds the byte planes of the XOR
+    planes = np.frombuffer(zlib.decompress(patch), dtype=np.uint8).reshape(itemsize, -1)
+    np.testing.assert_array_equal(planes.T.reshape(-1), np.bitwise_xor(raw, base_raw))
+
+
+def test_small_changes_give_small_patches():
+    rng = np.random.default_rng(2)
+    base = rng.standard_normal(10000).astype(np.float32)
+    new = base + rng.normal(0.0, 1e-4, base.shape).astype(np.float32)
+    raw = new.view(np.uint8)
+    assert len(encode_tensor(raw, 4, base.view(np.uint8))) < len(encode_tensor(raw, 4))
+
+
+def test_build_weights_manifest(project_dir):
+    manifest = build_weights_manifest(project_dir, 0)
+
+    with open(os.path.join(project_dir, WEIGHTS_MANIFEST)) as f:
+        assert json.load(f) == manifest
+    assert manifest["version"] == 0
+    weights_path = os.path.join(project_dir, "model.weights.h5")
+    assert sorted(manifest["tensors"]) == sorted(TENSORS + ("optimizer/vars/iterations",))
+    with h5py.File(weights_path, "r") as f:
+        for name, entry in manifest["tensors"].items():
+            raw = read_raw(f[name])
+            assert entry["shape"] == list(f[name].shape)
+            assert entry["bytes"] == raw.size
+            assert entry["patches"] == {}
+            with open(os.path.join(project_dir, entry["blob"]), "rb") as blob:
+                np.testing.assert_array_equal(decode_tensor(blob.read(), entry["itemsize"]), raw)
+    assert {name: entry["sha256"] for name, entry in manifest["tensors"].items()} == sha256s(weights_path)
+
+
+def test_manifest_patches_changed_tensors(project_dir):
+    first = build_weights_manifest(project_dir, 0)
+    second = update_global(project_dir, 1)
+
+    for name, entry in second["tensors"].items():
+        old_hash = first["tensors"][name]["sha256"]
+        if name in TENSORS[:2]:
+            assert entry["sha256"] != old_hash
+            assert entry["patches"] == {old_hash: f"patches/{old_hash}-{entry['sha256']}.gz"}
+            assert os.path.exists(os.path.join(project_dir, entry["patches"][old_hash]))
+        else:
+            assert entry["sha256"] == old_hash
+            assert entry["patches"] == {}
+
+
+def test_apply_manifest_patches_a_client_one_version_behind(project_dir, tmp_path):
+    build_weights_manifest(project_dir, 0)
+    local_path = str(tmp_path / "local.weights.h5")
+    shutil.copyfile(os.path.join(project_dir, "model.weights.h5"), local_path)
+    manifest = update_global(project_dir, 1)
+
+    fetched = []
+    stats = apply_manifest(local_path, manifest, fetcher(project_dir, fetched))
+
+    assert stats == {"tensors": 5, "changed": 2, "patched": 2, "fetched_bytes": stats["fetched_bytes"]}
+    patches = [blob for name in TENSORS[:2] for blob in manifest["tensors"][name]["patches"].values()]
+    assert sorted(fetched) == sorted(patches)
+    assert stats["fetched_bytes"] == sum(os.path.getsize(os.path.join(project_dir, blob)) for blob in fetched)
+    assert sha256s(local_path) == sha256s(os.path.join(project_dir, "model.weights.h5"))
+    with h5py.File(local_path, "r") as f:
+        assert f.attrs["keras_version"] == "3.0.0"
+
+
+def test_apply_manifest_fetches_full_blobs_further_behind(project_dir, tmp_path):
+    build_weights_manifest(project_dir, 0)
+    local_path = str(tmp_path / "local.weights.h5")
+    shutil.copyfile(os.path.join(project_dir, "model.weights.h5"), local_path)
+    update_global(project_dir, 1)
+    manifest = update_global(project_dir, 2)
+
+    fetched = []
+    stats = apply_manifest(local_path, manifest, fetcher(project_dir, fetched))
+
+    assert (stats["changed"], stats["patched"]) == (2, 0)
+    assert sorted(fetched) == sorted(manifest["tensors"][name]["blob"] for name in TENSORS[:2])
+    assert sha256s(local_path) == sha256s(os.path.join(project_dir, "model.weights.h5"))
+
+    # An up to date file fetches nothing
+    fetched.clear()
+    assert apply_manifest(local_path, manifest, fetcher(project_dir, fetched))["changed"] == 0
+    assert fetched == []
+
+
+def test_manifest_keeps_only_blobs_of_the_last_two_versions(project_dir):
+    first = build_weights_manifest(project_dir, 0)
+    second = update_global(project_dir, 1)
+    third = update_global(project_dir, 2)
+
+    blobs = {
+        f"{directory}/{name}" for directory in ("tensors", "patches")
+        for name in os.listdir(os.path.join(project_dir, directory)) if name.endswith(".gz")
+    }
+    expected = set()
+    for manifest in (second, third):
+        for entry in manifest["tensors"].values():
+            expected.add(entry["blob"])
+            expected.update(entry["patches"].values())
+    assert blobs == expected
+    assert first["tensors"][TENSORS[0]]["blob"] not in blobs
+
+
+def test_apply_manifest_in_reduced_precision(project_dir, tmp_path):
+    weights_path = os.path.join(project_dir, "model.weights.h5")
+    convert_weight_file(weights_path, weights_path, "bfloat16")
+    build_weights_manifest(project_dir, 0)
+    local_path = str(tmp_path / "local.weights.h5")
+    shutil.copyfile(weights_path, local_path)
+    manifest = update_global(project_dir, 1)
+    assert manifest["tensors"][TENSORS[0]]["itemsize"] == 2
+
+    stats = apply_manifest(local_path, manifest, fetcher(project_dir, []))
+
+    assert stats["patched"] == stats["changed"]
+    assert sha256s(local_path) == sha256s(weights_path)
+
+
+def test_apply_manifest_keeps_the_local_file_on_a_bad_blob(project_dir, tmp_path):
+    build_weights_manifest(project_dir, 0)
+    local_path = str(tmp_path / "local.weights.h5")
+    shutil.copyfile(os.path.join(project_dir, "model.weights.h5"), local_path)
+    before = sha256s(local_path)
+    manifest = update_global(project_dir, 1)
+
+    def corrupt_fetch(blob):
+        rng = np.random.default_rng(3)
+        entry = next(entry for entry in manifest["tensors"].values() if blob in entry["patches"].values())
+        return encode_tensor(rng.integers(0, 256, entry["bytes"], dtype=np.uint8), entry["itemsize"])
+
+    with pytest.raises(ValueError, match="does not match its hash"):
+        apply_manifest(local_path, manifest, corrupt_fetch)
+    assert sha256s(local_path) == before
+    assert sorted(os.listdir(tmp_path)) == ["local.weights.h5", "project"]
+
+
+def test_apply_manifest_rejects_other_tensors(project_dir, tmp_path):
+    manifest = build_weights_manifest(project_dir, 0)
+    local_path = str(tmp_path / "local.weights.h5")
+    shutil.copyfile(os.path.join(project_dir, "model.weights.h5"), local_path)
+    with h5py.File(local_path, "r+") as f:
+        del f["layers/output/vars/1"]
+    before = sha256s(local_path)
+
+    with pytest.raises(ValueError, match="other tensors"):
+        apply_manifest(local_path, manifest, fetcher(project_dir, []))
+    assert sha256s(local_path) == before
+
+    with h5py.File(local_path, "r+") as f:
+        f["layers/output/vars/1"] = np.zeros(5, dtype=np.float32)
+    with pytest.raises(ValueError, match="another shape"):
+        apply_manifest(local_path, manifest, fetcher(project_dir, []))